@@ -0,0 +1,194 @@
+# Copyright 2017 Michael Thomas
+#
+# See www.whatang.org for more information.
+#
+# This file is part of DrumBurp.
+#
+# DrumBurp is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DrumBurp is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DrumBurp.  If not, see <http://www.gnu.org/licenses/>
+'''
+Batch conversion of DrumBurp files without the GUI.
+
+    DrumBurp.py --convert --to txt [--output DIR] [--jobs N] FILE|DIR ...
+'''
+import os
+import sys
+import multiprocessing
+# cStringIO only takes ASCII, and scores are unicode.
+from StringIO import StringIO
+
+from Data import DBConstants
+from Data.ASCIISettings import ASCIISettings
+from Data.ScoreSerializer import ScoreSerializer
+from Notation import AsciiExport
+from Notation.MidiExport import exportMidi
+from Notation.lilypond import LilypondScore
+
+SCORE_EXTENSION = "brp"
+
+
+def _writeAscii(score, handle):
+    text = StringIO()
+    AsciiExport.Exporter(score, ASCIISettings()).export(text)
+    handle.write(text.getvalue().encode('utf-8'))
+
+
+def _writeMidi(score, handle):
+    exportMidi(score.iterMeasuresWithRepeats(), score, handle)
+
+
+def _writeLilypond(score, handle):
+    text = StringIO()
+    LilypondScore(score).write(text)
+    handle.write(text.getvalue().encode('utf-8'))
+
+
+# Output format: (file extension, writer)
+FORMATS = {"txt": ("txt", _writeAscii),
+           "midi": ("mid", _writeMidi),
+           "ly": ("ly", _writeLilypond),
+           "brp": (SCORE_EXTENSION, None)}
+
+
+def iterScoreFiles(paths):
+    """Expand directories in paths to the DrumBurp files beneath them.
+
+    Yields (filename, name relative to the directory it was found in).
+    """
+    for path in paths:
+        if not os.path.isdir(path):
+            yield path, os.path.basename(path)
+            continue
+        for dirPath, dirNames, fileNames in os.walk(path):
+            dirNames.sort()
+            for fileName in sorted(fileNames):
+                if fileName.lower().endswith(os.extsep + SCORE_EXTENSION):
+                    filename = os.path.join(dirPath, fileName)
+                    yield filename, os.path.relpath(filename, path)
+
+
+def outputName(filename, relativeName, outputFormat, outputDir=None):
+    """Where to write the conversion of filename.
+
+    Beside the input by default, otherwise at relativeName under outputDir,
+    so converting a directory tree reproduces its layout.
+    """
+    if outputDir is not None:
+        filename = os.path.join(outputDir, relativeName)
+    stem = os.path.splitext(filename)[0]
+    return os.extsep.join([stem, FORMATS[outputFormat][0]])
+
+
+def convertFile(task):
+    """Convert one file. task is (filename, output filename, outputFormat,
+    fileFormat).
+
+    Returns (filename, output filename, error message or None). Runs in the
+    worker processes, so it never raises.
+    """
+    filename, outName, outputFormat, fileFormat = task
+    try:
+        score = ScoreSerializer.loadScore(filename)
+        score.formatScore(None)
+        outDir = os.path.dirname(outName)
+        if outDir and not os.path.isdir(outDir):
+            try:
+                os.makedirs(outDir)
+            except OSError:
+                # Another worker may have just made it.
+                if not os.path.isdir(outDir):
+                    raise
+        writer = FORMATS[outputFormat][1]
+        if writer is None:
+            # Write beside the target first, so converting in place never
+            # leaves a half written score.
+            tempName = outName + ".tmp"
+            try:
+                ScoreSerializer.saveScore(score, tempName, fileFormat)
+            except:
+                if os.path.exists(tempName):
+                    os.remove(tempName)
+                raise
+            if os.path.exists(outName):
+                os.remove(outName)
+            os.rename(tempName, outName)
+        else:
+            with open(outName, 'wb') as handle:
+                writer(score, handle)
+    except Exception, exc:  # pylint:disable=broad-except
+        message = unicode(exc) or exc.__doc__ or type(exc).__name__
+        return filename, outName, "%s: %s" % (type(exc).__name__, message)
+    return filename, outName, None
+
+
+def convertFiles(paths, outputFormat, outputDir=None,
+                 fileFormat=DBConstants.CURRENT_FILE_FORMAT, jobs=None,
+                 progress=None):
+    """Convert the files and directories in paths, using a pool of jobs
+    worker processes.
+
+    progress, if given, is called with (done, total, result) after each
+    file. Returns the list of results from convertFile, in the order the
+    files finished.
+    """
+    tasks = [(filename,
+              outputName(filename, relativeName, outputFormat, outputDir),
+              outputFormat, fileFormat)
+             for filename, relativeName in iterScoreFiles(paths)]
+    if jobs is None:
+        jobs = multiprocessing.cpu_count()
+    jobs = max(1, min(jobs, len(tasks)))
+    if jobs == 1:
+        pool = None
+        resultIterator = (convertFile(task) for task in tasks)
+    else:
+        pool = multiprocessing.Pool(jobs)
+        resultIterator = pool.imap_unordered(convertFile, tasks,
+                                             chunksize=4)
+    results = []
+    try:
+        for result in resultIterator:
+            results.append(result)
+            if progress is not None:
+                progress(len(results), len(tasks), result)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return results
+
+
+def _printProgress(done, total, result):
+    line = "\r[%d/%d] %s" % (done, total, os.path.basename(result[0]))
+    sys.stderr.write(line[:79].ljust(79))
+    if done == total:
+        sys.stderr.write("\n")
+    sys.stderr.flush()
+
+
+def main(opts, args):
+    if opts.convertTo not in FORMATS:
+        sys.stderr.write("Unknown output format %s: choose from %s\n"
+                         % (opts.convertTo, ", ".join(sorted(FORMATS))))
+        return 2
+    results = convertFiles(args, opts.convertTo, opts.output,
+                           opts.fileFormat, opts.jobs, _printProgress)
+    if not results:
+        sys.stderr.write("No DrumBurp files to convert\n")
+        return 2
+    failures = sorted(result for result in results if result[2] is not None)
+    for filename, unusedOutName, error in failures:
+        sys.stderr.write("FAILED %s: %s\n" % (filename, error))
+    sys.stderr.write("Converted %d of %d files\n"
+                     % (len(results) - len(failures), len(results)))
+    return 1 if failures else 0
@@ -0,0 +1,70 @@
+# Copyright 2017 Michael Thomas
+#
+# See www.whatang.org for more information.
+#
+# This file is part of DrumBurp.
+#
+# DrumBurp is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DrumBurp is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DrumBurp.  If not, see <http://www.gnu.org/licenses/>
+'''
+Timing of the phases of DrumBurp startup, for DrumBurp.py --startup-profile.
+'''
+import sys
+import timeit
+
+
+class StartupProfile(object):
+    """Record how long each phase of startup takes, and how many modules
+    it imported.
+
+    Phases marked as waiting, such as a dialog the user has to dismiss, are
+    reported but left out of the total.
+    """
+
+    def __init__(self, startTime=None, clock=timeit.default_timer,
+                 modules=None):
+        self._clock = clock
+        self._modules = sys.modules if modules is None else modules
+        self._phases = []
+        self._last = clock() if startTime is None else startTime
+        self._lastModules = len(self._modules)
+
+    def mark(self, name, waiting=False):
+        """End the phase that began at the previous mark, calling it name."""
+        now = self._clock()
+        numModules = len(self._modules)
+        self._phases.append((name, now - self._last,
+                             numModules - self._lastModules, waiting))
+        self._last = now
+        self._lastModules = numModules
+
+    def iterPhases(self):
+        return iter(self._phases)
+
+    def total(self):
+        return sum(phase[1] for phase in self._phases if not phase[3])
+
+    def report(self, handle=None):
+        if handle is None:
+            handle = sys.stderr
+        width = max([len("Total")] + [len(phase[0])
+                                      for phase in self._phases])
+        handle.write("Startup profile:\n")
+        for name, seconds, numModules, waiting in self._phases:
+            handle.write("  %-*s %8.3fs %5d modules%s\n"
+                         % (width, name, seconds, numModules,
+                            " (waiting, not in total)" if waiting else ""))
+        handle.write("  %-*s %8.3fs %5d modules\n"
+                     % (width, "Total", self.total(),
+                        sum(phase[2] for phase in self._phases)))
+        handle.flush()
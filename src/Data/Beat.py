@@ -34,6 +34,7 @@ class Beat(object):
     reflect partial beats at the end of a Measure. A sequence of Beats makes
     up a MeasureCount.
     '''
+    __slots__ = ('counter', '_numTicks', '_beatLength')
 
     def __init__(self, counter, numTicks=None):
         self.counter = counter
@@ -53,6 +53,7 @@ DB_FILE_FORMAT_STR = "DB_FILE_FORMAT"
 DBFF_0 = 0
 DBFF_1 = 1
 DBFF_2 = 2
+DBFF_3 = 3
 CURRENT_FILE_FORMAT = DBFF_2
 
 # Kit file format numbers
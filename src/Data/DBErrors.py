@@ -96,10 +96,22 @@ class TooManyBarLines(DbReadError):
     "There are too many bar lines specifed for this measure."
 
 
+class BadNote(DbReadError):
+    "The note specification is not valid."
+
+
 class BadCount(DbReadError):
     "The given count is not recognised."
 
 
+class NotBinaryScore(DbReadError):
+    "This is not a binary DrumBurp score."
+
+
+class TruncatedBinaryScore(DbReadError):
+    "The binary score data is incomplete or corrupt."
+
+
 class DBVersionError(DbReadError):
     "This file is a newer format which cannot be read by this version of DrumBurp. Check www.whatang.org for a newer DrumBurp release."
 
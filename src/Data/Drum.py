@@ -29,6 +29,10 @@ import Data.DefaultKits as DefaultKits
 
 
 class HeadData(object):
+    __slots__ = ('midiNote', 'midiVolume', 'effect', 'notationHead',
+                 'notationLine', 'notationEffect', 'stemDirection',
+                 'shortcut')
+
     def __init__(self,  # IGNORE:too-many-arguments
                  midiNote=DefaultKits.DEFAULT_NOTE,
                  midiVolume=DefaultKits.DEFAULT_VOLUME,
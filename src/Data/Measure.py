@@ -23,17 +23,20 @@ Created on 12 Dec 2010
 
 '''
 
+from array import array
 from collections import defaultdict
+from itertools import izip
 from Data.DBConstants import EMPTY_NOTE, BAR_TYPES, NORMAL_BAR, REPEAT_END_STR, REPEAT_START, LINE_BREAK, SECTION_END
 from Data.DBErrors import BadTimeError
 from Data.NotePosition import NotePosition
 from Data import MeasureCount
 from Data import Counter
 import copy
+import hashlib
 
 
 class _NoteDictionary(object):
-    def __init__(self):
+    def __init__(self, unused_width=0):
         self._notes = defaultdict(defaultdict)
         self._notesOnLine = defaultdict(int)
         self._noteTimes = []
@@ -61,6 +64,11 @@ class _NoteDictionary(object):
                                     drumIndex=drumIndex),
                        drumHead)
 
+    def iterNotesRaw(self):
+        for noteTime in self.iterTimes():
+            for drumIndex, head in self._notes[noteTime].iteritems():
+                yield noteTime, drumIndex, head
+
     def __contains__(self, noteTime):
         return noteTime in self._notes
 
@@ -106,6 +114,224 @@ class _NoteDictionary(object):
         self._noteTimes = []
         self._notesOnLine.clear()
 
+    def fill(self, times, drums, headIndexes, codes):
+        self.clear()
+        for noteTime, drumIndex, headIndex in izip(times, drums, headIndexes):
+            self.setNote(noteTime, drumIndex, _HEADS[codes[headIndex]])
+
+    def setWidth(self, newWidth):
+        badTimes = [noteTime for noteTime in self._noteTimes
+                    if noteTime >= newWidth]
+        for badTime in badTimes:
+            self.deleteAllNotesAtTime(badTime)
+
+    def copy(self):
+        return copy.deepcopy(self)
+
+
+# Note heads are stored in a _NoteGrid as small integer codes. Code 0 is
+# reserved for 'no note'; the table is shared by every grid.
+_HEADS = [EMPTY_NOTE]
+_HEAD_CODES = {}
+
+
+def _headCode(head):
+    code = _HEAD_CODES.get(head)
+    if code is None:
+        code = len(_HEADS)
+        if code > 255:
+            raise ValueError("Too many distinct note heads")
+        _HEADS.append(head)
+        _HEAD_CODES[head] = code
+    return code
+
+
+class _NoteGrid(object):
+    """Dense note storage with one byte array of head codes per drum.
+
+    Set, delete and lookup are constant time, and copying a grid is a
+    handful of array copies rather than a deep copy of nested dicts.
+    """
+
+    def __init__(self, width=0):
+        self._width = width
+        self._lines = []
+        self._notesOnLine = []
+        self._notesAtTime = array('H', [0]) * width
+        self._numTimes = 0
+
+    def __len__(self):
+        return self._numTimes
+
+    def numNotes(self):
+        return sum(self._notesOnLine)
+
+    def iterTimes(self):
+        return (noteTime for noteTime, count in enumerate(self._notesAtTime)
+                if count)
+
+    def iterNotesAtTime(self, noteTime):
+        if not self._hasTime(noteTime):
+            return
+        for drumIndex, line in enumerate(self._lines):
+            code = line[noteTime]
+            if code:
+                yield (NotePosition(noteTime=noteTime,
+                                    drumIndex=drumIndex),
+                       _HEADS[code])
+
+    def iterNotesAndHeads(self):
+        for noteTime in self.iterTimes():
+            for note in self.iterNotesAtTime(noteTime):
+                yield note
+
+    def iterNotesRaw(self):
+        heads = _HEADS
+        lines = list(enumerate(self._lines))
+        for noteTime in self.iterTimes():
+            for drumIndex, line in lines:
+                code = line[noteTime]
+                if code:
+                    yield noteTime, drumIndex, heads[code]
+
+    def _hasTime(self, noteTime):
+        return (0 <= noteTime < self._width and
+                self._notesAtTime[noteTime] > 0)
+
+    def __contains__(self, noteTime):
+        return self._hasTime(noteTime)
+
+    def _addLines(self, drumIndex):
+        while len(self._lines) <= drumIndex:
+            self._lines.append(array('B', [0]) * self._width)
+            self._notesOnLine.append(0)
+
+    def setNote(self, noteTime, drumIndex, head):
+        if drumIndex < 0:
+            # A negative index would silently write to another drum's line.
+            raise BadTimeError()
+        self._addLines(drumIndex)
+        code = _headCode(head)
+        line = self._lines[drumIndex]
+        oldCode = line[noteTime]
+        if oldCode == code:
+            return False
+        if not oldCode:
+            self._notesOnLine[drumIndex] += 1
+            if not self._notesAtTime[noteTime]:
+                self._numTimes += 1
+            self._notesAtTime[noteTime] += 1
+        line[noteTime] = code
+        return True
+
+    def delNote(self, noteTime, drumIndex):
+        if (not self._hasTime(noteTime)
+                or not 0 <= drumIndex < len(self._lines)
+                or not self._lines[drumIndex][noteTime]):
+            return False
+        self._lines[drumIndex][noteTime] = 0
+        self._notesOnLine[drumIndex] -= 1
+        self._notesAtTime[noteTime] -= 1
+        if not self._notesAtTime[noteTime]:
+            self._numTimes -= 1
+        return True
+
+    def deleteAllNotesAtTime(self, noteTime):
+        if not self._hasTime(noteTime):
+            return
+        for drumIndex, line in enumerate(self._lines):
+            if line[noteTime]:
+                line[noteTime] = 0
+                self._notesOnLine[drumIndex] -= 1
+        self._notesAtTime[noteTime] = 0
+        self._numTimes -= 1
+
+    def getNote(self, noteTime, drumIndex):
+        if (not 0 <= drumIndex < len(self._lines)
+                or not self._hasTime(noteTime)):
+            return EMPTY_NOTE
+        return _HEADS[self._lines[drumIndex][noteTime]]
+
+    def notesOnLine(self, index):
+        if index >= len(self._notesOnLine):
+            return 0
+        return self._notesOnLine[index]
+
+    def clear(self):
+        self._lines = []
+        self._notesOnLine = []
+        self._notesAtTime = array('H', [0]) * self._width
+        self._numTimes = 0
+
+    def setWidth(self, newWidth):
+        if newWidth == self._width:
+            return
+        if newWidth < self._width:
+            for noteTime in xrange(newWidth, self._width):
+                self.deleteAllNotesAtTime(noteTime)
+            self._lines = [line[:newWidth] for line in self._lines]
+            self._notesAtTime = self._notesAtTime[:newWidth]
+        else:
+            extra = newWidth - self._width
+            for line in self._lines:
+                line.extend(array('B', [0]) * extra)
+            self._notesAtTime.extend(array('H', [0]) * extra)
+        self._width = newWidth
+
+    def fill(self, times, drums, headIndexes, codes):
+        """Replace all the notes with those given by parallel sequences of
+        note times, drum indexes and indexes into codes, a list of head
+        codes.
+
+        Much quicker than setting the notes one at a time. Raises
+        IndexError if a note lies outside the grid.
+        """
+        self.clear()
+        if not len(times):
+            return
+        width = self._width
+        lines = [array('B', [0]) * width for unused in xrange(max(drums) + 1)]
+        for noteTime, drumIndex, headIndex in izip(times, drums, headIndexes):
+            lines[drumIndex][noteTime] = codes[headIndex]
+        self._lines = lines
+        self._notesOnLine = [width - line.count(0) for line in lines]
+        self._notesAtTime = array('H', [len(lines) - column.count(0)
+                                        for column in izip(*lines)])
+        self._numTimes = width - self._notesAtTime.count(0)
+
+    def copy(self):
+        other = _NoteGrid.__new__(_NoteGrid)
+        other._width = self._width
+        other._lines = [line[:] for line in self._lines]
+        other._notesOnLine = self._notesOnLine[:]
+        other._notesAtTime = self._notesAtTime[:]
+        other._numTimes = self._numTimes
+        return other
+
+
+def _digestedAttribute(varname):
+    attrName = "_" + varname
+
+    def _getData(self):
+        return getattr(self, attrName)
+
+    def _setData(self, value):
+        setattr(self, attrName, value)
+        self._changed()
+    return property(fget=_getData, fset=_setData)
+
+
+def _tempoAttribute(varname):
+    attrName = "_" + varname
+
+    def _getData(self):
+        return getattr(self, attrName)
+
+    def _setData(self, value):
+        setattr(self, attrName, value)
+        self._changed(tempo=True)
+    return property(fget=_getData, fset=_setData)
+
 
 class MeasureInfo(object):
     def __init__(self):
@@ -117,20 +343,31 @@ class MeasureInfo(object):
 
 
 class Measure(object):
+    _noteStorage = _NoteGrid
+
     def __init__(self, width=0):
+        self._digest = None
         self._width = width
-        self._notes = _NoteDictionary()
+        self._notes = self._noteStorage(width)
         self._callBack = None
+        self._changeCallBack = None
         self._info = MeasureInfo()
         self._counter = None
-        self.alternateText = None
-        self.simileDistance = 0
-        self.simileIndex = 0
+        self._alternateText = None
+        self._simileDistance = 0
+        self._simileIndex = 0
         self._above = " " * width
         self._below = " " * width
-        self.showAbove = False
-        self.showBelow = False
-        self.newBpm = 0
+        self._showAbove = False
+        self._showBelow = False
+        self._newBpm = 0
+
+    alternateText = _digestedAttribute("alternateText")
+    simileDistance = _tempoAttribute("simileDistance")
+    simileIndex = _digestedAttribute("simileIndex")
+    showAbove = _digestedAttribute("showAbove")
+    showBelow = _digestedAttribute("showBelow")
+    newBpm = _tempoAttribute("newBpm")
 
     @property
     def counter(self):
@@ -159,21 +396,44 @@ class Measure(object):
     def __iter__(self):
         return self._notes.iterNotesAndHeads()
 
+    def iterNotesRaw(self):
+        """Iterate over (noteTime, drumIndex, head) for every note, in time
+        order.
+
+        Cheaper than iterating over the Measure itself, which makes a new
+        NotePosition for each note.
+        """
+        return self._notes.iterNotesRaw()
+
     def numNotes(self):
         return self._notes.numNotes()
 
     def numBeats(self):
         return self.counter.numBeats()
 
+    def _changed(self, tempo=False):
+        self._digest = None
+        if self._changeCallBack is not None:
+            self._changeCallBack(self, tempo)
+
     def _runCallBack(self, position):
+        self._changed()
         if self._callBack is not None:
             self._callBack(position)
 
-    def setCallBack(self, callBack):
+    def setCallBack(self, callBack, changeCallBack=None):
+        """callBack is run with a NotePosition when the Measure's notes or
+        repeat count change. changeCallBack, if given, is run whenever
+        anything about the Measure changes, including bar lines and text
+        which do not run callBack. It is given the Measure and a flag which
+        is True if the change can alter the tempo, i.e. newBpm or
+        simileDistance was set."""
         self._callBack = callBack
+        self._changeCallBack = changeCallBack
 
     def clearCallBack(self):
         self._callBack = None
+        self._changeCallBack = None
 
     def isEmpty(self):
         return (len(self._notes) == 0
@@ -210,12 +470,15 @@ class Measure(object):
 
     def setSectionEnd(self, boolean):
         self._info.isSectionEnd = boolean
+        self._changed()
 
     def setRepeatStart(self, boolean):
         self._info.isRepeatStart = boolean
+        self._changed()
 
     def setRepeatEnd(self, boolean):
         self._info.isRepeatEnd = boolean
+        self._changed()
         if boolean:
             self.repeatCount = max(self.repeatCount, 2)
         else:
@@ -223,6 +486,7 @@ class Measure(object):
 
     def setLineBreak(self, boolean):
         self._info.isLineBreak = boolean
+        self._changed()
 
     def isSectionEnd(self):
         return self._info.isSectionEnd
@@ -279,6 +543,39 @@ class Measure(object):
         else:
             self.addNote(position, head)
 
+    def setNotes(self, notes):
+        """Add many notes at once, given as (noteTime, drumIndex, head).
+
+        The callback is run once at the end rather than once per note.
+        """
+        changed = False
+        for noteTime, drumIndex, head in notes:
+            self._checkValidNoteTime(noteTime)
+            if drumIndex < 0:
+                raise BadTimeError()
+            changed |= self._notes.setNote(noteTime, drumIndex, head)
+        if changed:
+            self._runCallBack(NotePosition())
+
+    @staticmethod
+    def headCodes(heads):
+        """Return the codes for a list of heads, for setNoteArrays."""
+        return [_headCode(head) for head in heads]
+
+    def setNoteArrays(self, times, drums, headIndexes, codes):
+        """Replace the notes with those given by parallel sequences of note
+        times, drum indexes and indexes into codes, from headCodes.
+
+        This is the quick way to load many notes; a binary score stores
+        its notes like this.
+        """
+        try:
+            self._notes.fill(times, drums, headIndexes, codes)
+        except IndexError:
+            self._notes.clear()
+            raise BadTimeError()
+        self._runCallBack(NotePosition())
+
     def _setWidth(self, newWidth):
         assert newWidth > 0
         if newWidth == len(self):
@@ -290,22 +587,22 @@ class Measure(object):
             self._above = self._above[:newWidth]
             self._below = self._below[:newWidth]
         self._width = newWidth
-        badTimes = [noteTime for noteTime in self._notes.iterTimes()
-                    if noteTime >= self._width]
-        for badTime in badTimes:
-            self._notes.deleteAllNotesAtTime(badTime)
+        self._notes.setWidth(newWidth)
         self._runCallBack(NotePosition())
 
     def setBeatCount(self, counter):  # TODO: change this to setMeasureCount
-        if counter == self._counter:
+        if counter is not None:
+            counter = counter.interned()
+        if counter is self._counter:
             return
         oldAbove = self._above
         oldBelow = self._below
         if self._counter is None:
             self._counter = counter
+            self._changed()
             self._setWidth(len(counter))
             return
-        oldNotes = copy.deepcopy(self._notes)
+        oldNotes = self._notes.copy()
         oldTimes = list(self._counter.iterTime())
         self._setWidth(len(counter))
         self.clear()
@@ -339,8 +636,37 @@ class Measure(object):
         self._counter = counter
         self._runCallBack(NotePosition())
 
+    def digest(self):
+        """Return a digest of the content of this Measure.
+
+        The digest covers the notes, count, bar lines, decorations and
+        sticking. It is cached until the Measure next changes.
+        """
+        if self._digest is None:
+            if self.counter is None:
+                count = None
+            else:
+                count = [(str(beat.counter), beat.numTicks)
+                         for beat in self.counter.beats]
+            notes = sorted((noteTime, drumIndex, unicode(head))
+                           for noteTime, drumIndex, head
+                           in self.iterNotesRaw())
+            alternate = self.alternateText
+            if alternate is not None:
+                alternate = unicode(alternate)
+            state = (len(self), notes, count,
+                     self.startBar, self.endBar, self.repeatCount,
+                     alternate, self.simileDistance,
+                     self.simileIndex, self.newBpm,
+                     self.showAbove, unicode(self._above),
+                     self.showBelow, unicode(self._below))
+            self._digest = hashlib.md5(repr(state)).digest()
+        return self._digest
+
     def copyMeasure(self):
-        copyMeasure = copy.deepcopy(self)
+        copyMeasure = copy.copy(self)
+        copyMeasure._notes = self._notes.copy()
+        copyMeasure._info = copy.copy(self._info)
         copyMeasure.clearCallBack()
         return copyMeasure
 
@@ -356,8 +682,8 @@ class Measure(object):
         if other.counter is None:
             self._setWidth(len(other))
         self.setBeatCount(other.counter)
-        for pos, head in other:
-            self.addNote(pos, head)
+        self._notes = other._notes.copy()
+        self._runCallBack(NotePosition())
         if copyMeasureDecorations:
             self.setRepeatStart(other.isRepeatStart())
             self.setRepeatEnd(other.isRepeatEnd())
@@ -375,9 +701,10 @@ class Measure(object):
 
     def changeKit(self, newKit, changes):
         transposed = defaultdict(lambda: defaultdict(dict))
-        for note, head in self._notes.iterNotesAndHeads():
-            transposed[note.drumIndex][note.noteTime] = head
+        for noteTime, drumIndex, head in self._notes.iterNotesRaw():
+            transposed[drumIndex][noteTime] = head
         self._notes.clear()
+        self._changed()
         for newDrumIndex, newDrum in enumerate(newKit):
             oldDrumIndex = changes[newDrumIndex]
             if oldDrumIndex == -1:
@@ -444,6 +771,7 @@ class Measure(object):
         elif len(value) < len(self):
             value += " " * (len(self) - len(value))
         self._above = value
+        self._changed()
 
     @property
     def belowText(self):
@@ -456,6 +784,7 @@ class Measure(object):
         elif len(value) < len(self):
             value += " " * (len(self) - len(value))
         self._below = value
+        self._changed()
 
     def stickingVisible(self, above):
         if above:
@@ -27,10 +27,80 @@ from Data.Beat import Beat
 from Data.Counter import CounterRegistry
 from Data import DBConstants
 
+# MIDI tick tables shared by every MeasureCount, keyed by
+# (count signature, swing)
+_TICK_TABLES = {}
+# The shared, immutable MeasureCount for each count signature
+_INTERNED = {}
+
 
 class MeasureCount(object):
     def __init__(self):
-        self.beats = []
+        self._beats = []
+        self._signature = None
+        self._beatTicks = None
+        self._beatStarts = None
+        self._isInterned = False
+
+    @property
+    def beats(self):
+        return self._beats
+
+    @beats.setter
+    def beats(self, beats):
+        self._checkMutable()
+        self._beats = beats
+        self._beatsChanged()
+
+    def _checkMutable(self):
+        if self._isInterned:
+            raise TypeError("Cannot change an interned MeasureCount")
+
+    def isInterned(self):
+        return self._isInterned
+
+    def interned(self):
+        """Return the shared MeasureCount which counts the same as this one.
+
+        The first count seen with a given signature becomes the shared one,
+        and can no longer be changed. Interned counts are equal only if they
+        are the same object.
+        """
+        if self._isInterned:
+            return self
+        signature = self.signature()
+        count = _INTERNED.get(signature)
+        if count is None:
+            self._beats = tuple(self._beats)
+            self._isInterned = True
+            _INTERNED[signature] = self
+            count = self
+        return count
+
+    def __copy__(self):
+        if self._isInterned:
+            return self
+        count = MeasureCount()
+        count._beats = list(self._beats)
+        return count
+
+    def __deepcopy__(self, memo):
+        return self.__copy__()
+
+    def _beatsChanged(self):
+        self._signature = None
+        self._beatTicks = None
+        self._beatStarts = None
+
+    def signature(self):
+        """Return a hashable description of the beats in this count.
+
+        Two MeasureCounts with the same signature count identically.
+        """
+        if self._signature is None:
+            self._signature = tuple((str(beat.counter), beat.numTicks)
+                                    for beat in self._beats)
+        return self._signature
 
     def _iterTimeCounter(self, valuePerBeat, swing):
         total = 0
@@ -62,13 +132,36 @@ class MeasureCount(object):
                         isLong = not isLong
         yield total
 
-    def iterTimesMs(self, msPerBeat, swing):
-        for value in self._iterTimeCounter(msPerBeat, swing):
-            yield value
+    def timeTable(self, valuePerBeat, swing):
+        """Return the time of each tick, plus the end time of the measure.
+
+        Times are measured in units where a beat is valuePerBeat long. They
+        are scaled from the MIDI tick table, so they are only as precise as
+        a MIDI tick.
+        """
+        ticks = float(DBConstants.MIDITICKSPERBEAT)
+        return tuple(tick * valuePerBeat / ticks
+                     for tick in self.midiTickTable(swing))
+
+    def midiTickTable(self, swing=0):
+        """Return the MIDI tick of each tick, plus the end of the measure.
 
-    def iterMidiTicks(self, swing):
-        for value in self._iterTimeCounter(DBConstants.MIDITICKSPERBEAT, swing):
-            yield value
+        The table is a tuple, computed once and shared by every
+        MeasureCount with the same signature.
+        """
+        key = (self.signature(), swing)
+        table = _TICK_TABLES.get(key)
+        if table is None:
+            table = tuple(self._iterTimeCounter(DBConstants.MIDITICKSPERBEAT,
+                                                swing))
+            _TICK_TABLES[key] = table
+        return table
+
+    def iterTimesMs(self, msPerBeat, swing=0):
+        return iter(self.timeTable(msPerBeat, swing))
+
+    def iterMidiTicks(self, swing=0):
+        return iter(self.midiTickTable(swing))
 
     def timeSig(self):
         lastBeat = self.beats[-1]
@@ -89,12 +182,24 @@ class MeasureCount(object):
             for tick in beat.iterTicks():
                 yield(beatNum, beat, tick)
 
+    def beatTickTable(self):
+        """Return a cached tuple of the items of iterBeatTicks."""
+        if self._beatTicks is None:
+            self._beatTicks = tuple(self.iterBeatTicks())
+        return self._beatTicks
+
     def iterBeatTickPositions(self):
         tick = 0
         for beat in self.beats:
             yield tick
             tick += beat.numTicks
 
+    def beatStartTable(self):
+        """Return a cached tuple of the items of iterBeatTickPositions."""
+        if self._beatStarts is None:
+            self._beatStarts = tuple(self.iterBeatTickPositions())
+        return self._beatStarts
+
     def count(self):
         for beatNum, beat in enumerate(self.beats):
             for count in beat.count(beatNum + 1):
@@ -123,7 +228,9 @@ class MeasureCount(object):
         self.addBeats(beat, numBeats)
 
     def addBeats(self, beat, numBeats):
-        self.beats.extend([beat] * numBeats)
+        self._checkMutable()
+        self._beats.extend([beat] * numBeats)
+        self._beatsChanged()
 
 #     def beatIndexContainingTickIndex(self, tickIndex):
 #         totalTicks = 0
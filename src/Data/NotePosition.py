@@ -23,10 +23,13 @@ Created on 14 Dec 2010
 '''
 
 from Data.DBErrors import BadNoteSpecification
-import copy
 
 
 class NotePosition(object):
+    # One of these is made for every note a Measure hands out, so keep
+    # them small.
+    __slots__ = ('staffIndex', 'measureIndex', 'noteTime', 'drumIndex')
+
     def __init__(self, staffIndex=None, measureIndex=None,
                  noteTime=None, drumIndex=None):
         if [noteTime, drumIndex].count(None) == 1:
@@ -48,7 +51,14 @@ class NotePosition(object):
                                                  str(self.drumIndex))
 
     def makeCopy(self):
-        return copy.copy(self)
+        # Skip __init__: a position being edited in place may be
+        # half-specified.
+        np = NotePosition.__new__(NotePosition)
+        np.staffIndex = self.staffIndex
+        np.measureIndex = self.measureIndex
+        np.noteTime = self.noteTime
+        np.drumIndex = self.drumIndex
+        return np
 
     def makeMeasurePosition(self):
         np = self.makeCopy()
@@ -33,12 +33,140 @@ from Data.NotePosition import NotePosition
 from Data.ScoreMetaData import ScoreMetaData
 from Data.FontOptions import FontOptions
 from Data import DBErrors
-import Data.ASCIISettings as ASCIISettings
 
-from Notation import AsciiExport
 import bisect
 import hashlib
-from StringIO import StringIO
+import random
+
+
+_HASH_MODULUS = (1 << 61) - 1
+_HASH_BASE = 0x5bd1e9955bd1e995 % _HASH_MODULUS
+
+
+class _DigestNode(object):
+    __slots__ = ("measure", "priority", "value", "left", "right", "parent",
+                 "size", "hash", "power")
+
+    def __init__(self, measure):
+        self.measure = measure
+        self.priority = random.random()
+        self.value = 0
+        self.left = None
+        self.right = None
+        self.parent = None
+        self.size = 1
+        self.hash = 0
+        self.power = 1
+
+
+class _DigestTree(object):
+    """A polynomial hash over the Measure digests of a Score.
+
+    The digests d0, d1, ... are combined as the sum of d[i] * B ** i, which
+    depends only on the sequence of digests and not on the shape of the
+    tree, so undoing an edit gives back the same value. The Measures are held in a treap ordered by position, each node
+    keeping the hash of its subtree. Editing, inserting or deleting a
+    Measure rehashes one path, so costs O(log n) digest operations.
+    """
+
+    def __init__(self):
+        self._root = None
+        self._nodes = {}
+        self._dirty = set()
+
+    def __len__(self):
+        return len(self._nodes)
+
+    @staticmethod
+    def _pull(node):
+        left, right = node.left, node.right
+        size, value, power = 0, 0, 1
+        if left is not None:
+            left.parent = node
+            size, value, power = left.size, left.hash, left.power
+        value = (value + node.value * power) % _HASH_MODULUS
+        power = power * _HASH_BASE % _HASH_MODULUS
+        size += 1
+        if right is not None:
+            right.parent = node
+            value = (value + right.hash * power) % _HASH_MODULUS
+            power = power * right.power % _HASH_MODULUS
+            size += right.size
+        node.size, node.hash, node.power = size, value, power
+
+    def _merge(self, left, right):
+        if left is None:
+            return right
+        if right is None:
+            return left
+        if left.priority > right.priority:
+            left.right = self._merge(left.right, right)
+            self._pull(left)
+            return left
+        right.left = self._merge(left, right.left)
+        self._pull(right)
+        return right
+
+    def _split(self, node, count):
+        """Split node into the first count Measures and the rest."""
+        if node is None:
+            return None, None
+        leftSize = node.left.size if node.left is not None else 0
+        if count <= leftSize:
+            left, node.left = self._split(node.left, count)
+            self._pull(node)
+            if left is not None:
+                left.parent = None
+            return left, node
+        node.right, right = self._split(node.right, count - leftSize - 1)
+        self._pull(node)
+        if right is not None:
+            right.parent = None
+        return node, right
+
+    def _setRoot(self, root):
+        self._root = root
+        if root is not None:
+            root.parent = None
+
+    def build(self, measures):
+        self._root = None
+        self._nodes = {}
+        self._dirty = set()
+        for index, measure in enumerate(measures):
+            self.insert(index, measure)
+
+    def insert(self, index, measure):
+        node = _DigestNode(measure)
+        self._nodes[id(measure)] = node
+        self._dirty.add(node)
+        left, right = self._split(self._root, index)
+        self._setRoot(self._merge(self._merge(left, node), right))
+
+    def delete(self, index):
+        left, right = self._split(self._root, index)
+        node, right = self._split(right, 1)
+        if node is not None:
+            del self._nodes[id(node.measure)]
+            self._dirty.discard(node)
+        self._setRoot(self._merge(left, right))
+
+    def changed(self, measure):
+        node = self._nodes.get(id(measure))
+        if node is not None and node.measure is measure:
+            self._dirty.add(node)
+
+    def root(self):
+        for node in self._dirty:
+            node.value = int(node.measure.digest()[:8].encode("hex"),
+                             16) % _HASH_MODULUS
+            while node is not None:
+                self._pull(node)
+                node = node.parent
+        self._dirty = set()
+        if self._root is None:
+            return 0
+        return self._root.hash
 
 
 class Score(object):
@@ -52,7 +180,7 @@ class Score(object):
         self._formatState = None
         self.paperSize = "Letter"
         counter = CounterRegistry().getCounterByIndex(0)
-        self.defaultCount = makeSimpleCount(counter, 4)
+        self.defaultCount = makeSimpleCount(counter, 4).interned()
         self.systemSpacing = 25
         self.fontOptions = FontOptions()
         self.lilysize = 20
@@ -60,6 +188,14 @@ class Score(object):
         self.lilyFill = True
         self.lilyFormat = 0
         self.fileFormat = None
+        self._digestTree = None
+        self._staffStarts = None
+        self._layoutDigest = None
+        self._tempoMap = None
+        self._tempoKey = None
+        self._layout = None
+        self._formatRange = (0, 0, 0)
+        self._changedStaffs = set()
 
     def __len__(self):
         return sum(len(staff) for staff in self._staffs)
@@ -84,7 +220,14 @@ class Score(object):
         def wrappedCallBack(position):
             position.staffIndex = staffIndex
             self._runCallBack(position)
-        staff.setCallBack(wrappedCallBack)
+
+        def changeCallBack(measure, tempo):
+            self._changedStaffs.add(staff)
+            if self._digestTree is not None:
+                self._digestTree.changed(measure)
+            if tempo:
+                self._tempoMap = None
+        staff.setCallBack(wrappedCallBack, changeCallBack)
 
     def _checkStaffIndex(self, index):
         if not (0 <= index < self.numStaffs()):
@@ -261,6 +404,7 @@ class Score(object):
 
     def _addStaff(self):
         newStaff = Staff()
+        self._layoutChanged()
         self._staffs.append(newStaff)
         self._setStaffCallBack(newStaff, self.numStaffs() - 1)
 
@@ -278,46 +422,81 @@ class Score(object):
                 position = NotePosition(staffIndex=index - 1,
                                         measureIndex=prevStaff.numMeasures() - 1)
                 prevStaff.setSectionEnd(position, True)
+        if self._digestTree is not None:
+            first = self._getStaffStarts()[index]
+            for dummy in xrange(staff.numMeasures()):
+                self._digestTree.delete(first)
         self._staffs.pop(index)
+        self._layoutChanged()
         for offset, nextStaff in enumerate(self._staffs[index:]):
             self._setStaffCallBack(nextStaff, index + offset)
 
+    def _measureInserted(self, index, measure):
+        if self._digestTree is not None:
+            self._digestTree.insert(index, measure)
+
+    def _measureDeleted(self, index):
+        if self._digestTree is not None:
+            self._digestTree.delete(index)
+
+    def _layoutChanged(self):
+        self._staffStarts = None
+        self._tempoMap = None
+
+    def _getStaffStarts(self):
+        """Return the absolute index of the first measure on each staff.
+
+        The list has one extra entry at the end holding the total number
+        of measures. It is rebuilt only after the layout changes.
+        """
+        if (self._staffStarts is None
+                or len(self._staffStarts) != self.numStaffs() + 1):
+            starts = [0]
+            for staff in self.iterStaffs():
+                starts.append(starts[-1] + staff.numMeasures())
+            self._staffStarts = starts
+            self._layoutDigest = None
+        return self._staffStarts
+
+    def _getLayoutDigest(self):
+        starts = self._getStaffStarts()
+        if self._layoutDigest is None:
+            self._layoutDigest = hashlib.md5(repr(starts)).digest()
+        return self._layoutDigest
+
     def numMeasures(self):
-        return sum(staff.numMeasures() for staff in self.iterStaffs())
+        return self._getStaffStarts()[-1]
+
+    def _staffIndexContainingMeasure(self, index):
+        starts = self._getStaffStarts()
+        return max(bisect.bisect_right(starts, index) - 1, 0)
 
     def _staffContainingMeasure(self, index):
-        measuresSoFar = 0
-        for staff in self.iterStaffs():
-            if measuresSoFar <= index < measuresSoFar + staff.numMeasures():
-                return staff, index - measuresSoFar
-            measuresSoFar += staff.numMeasures()
-        raise BadTimeError()
+        if not (0 <= index < self.numMeasures()):
+            raise BadTimeError()
+        staffIndex = self._staffIndexContainingMeasure(index)
+        return (self.getStaffByIndex(staffIndex),
+                index - self._getStaffStarts()[staffIndex])
 
     def measurePositionToIndex(self, position):
         self._checkStaffIndex(position.staffIndex)
-        index = 0
-        for staffIndex in xrange(0, position.staffIndex):
-            index += self.getStaffByIndex(staffIndex).numMeasures()
-        index += position.measureIndex
-        return index
+        return (self._getStaffStarts()[position.staffIndex]
+                + position.measureIndex)
 
     def measureIndexToPosition(self, index):
-        staffIndex = 0
-        staff = self.getStaffByIndex(0)
-        while index >= staff.numMeasures():
-            index -= staff.numMeasures()
-            staffIndex += 1
-            if staffIndex == self.numStaffs():
-                break
-            staff = self.getStaffByIndex(staffIndex)
-        if staffIndex == self.numStaffs():
+        if self.numStaffs() == 0:
             raise BadTimeError(index)
+        if index >= self.numMeasures():
+            raise BadTimeError(index - self.numMeasures())
+        staffIndex = self._staffIndexContainingMeasure(index)
         return NotePosition(staffIndex=staffIndex,
-                            measureIndex=index)
+                            measureIndex=index -
+                            self._getStaffStarts()[staffIndex])
 
     def insertMeasureByIndex(self, width, index=None, counter=None, measure=None):
         if index is None:
             index = self.numMeasures()
+        measureIndex = index
         if self.numStaffs() == 0:
             self._addStaff()
             staff = self.getStaffByIndex(0)
@@ -333,8 +512,27 @@ class Score(object):
             newMeasure = measure
         staff.insertMeasure(NotePosition(measureIndex=index),
                             newMeasure)
+        self._measureInserted(measureIndex, newMeasure)
+        self._layoutChanged()
         return newMeasure
 
+    def appendMeasures(self, measures):
+        """Add measures to the end of the last staff.
+
+        Equivalent to inserting each measure at the end in turn, but the
+        layout bookkeeping is done once. Call formatScore afterwards to
+        lay the measures out.
+        """
+        if self.numStaffs() == 0:
+            self._addStaff()
+        staff = self.getStaffByIndex(-1)
+        index = self.numMeasures()
+        for measure in measures:
+            staff.addMeasure(measure)
+            self._measureInserted(index, measure)
+            index += 1
+        self._layoutChanged()
+
     def insertMeasureByPosition(self, width, position=None, counter=None):
         if position is None:
             if self.numStaffs() == 0:
@@ -346,7 +544,10 @@ class Score(object):
         newMeasure = Measure(width)
         newMeasure.counter = counter
         staff = self.getStaffByIndex(position.staffIndex)
+        measureIndex = self.measurePositionToIndex(position)
         staff.insertMeasure(position, newMeasure)
+        self._measureInserted(measureIndex, newMeasure)
+        self._layoutChanged()
         return newMeasure
 
     def deleteMeasureByIndex(self, index):
@@ -361,7 +562,10 @@ class Score(object):
                 and position.measureIndex == staff.numMeasures() - 1):
             sectionIndex = self.positionToSectionIndex(position)
             self._deleteSectionTitle(sectionIndex)
+        measureIndex = self.measurePositionToIndex(position)
         staff.deleteMeasure(position)
+        self._measureDeleted(measureIndex)
+        self._layoutChanged()
 
     def deleteMeasuresAtPosition(self, position, numToDelete):
         position = position.makeMeasurePosition()
@@ -374,7 +578,10 @@ class Score(object):
                     position.staffIndex += 1
                     position.measureIndex = 0
                 staff = self.getStaffByIndex(position.staffIndex)
+            measureIndex = self.measurePositionToIndex(position)
             staff.deleteMeasure(position)
+            self._measureDeleted(measureIndex)
+            self._layoutChanged()
 
     def trailingEmptyMeasures(self):
         emptyMeasures = []
@@ -512,16 +719,43 @@ class Score(object):
                 suffix = max(suffix, sectionSuffix)
         return "%s %d" % (stem.rstrip(), suffix + 1)
 
+    def _getTempoMap(self):
+        """Return the effective BPM of every measure, in order.
+
+        Simile measures take their tempo from the measure they refer to.
+        The map is rebuilt only after measures are added or removed, one
+        of this score's Measures changes its tempo or simile reference, or
+        the score BPM changes.
+        """
+        key = self.scoreData.bpm
+        if (self._tempoMap is None or self._tempoKey != key
+                or len(self._tempoMap) != self.numMeasures()):
+            bpm = self.scoreData.bpm
+            referred = []
+            tempoMap = []
+            for index, measure in enumerate(self.iterMeasures()):
+                if index > 0 and measure.simileDistance > 0:
+                    referredIndex = referred[max(index -
+                                                 measure.simileDistance, 0)]
+                else:
+                    referredIndex = index
+                referred.append(referredIndex)
+                if referredIndex != index:
+                    measure = self.getMeasureByIndex(referredIndex)
+                if measure.newBpm != 0:
+                    bpm = measure.newBpm
+                tempoMap.append(bpm)
+            self._tempoMap = tempoMap
+            self._tempoKey = key
+        return self._tempoMap
+
     def bpmAtMeasureByIndex(self, index):
-        bpm = self.scoreData.bpm
-        for measureIndex, measure in enumerate(self.iterMeasures()):
-            if measure.simileDistance > 0:
-                measure = self.getReferredMeasure(measureIndex)
-            if measure.newBpm != 0:
-                bpm = measure.newBpm
-            if measureIndex == index:
-                break
-        return bpm
+        tempoMap = self._getTempoMap()
+        if 0 <= index < len(tempoMap):
+            return tempoMap[index]
+        elif tempoMap:
+            return tempoMap[-1]
+        return self.scoreData.bpm
 
     def bpmAtMeasureByPosition(self, measurePosition):
         index = self.measurePositionToIndex(measurePosition)
@@ -616,59 +850,198 @@ class Score(object):
     def saveFormatState(self):
         self._formatState = self._getFormatState()
 
-    def formatScore(self, width=None, ignoreErrors=True):
-        if width is None:
-            width = self.scoreData.width
-        measures = list(self.iterMeasures())
-        if not self._formatState:
-            self.saveFormatState()
-        for staff in self.iterStaffs():
-            staff.clear()
-        staff = self.getStaffByIndex(0)
-        staffIndex = 0
+    @staticmethod
+    def _layoutWidth(measures, measureIndex):
+        measure = measures[measureIndex]
+        if measure.simileDistance > 0:
+            referredMeasure = measure
+            refIndex = measureIndex
+            while refIndex > 0 and referredMeasure.simileDistance > 0:
+                refIndex -= referredMeasure.simileDistance
+                if refIndex < 0:
+                    refIndex = 0
+                referredMeasure = measures[refIndex]
+            return referredMeasure.numBeats()
+        else:
+            return len(measure)
+
+    def _reflowStart(self, width, entries):
+        """Compare the measures with those of the last layout.
+
+        Returns the index of the first staff which must be reflowed, the
+        staff starts of the last layout, and the index of the first
+        measure after which nothing has changed. The staff starts are None
+        if the whole score must be reflowed.
+        """
+        if self._layout is None or self._layout[0] != width:
+            return 0, None, 0
+        oldEntries, oldStarts = self._layout[1:]
+        limit = min(len(entries), len(oldEntries))
+        prefix = 0
+        while prefix < limit and entries[prefix] == oldEntries[prefix]:
+            prefix += 1
+        suffix = 0
+        while (suffix < limit - prefix
+               and entries[-1 - suffix] == oldEntries[-1 - suffix]):
+            suffix += 1
+        if prefix == len(entries) == len(oldEntries):
+            suffix = prefix
+        staffIndex = min(bisect.bisect_right(oldStarts, prefix) - 1,
+                         len(oldStarts) - 2)
+        firstStaff = max(staffIndex - 1, 0)
+        currentStarts = self._getStaffStarts()
+        if currentStarts[:firstStaff + 1] != oldStarts[:firstStaff + 1]:
+            return 0, None, 0
+        return firstStaff, oldStarts, len(entries) - suffix
+
+    def _findUnchangedTail(self, measureIndex, oldStarts, delta):
+        """Find the staffs which can be kept if a staff starts here.
+
+        Returns the indexes of the matching staff in the current and in
+        the last layout, or None if the layouts have not lined up again.
+        """
+        currentStarts = self._getStaffStarts()
+        current = bisect.bisect_left(currentStarts, measureIndex)
+        while (current < self.numStaffs()
+               and currentStarts[current + 1] == measureIndex):
+            current += 1
+        old = bisect.bisect_left(oldStarts, measureIndex - delta)
+        if (current >= self.numStaffs()
+                or currentStarts[current] != measureIndex
+                or old >= len(oldStarts) - 1
+                or oldStarts[old] != measureIndex - delta):
+            return None
+        if currentStarts[current:] != [start + delta
+                                       for start in oldStarts[old:]]:
+            return None
+        return current, old
+
+    @staticmethod
+    def _packStaffs(entries, startIndex, width, ignoreErrors, canStop):
+        """Pack measures into staffs, starting with the measure at startIndex.
+
+        canStop is called with the index of the first measure of each new
+        staff. Packing stops if it returns anything other than None, and
+        that value is returned along with the packed staffs.
+        """
+        staffMeasures = []
+        newStaffs = [staffMeasures]
         staffWidth = 0
-        for measureIndex, measure in enumerate(measures):
-            staff.addMeasure(measure)
+        if startIndex > 0 and not entries[startIndex - 1][2]:
+            # This staff was started because the last one overflowed, which
+            # leaves one less column of padding.
+            staffWidth = 1
+        for measureIndex in xrange(startIndex, len(entries)):
+            measure, measureWidth, lineEnd = entries[measureIndex]
+            staffMeasures.append(measure)
             if staffWidth == 0:
                 staffWidth = 2
-            if measure.simileDistance > 0:
-                referredMeasure = measure
-                refIndex = measureIndex
-                while refIndex > 0 and referredMeasure.simileDistance > 0:
-                    refIndex -= referredMeasure.simileDistance
-                    if refIndex < 0:
-                        refIndex = 0
-                    referredMeasure = measures[refIndex]
-                measureWidth = referredMeasure.numBeats()
-            else:
-                measureWidth = len(measure)
             staffWidth += measureWidth + 1
             while staffWidth > width:
-                if staff.numMeasures() == 1:
+                if len(staffMeasures) == 1:
                     if ignoreErrors:
                         break
                     else:
                         raise OverSizeMeasure(measure)
                 else:
-                    staff.deleteLastMeasure()
-                    staffIndex += 1
-                    if staffIndex == self.numStaffs():
-                        self._addStaff()
-                    staff = self.getStaffByIndex(staffIndex)
-                    staff.addMeasure(measure)
+                    staffMeasures.pop()
+                    stop = canStop(measureIndex)
+                    if stop is not None:
+                        return newStaffs, stop
+                    staffMeasures = [measure]
+                    newStaffs.append(staffMeasures)
                     staffWidth = 2 + measureWidth
-            if (measure.isLineEnd() and
-                    measureIndex != len(measures) - 1):
-                staffIndex += 1
-                if staffIndex == self.numStaffs():
-                    self._addStaff()
-                staff = self.getStaffByIndex(staffIndex)
+            if lineEnd and measureIndex != len(entries) - 1:
+                stop = canStop(measureIndex + 1)
+                if stop is not None:
+                    return newStaffs, stop
+                staffMeasures = []
+                newStaffs.append(staffMeasures)
                 staffWidth = 0
-        while self.numStaffs() > staffIndex + 1:
-            staff = self._staffs.pop()
-            staff.clearCallBack()
+        return newStaffs, None
+
+    def formatScore(self, width=None, ignoreErrors=True):
+        """Lay out the measures of the score in staffs.
+
+        Only the staffs from just before the first changed measure are
+        reflowed, stopping once the staff breaks line up again with the
+        last layout. changedStaffRange reports which staffs were replaced.
+        """
+        if width is None:
+            width = self.scoreData.width
+        measures = list(self.iterMeasures())
+        if not self._formatState:
+            self.saveFormatState()
+        entries = [(measure, self._layoutWidth(measures, measureIndex),
+                    measure.isLineEnd())
+                   for measureIndex, measure in enumerate(measures)]
+        firstStaff, oldStarts, changedEnd = self._reflowStart(width, entries)
+        self._layout = None
+        if oldStarts is None:
+            oldNumStaffs = self.numStaffs()
+        else:
+            oldNumStaffs = len(oldStarts) - 1
+        if (oldStarts is not None and changedEnd == 0
+                and len(entries) == oldStarts[-1]
+                and self._getStaffStarts() == oldStarts):
+            self._formatRange = (firstStaff, firstStaff, firstStaff)
+        else:
+            startIndex = self._getStaffStarts()[firstStaff]
+            delta = 0 if oldStarts is None else len(entries) - oldStarts[-1]
+
+            def canStop(measureIndex):
+                if oldStarts is None or measureIndex <= changedEnd:
+                    return None
+                return self._findUnchangedTail(measureIndex, oldStarts, delta)
+            newStaffs, tail = self._packStaffs(entries, startIndex, width,
+                                               ignoreErrors, canStop)
+            if tail is None:
+                tail = (self.numStaffs(), oldNumStaffs)
+            reused = self._staffs[firstStaff:tail[0]]
+            staffs = []
+            for staffIndex, staffMeasures in enumerate(newStaffs):
+                if staffIndex < len(reused):
+                    staff = reused[staffIndex]
+                    staff.clear()
+                else:
+                    staff = Staff()
+                for measure in staffMeasures:
+                    staff.addMeasure(measure)
+                staffs.append(staff)
+            for staff in reused[len(newStaffs):]:
+                staff.clear()
+                staff.clearCallBack()
+            self._staffs[firstStaff:tail[0]] = staffs
+            for staffIndex in xrange(firstStaff, self.numStaffs()):
+                self._setStaffCallBack(self.getStaffByIndex(staffIndex),
+                                       staffIndex)
+            self._layoutChanged()
+            self._formatRange = (firstStaff, tail[1],
+                                 firstStaff + len(newStaffs))
+        self._layout = (width, entries, list(self._getStaffStarts()))
         return self._formatState != self._getFormatState()
 
+    def changedStaffRange(self):
+        """Return the staffs replaced by the last call to formatScore.
+
+        The result is a tuple (first, oldEnd, newEnd): the staffs from first
+        up to oldEnd in the old layout were replaced by the staffs from
+        first up to newEnd. Staffs after these hold the same measures as
+        before, though their indexes may have shifted.
+        """
+        return self._formatRange
+
+    def popChangedStaffs(self):
+        """Return the set of Staffs holding a Measure which has changed since
+        the last call, and start a new set.
+
+        This catches changes such as bar lines and text, which need a staff
+        redrawn without changing the layout that changedStaffRange reports.
+        """
+        changed = self._changedStaffs
+        self._changedStaffs = set()
+        return changed
+
     def changeKit(self, newKit, changes):
         for measure in self.iterMeasures():
             measure.changeKit(newKit, changes)
@@ -716,12 +1089,13 @@ class Score(object):
         else:
             return self._iterLinesLockedOrWithNotes(staffIndex)
 
-    def postReadProcessing(self):
-        # Check that all the note heads are valid
-        for measure in self.iterMeasures():
-            for np, head in measure:
-                if not self.drumKit[np.drumIndex].isAllowedHead(head):
-                    self.drumKit[np.drumIndex].addNoteHead(head)
+    def postReadProcessing(self, checkHeads=True):
+        # Check that all the note heads are valid, unless the reader has
+        if checkHeads:
+            for measure in self.iterMeasures():
+                for unusedTime, drumIndex, head in measure.iterNotesRaw():
+                    if not self.drumKit[drumIndex].isAllowedHead(head):
+                        self.drumKit[drumIndex].addNoteHead(head)
         # Format the score appropriately
         self.formatScore(self.scoreData.width)
         # Make sure we've got the right number of section titles
@@ -734,10 +1108,23 @@ class Score(object):
         elif numSections < self.numSections():
             self._sections = self._sections[:numSections]
 
+    def _headerState(self):
+        scoreData = self.scoreData
+        metadata = (unicode(scoreData.title), unicode(scoreData.artist),
+                    scoreData.artistVisible, unicode(scoreData.creator),
+                    scoreData.creatorVisible, scoreData.bpm,
+                    scoreData.bpmVisible, scoreData.swing)
+        kit = [(unicode(drum.name), unicode(drum.abbr), unicode(drum.head),
+                drum.locked, [unicode(head) for head in drum])
+               for drum in self.drumKit]
+        sections = [unicode(title) for title in self.iterSections()]
+        return (metadata, kit, sections, self._getLayoutDigest())
+
     def hashScore(self):
-        exporter = AsciiExport.Exporter(
-            self, ASCIISettings.ASCIISettings(), False)
-        scoreString = StringIO()
-        exporter.export(scoreString)
-        scoreString = scoreString.getvalue()
-        return hashlib.md5(scoreString.encode('utf-8')).digest()
+        # The digest tree is kept up to date from the first call on.
+        if (self._digestTree is None
+                or len(self._digestTree) != self.numMeasures()):
+            self._digestTree = _DigestTree()
+            self._digestTree.build(self.iterMeasures())
+        header = repr(self._headerState())
+        return hashlib.md5(header + repr(self._digestTree.root())).digest()
@@ -25,19 +25,23 @@ Created on Jun 20, 2015
 import itertools
 from cStringIO import StringIO
 import codecs
-from Data.fileStructures import dbfsv0, dbfsv1, dbfsv2
+from Data.fileStructures import dbfsv0, dbfsv1, dbfsv2, dbfsv3
 from Data.DBErrors import DBVersionError, NoContent
 from Data import DBConstants
 import Data.fileUtils as fileUtils
 
 _FS_MAP = {DBConstants.DBFF_0: dbfsv0.ScoreStructureV0,
            DBConstants.DBFF_1: dbfsv1.ScoreStructureV1,
-           DBConstants.DBFF_2: dbfsv2.ScoreStructureV2}
+           DBConstants.DBFF_2: dbfsv2.ScoreStructureV2,
+           DBConstants.DBFF_3: dbfsv3.ScoreStructureV3}
 
 
 class ScoreSerializer(object):
     @classmethod
     def loadScore(cls, filename):
+        with fileUtils.DataReader(filename, binary=True) as handle:
+            if handle.read(len(dbfsv3.MAGIC)) == dbfsv3.MAGIC:
+                return cls.readBinary(dbfsv3.MAGIC + handle.read())
         with fileUtils.DataReader(filename) as reader:
             score = cls.read(reader)
         return score
@@ -62,21 +66,32 @@ class ScoreSerializer(object):
             scoreIterator.next()
         else:
             fileVersion = DBConstants.DBFF_0
-        if fileVersion > DBConstants.CURRENT_FILE_FORMAT:
+        if (fileVersion > DBConstants.CURRENT_FILE_FORMAT
+                or _FS_MAP[fileVersion].isBinary):
             raise DBVersionError(scoreIterator)
         fileStructure = _FS_MAP[fileVersion]()
+        scoreIterator.batchTypes = fileStructure.batchTypes
         score = fileStructure.read(scoreIterator)
         score.fileFormat = fileVersion
         return score
 
+    @staticmethod
+    def readBinary(data):
+        score = dbfsv3.ScoreStructureV3().read(data)
+        score.fileFormat = DBConstants.DBFF_3
+        return score
+
     @staticmethod
     def write(score, handle, version=DBConstants.CURRENT_FILE_FORMAT):
+        fileStructure = _FS_MAP.get(version,
+                                    _FS_MAP[DBConstants.CURRENT_FILE_FORMAT])()
+        if fileStructure.isBinary:
+            handle.write(fileStructure.write(score))
+            return
         scoreBuffer = StringIO()
         scoreWriter = codecs.getwriter("utf-8")(scoreBuffer)
         indenter = fileUtils.Indenter(scoreWriter)
         indenter(DBConstants.DB_FILE_FORMAT_STR, version)
-        fileStructure = _FS_MAP.get(version,
-                                    _FS_MAP[DBConstants.CURRENT_FILE_FORMAT])()
         fileStructure.write(score, indenter)
         handle.write(scoreBuffer.getvalue().decode("utf-8"))
 
@@ -84,6 +99,8 @@ class ScoreSerializer(object):
     def saveScore(cls, score, filename,
                   version=DBConstants.CURRENT_FILE_FORMAT,
                   compressed=True):
-        with fileUtils.DataWriter(filename, compressed) as writer:
+        binary = _FS_MAP.get(version,
+                             _FS_MAP[DBConstants.CURRENT_FILE_FORMAT]).isBinary
+        with fileUtils.DataWriter(filename, compressed, binary) as writer:
             score.fileFormat = version
             cls.write(score, writer, version)
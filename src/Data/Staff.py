@@ -29,17 +29,24 @@ class Staff(object):
     def __init__(self):
         self._measures = []
         self._callBack = None
+        self._changeCallBack = None
         self._visibleLines = {}
 
     def _runCallBack(self, position):
         if self._callBack is not None:
             self._callBack(position)
 
-    def setCallBack(self, callBack):
+    def _runChangeCallBack(self, measure, tempo):
+        if self._changeCallBack is not None:
+            self._changeCallBack(measure, tempo)
+
+    def setCallBack(self, callBack, changeCallBack=None):
         self._callBack = callBack
+        self._changeCallBack = changeCallBack
 
     def clearCallBack(self):
         self._callBack = None
+        self._changeCallBack = None
 
     def __len__(self):
         return sum(len(m) for m in self._measures)
@@ -57,7 +64,7 @@ class Staff(object):
         def wrappedCallBack(position):
             position.measureIndex = measureIndex
             self._runCallBack(position)
-        measure.setCallBack(wrappedCallBack)
+        measure.setCallBack(wrappedCallBack, self._runChangeCallBack)
 
     def _isValidPosition(self, position, afterOk=False):
         if not (0 <= position.measureIndex < self.numMeasures()):
@@ -17,6 +17,7 @@
 # You should have received a copy of the GNU General Public License
 # along with DrumBurp.  If not, see <http://www.gnu.org/licenses/>
 
+import re
 import weakref
 
 from Data import DBErrors
@@ -28,7 +29,6 @@ from Data.fileUtils import (FileStructure, PositiveIntegerField,
 
 import Data.Beat
 import Data.MeasureCount
-import Data.NotePosition
 import Data.Measure
 import Data.Drum
 import Data.DrumKit
@@ -42,15 +42,23 @@ import Data.Score
 
 class CounterFieldV0(SimpleValueField):
     registry = CounterRegistry()
+    _masters = {}
 
     def _processData(self, data):
-        if data[0] == "|" and data[-1] == "|":
-            data = data[1:-1]
-        data = Data.DBConstants.BEAT_COUNT + data[1:]
         try:
-            return self.registry.findMaster(data)
+            return self._masters[data]
+        except KeyError:
+            pass
+        countString = data
+        if countString[0] == "|" and countString[-1] == "|":
+            countString = countString[1:-1]
+        countString = Data.DBConstants.BEAT_COUNT + countString[1:]
+        try:
+            master = self.registry.findMaster(countString)
         except KeyError:
             raise DBErrors.BadCount()
+        self._masters[data] = master
+        return master
 
     def _toString(self, counter):
         return "|" + str(counter) + "|"
@@ -87,15 +95,24 @@ class MeasureCountStructureV0(FileStructure):
         if 'repeat' not in instance:
             instance["repeat"] = 1
         mCount.beats = instance["beats"] * instance["repeat"]
-        return mCount
+        return mCount.interned()
 
 
 class NoteFieldV0(Field):
+    batched = True
+    _noteData = re.compile(r"^(-?\d+),(-?\d+),([^,\n]+)$", re.MULTILINE)
+
     def read(self, target, data):
-        noteTime, drumIndex, head = data.split(",")
-        pos = Data.NotePosition.NotePosition(noteTime=int(noteTime),
-                                             drumIndex=int(drumIndex))
-        target.addNote(pos, head)
+        if isinstance(data, basestring):
+            data = [data]
+        try:
+            notes = self._noteData.findall("\n".join(data))
+        except TypeError:
+            raise DBErrors.BadNote()
+        if len(notes) != len(data):
+            raise DBErrors.BadNote()
+        target.setNotes((int(noteTime), int(drumIndex), head)
+                        for noteTime, drumIndex, head in notes)
 
     def write(self, noteAndHead):
         pos, head = noteAndHead
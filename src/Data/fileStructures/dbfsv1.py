@@ -59,6 +59,9 @@ class MeasureCountStructureV1(FileStructure):
 
     beats = _beatStructure()
 
+    def postProcessObject(self, instance):
+        return instance.interned()
+
 
 class DefaultMeasureCountStructureV1(FileStructure):
     tag = "DEFAULT_MEASURE_COUNT"
@@ -66,6 +69,9 @@ class DefaultMeasureCountStructureV1(FileStructure):
 
     beats = _beatStructure()
 
+    def postProcessObject(self, instance):
+        return instance.interned()
+
 
 class MeasureStructureV1(FileStructure):
     tag = "MEASURE"
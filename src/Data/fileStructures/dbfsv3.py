@@ -0,0 +1,387 @@
+# Copyright 2017 Michael Thomas
+#
+# See www.whatang.org for more information.
+#
+# This file is part of DrumBurp.
+#
+# DrumBurp is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DrumBurp is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DrumBurp.  If not, see <http://www.gnu.org/licenses/>
+'''
+Binary DrumBurp file format.
+
+The file starts with MAGIC, followed by the score metadata, the drum kit,
+a table of the distinct measure counts, a table of the note heads used,
+and then the measures. Each measure refers to its count by index into the
+count table, and stores its notes as three packed arrays of note times,
+drum indexes and head indexes. All integers are little-endian.
+'''
+
+from array import array
+from itertools import izip
+import struct
+import sys
+
+import Data.Beat
+import Data.MeasureCount
+import Data.Measure
+import Data.Drum
+import Data.DrumKit
+import Data.ScoreMetaData
+import Data.FontOptions
+import Data.DBConstants
+import Data.Score
+from Data import DBErrors
+from Data.Counter import CounterRegistry
+
+MAGIC = "DBFF\x00\x03\r\n"
+
+_BOOL = struct.Struct("<B")
+_INT = struct.Struct("<i")
+_UINT = struct.Struct("<I")
+_MEASURE = struct.Struct("<iIBBIIIIBBI")
+_PLAIN_BAR = Data.DBConstants.BAR_TYPES[Data.DBConstants.NORMAL_BAR]
+
+_METADATA = (("title", "s"),
+             ("artist", "s"),
+             ("artistVisible", "b"),
+             ("creator", "s"),
+             ("creatorVisible", "b"),
+             ("bpm", "i"),
+             ("bpmVisible", "b"),
+             ("width", "i"),
+             ("kitDataVisible", "b"),
+             ("metadataVisible", "b"),
+             ("beatCountVisible", "b"),
+             ("emptyLinesVisible", "b"),
+             ("measureCountsVisible", "b"),
+             ("swing", "i"))
+
+_HEAD_DATA = (("midiNote", "i"),
+              ("midiVolume", "i"),
+              ("effect", "s"),
+              ("notationHead", "s"),
+              ("notationLine", "i"),
+              ("notationEffect", "s"),
+              ("stemDirection", "i"),
+              ("shortcut", "s"))
+
+_SCORE_SETTINGS = (("paperSize", "s"),
+                   ("lilysize", "i"),
+                   ("lilypages", "i"),
+                   ("lilyFill", "b"),
+                   ("lilyFormat", "i"),
+                   ("systemSpacing", "i"))
+
+_FONT_OPTIONS = (("noteFont", "s"),
+                 ("noteFontSize", "i"),
+                 ("sectionFont", "s"),
+                 ("sectionFontSize", "i"),
+                 ("metadataFont", "s"),
+                 ("metadataFontSize", "i"))
+
+
+def _toLittleEndian(values):
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+
+class _Writer(object):
+    def __init__(self):
+        self._chunks = [MAGIC]
+
+    def getvalue(self):
+        return "".join(self._chunks)
+
+    def raw(self, data):
+        self._chunks.append(data)
+
+    def boolean(self, value):
+        self._chunks.append(_BOOL.pack(bool(value)))
+
+    def integer(self, value):
+        self._chunks.append(_INT.pack(value))
+
+    def count(self, value):
+        self._chunks.append(_UINT.pack(value))
+
+    def string(self, value):
+        value = unicode(value).encode("utf-8")
+        self._chunks.append(_UINT.pack(len(value)))
+        self._chunks.append(value)
+
+    def values(self, source, fields):
+        for attributeName, fieldType in fields:
+            value = getattr(source, attributeName)
+            if fieldType == "s":
+                self.string(value)
+            elif fieldType == "b":
+                self.boolean(value)
+            else:
+                self.integer(value)
+
+
+class _Reader(object):
+    def __init__(self, data):
+        if not data.startswith(MAGIC):
+            raise DBErrors.NotBinaryScore()
+        self._data = data
+        self._offset = len(MAGIC)
+
+    def _unpack(self, unpacker):
+        try:
+            values = unpacker.unpack_from(self._data, self._offset)
+        except struct.error:
+            raise DBErrors.TruncatedBinaryScore()
+        self._offset += unpacker.size
+        return values
+
+    def raw(self, length):
+        if self._offset + length > len(self._data):
+            raise DBErrors.TruncatedBinaryScore()
+        data = self._data[self._offset:self._offset + length]
+        self._offset += length
+        return data
+
+    def boolean(self):
+        return bool(self._unpack(_BOOL)[0])
+
+    def integer(self):
+        return self._unpack(_INT)[0]
+
+    def count(self):
+        return self._unpack(_UINT)[0]
+
+    def string(self):
+        return self.raw(self.count()).decode("utf-8")
+
+    def array(self, typecode, length):
+        values = array(typecode)
+        values.fromstring(self.raw(values.itemsize * length))
+        return _toLittleEndian(values)
+
+    def measureHeader(self):
+        return self._unpack(_MEASURE)
+
+    def values(self, target, fields):
+        for attributeName, fieldType in fields:
+            if fieldType == "s":
+                value = self.string()
+            elif fieldType == "b":
+                value = self.boolean()
+            else:
+                value = self.integer()
+            setattr(target, attributeName, value)
+
+
+class ScoreStructureV3(object):
+    """Reads and writes scores in the binary DBFF 3 format."""
+    isBinary = True
+    registry = CounterRegistry()
+
+    def _makeCount(self, key):
+        count = Data.MeasureCount.MeasureCount()
+        for counterString, numTicks in key:
+            data = Data.DBConstants.BEAT_COUNT + counterString[1:]
+            try:
+                counter = self.registry.findMaster(data)
+            except KeyError:
+                raise DBErrors.BadCount()
+            count.addBeats(Data.Beat.Beat(counter, numTicks), 1)
+        return count.interned()
+
+    def write(self, score):
+        writer = _Writer()
+        writer.values(score.scoreData, _METADATA)
+        self._writeKit(writer, score.drumKit)
+        measures = list(score.iterMeasures())
+        countIndexes = {}
+        counts = []
+        for count in [score.defaultCount] + [measure.counter
+                                             for measure in measures]:
+            if count is not None:
+                key = count.signature()
+                if key not in countIndexes:
+                    countIndexes[key] = len(counts)
+                    counts.append(key)
+        writer.count(len(counts))
+        for key in counts:
+            writer.count(len(key))
+            for counterString, numTicks in key:
+                writer.string(counterString)
+                writer.count(numTicks)
+        headIndexes = {}
+        heads = []
+        for measure in measures:
+            for unusedTime, unusedDrum, head in measure.iterNotesRaw():
+                if head not in headIndexes:
+                    headIndexes[head] = len(heads)
+                    heads.append(head)
+        writer.count(len(heads))
+        for head in heads:
+            writer.string(head)
+        writer.count(len(measures))
+        for measure in measures:
+            self._writeMeasure(writer, measure, countIndexes, headIndexes)
+        writer.count(score.numSections())
+        for title in score.iterSections():
+            writer.string(title)
+        writer.values(score, _SCORE_SETTINGS)
+        writer.count(countIndexes[score.defaultCount.signature()])
+        writer.values(score.fontOptions, _FONT_OPTIONS)
+        return writer.getvalue()
+
+    @staticmethod
+    def _writeKit(writer, kit):
+        writer.count(len(kit))
+        for drum in kit:
+            writer.string(drum.name)
+            writer.string(drum.abbr)
+            writer.string(drum.head)
+            writer.boolean(drum.locked)
+            writer.count(len(drum))
+            for head in drum:
+                writer.string(head)
+                writer.values(drum.headData(head), _HEAD_DATA)
+
+    def _writeMeasure(self, writer, measure, countIndexes, headIndexes):
+        if measure.counter is None:
+            countIndex = -1
+        else:
+            countIndex = countIndexes[measure.counter.signature()]
+        notes = list(measure.iterNotesRaw())
+        writer.raw(_MEASURE.pack(countIndex, len(measure),
+                                 measure.startBar, measure.endBar,
+                                 measure.repeatCount,
+                                 measure.simileDistance, measure.simileIndex,
+                                 measure.newBpm,
+                                 measure.showAbove, measure.showBelow,
+                                 len(notes)))
+        hasAlternate = measure.alternateText is not None
+        writer.boolean(hasAlternate)
+        if hasAlternate:
+            writer.string(measure.alternateText)
+        writer.string(measure.aboveText)
+        writer.string(measure.belowText)
+        times = array("H", [note[0] for note in notes])
+        drums = array("B", [note[1] for note in notes])
+        headCodes = array("B", [headIndexes[note[2]] for note in notes])
+        for values in (times, drums, headCodes):
+            writer.raw(_toLittleEndian(values).tostring())
+
+    def read(self, data):
+        reader = _Reader(data)
+        score = Data.Score.Score()
+        scoreData = Data.ScoreMetaData.ScoreMetaData()
+        reader.values(scoreData, _METADATA)
+        score.scoreData = scoreData
+        score.drumKit = self._readKit(reader)
+        counts = []
+        for unusedIndex in xrange(reader.count()):
+            key = tuple((reader.string(), reader.count())
+                        for unusedBeat in xrange(reader.count()))
+            counts.append(self._makeCount(key))
+        heads = [reader.string() for unusedIndex in xrange(reader.count())]
+        codes = Data.Measure.Measure.headCodes(heads)
+        usedHeads = set()
+        score.appendMeasures([self._readMeasure(reader, counts, codes,
+                                                usedHeads)
+                              for unusedIndex in xrange(reader.count())])
+        self._checkHeads(score.drumKit, heads, usedHeads)
+        for unusedIndex in xrange(reader.count()):
+            score._sections.append(reader.string())
+        reader.values(score, _SCORE_SETTINGS)
+        score.defaultCount = counts[reader.count()]
+        fontOptions = Data.FontOptions.FontOptions()
+        reader.values(fontOptions, _FONT_OPTIONS)
+        score.fontOptions = fontOptions
+        score.postReadProcessing(checkHeads=False)
+        return score
+
+    @staticmethod
+    def _checkHeads(kit, heads, usedHeads):
+        # The same as Score.postReadProcessing does note by note, but only
+        # once for each distinct drum and head.
+        for drumIndex, headIndex in usedHeads:
+            if drumIndex >= len(kit):
+                raise DBErrors.TruncatedBinaryScore()
+            drum = kit[drumIndex]
+            if not drum.isAllowedHead(heads[headIndex]):
+                drum.addNoteHead(heads[headIndex])
+
+    @staticmethod
+    def _readKit(reader):
+        kit = Data.DrumKit.DrumKit()
+        for unusedIndex in xrange(reader.count()):
+            name = reader.string()
+            abbr = reader.string()
+            defaultHead = reader.string()
+            locked = reader.boolean()
+            drum = Data.Drum.Drum(name, abbr, defaultHead, locked)
+            for unusedHead in xrange(reader.count()):
+                head = reader.string()
+                headData = Data.Drum.HeadData()
+                reader.values(headData, _HEAD_DATA)
+                drum.addNoteHead(head, headData)
+            kit.addDrum(drum)
+        return kit
+
+    @staticmethod
+    def _readMeasure(reader, counts, codes, usedHeads):
+        (countIndex, width, startBar, endBar, repeatCount,
+         simileDistance, simileIndex, newBpm,
+         showAbove, showBelow, numNotes) = reader.measureHeader()
+        alternateText = None
+        if reader.boolean():
+            alternateText = reader.string()
+        aboveText = reader.string()
+        belowText = reader.string()
+        times = reader.array("H", numNotes)
+        drums = reader.array("B", numNotes)
+        headCodes = reader.array("B", numNotes)
+        if countIndex < 0:
+            measure = Data.Measure.Measure(width)
+        else:
+            counter = counts[countIndex]
+            measure = Data.Measure.Measure(len(counter))
+            measure.counter = counter
+        if numNotes:
+            if max(headCodes) >= len(codes):
+                raise DBErrors.TruncatedBinaryScore()
+            measure.setNoteArrays(times, drums, headCodes, codes)
+            usedHeads.update(izip(drums, headCodes))
+        # Most measures are plain, so only set what differs from a new
+        # measure: each setter notifies the score of a change.
+        if startBar != _PLAIN_BAR:
+            measure.startBar = startBar
+        if endBar != _PLAIN_BAR:
+            measure.endBar = endBar
+        if repeatCount != 1:
+            measure.repeatCount = repeatCount
+        if alternateText is not None:
+            measure.alternateText = alternateText
+        if simileDistance:
+            measure.simileDistance = simileDistance
+        if simileIndex:
+            measure.simileIndex = simileIndex
+        if showAbove:
+            measure.showAbove = True
+        if aboveText.strip():
+            measure.aboveText = aboveText
+        if showBelow:
+            measure.showBelow = True
+        if belowText.strip():
+            measure.belowText = belowText
+        if newBpm:
+            measure.newBpm = newBpm
+        return measure
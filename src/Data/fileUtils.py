@@ -21,7 +21,6 @@ Created on 7 Oct 2012
 
 @author: Mike Thomas
 '''
-import itertools
 import gzip
 import codecs
 import binascii
@@ -64,25 +63,49 @@ class dbFileIterator(object):
                 self._process()
             return False
 
-    def __init__(self, handle):
+    def __init__(self, handle, batchTypes=()):
         self._handle = handle
         self.lineNumber = 0
         self.currentLine = ""
+        # Runs of consecutive lines of these types are yielded once, with
+        # a list of their data
+        self.batchTypes = frozenset(batchTypes)
 
     def __iter__(self):
+        batchTypes = self.batchTypes
+        batchType = None
+        batch = None
         for lineNumber, line in enumerate(self._handle):
-            self.lineNumber = lineNumber
             line = line.strip()
-            self.currentLine = line
             fields = line.split(None, 1)
-            if len(fields) == 1:
-                fields.append(None)
-            elif len(fields) == 0:
+            if not fields:
                 # Blank line
                 continue
-            lineType, lineData = fields
-            lineType = lineType.upper()
-            yield lineType, lineData
+            lineType = fields[0].upper()
+            if len(fields) == 2:
+                lineData = fields[1]
+            else:
+                lineData = None
+            if batchType is not None:
+                if lineType == batchType:
+                    batch.append(lineData)
+                    continue
+                # Report errors in the batch at its first line, not at
+                # the line after it which ended the run.
+                self.lineNumber, self.currentLine = batchStart
+                yield batchType, batch
+                batchType = None
+            self.lineNumber = lineNumber
+            self.currentLine = line
+            if lineType in batchTypes:
+                batchType = lineType
+                batch = [lineData]
+                batchStart = (lineNumber, line)
+            else:
+                yield lineType, lineData
+        if batchType is not None:
+            self.lineNumber, self.currentLine = batchStart
+            yield batchType, batch
 
     def next(self):
         return self._handle.next()
@@ -142,21 +165,29 @@ class Indenter(object):
 
 
 class DataReader(object):
-    def __init__(self, filename):
+    def __init__(self, filename, binary=False):
         self.filename = filename
+        self.binary = binary
         self._reader = None
         self._gzHandle = None
 
     def __enter__(self):
         try:
             with gzip.open(self.filename, 'rb') as handle:
-                with codecs.getreader('utf-8')(handle) as reader:
-                    reader.read(50)
+                if self.binary:
+                    handle.read(50)
+                else:
+                    with codecs.getreader('utf-8')(handle) as reader:
+                        reader.read(50)
             self._gzHandle = gzip.open(self.filename, 'rb')
-            self._reader = codecs.getreader('utf-8')(self._gzHandle)
+            handle = self._gzHandle
         except IOError:
             self._gzHandle = None
-            self._reader = codecs.getreader('utf-8')(open(self.filename))
+            handle = open(self.filename, 'rb' if self.binary else 'r')
+        if self.binary:
+            self._reader = handle
+        else:
+            self._reader = codecs.getreader('utf-8')(handle)
         return self._reader
 
     def __exit__(self, excType, excValue, traceback):
@@ -166,19 +197,24 @@ class DataReader(object):
 
 
 class DataWriter(object):
-    def __init__(self, filename, compressed):
+    def __init__(self, filename, compressed, binary=False):
         self.filename = filename
         self.compressed = compressed
+        self.binary = binary
         self._writer = None
         self._gzHandle = None
 
     def __enter__(self):
         if self.compressed:
             self._gzHandle = gzip.open(self.filename, 'wb')
-            self._writer = codecs.getwriter('utf-8')(self._gzHandle)
+            handle = self._gzHandle
         else:
             self._gzHandle = None
-            self._writer = codecs.getwriter('utf-8')(open(self.filename, 'w'))
+            handle = open(self.filename, 'wb' if self.binary else 'w')
+        if self.binary:
+            self._writer = handle
+        else:
+            self._writer = codecs.getwriter('utf-8')(handle)
         return self._writer
 
     def __exit__(self, excType, excValue, traceback):
@@ -220,6 +256,10 @@ class Field(AbstractFileStructureElement):
         super(Field, self).__init__(attributeName, singleton, getter)
         self.title = title.upper()
 
+    # A batched field is read once for each run of consecutive lines,
+    # with a list of their data, when the dbFileIterator is batching them
+    batched = False
+
     def read(self, target, data):
         raise NotImplementedError()
 
@@ -414,6 +454,12 @@ class FileStructureMetaClass(type):
                 cls._structures.append(value)
                 cls._orderedData.append((value.structureId, attr, value))
         cls._orderedData.sort()
+        cls._fieldDict = dict((field.title, field) for field in cls._fields)
+        cls._structDict = dict((structure.startTag, structure)
+                               for structure in cls._structures)
+        cls.batchTypes = frozenset(field.title for field in cls._fields
+                                   if field.batched).union(
+            *[structure.batchTypes for structure in cls._structures])
         if cls.tag is not None:
             if cls.startTag is None:
                 cls.startTag = "START_" + cls.tag
@@ -428,9 +474,13 @@ class FileStructure(AbstractFileStructureElement):
     startTag = None
     endTag = None
     autoMake = False
+    isBinary = False
     _fields = []
     _structures = []
     _orderedData = []
+    _fieldDict = {}
+    _structDict = {}
+    batchTypes = frozenset()
 
     def __init__(self, attributeName=None, singleton=True,
                  startTag=None, endTag=None, getter=None,
@@ -462,22 +512,25 @@ class FileStructure(AbstractFileStructureElement):
 
     def read(self, fileIterator, startData=None, debug=False):
         instance = None
-        if self.autoMake:
-            instance = self.makeObject(None)
-        fieldDict = dict((field.title, field) for field in self._fields)
-        structDict = dict((structure.startTag, structure)
-                          for structure in self._structures)
         if startData is not None:
-            iterator = itertools.chain([startData], fileIterator)
-        else:
-            iterator = fileIterator
+            # A structure is only ever entered on its start tag
+            if debug:
+                print startData[0], startData[1]
+            instance = self.makeObject(startData[1])
+        elif self.autoMake:
+            instance = self.makeObject(None)
+        fieldDict = self._fieldDict
+        structDict = self._structDict
+        endTag = self.endTag
         try:
-            for lineType, lineData in iterator:
+            for lineType, lineData in fileIterator:
                 if debug:
                     print lineType, lineData
-                if lineType in fieldDict:
-                    field = fieldDict[lineType]
+                field = fieldDict.get(lineType)
+                if field is not None:
                     field.read(instance, lineData)
+                elif lineType == endTag:
+                    break
                 elif lineType in structDict:
                     structure = structDict[lineType]
                     subInstance = structure.read(fileIterator,
@@ -486,8 +539,6 @@ class FileStructure(AbstractFileStructureElement):
                     structure.recordStructure(instance, subInstance)
                 elif lineType == self.startTag:
                     instance = self.makeObject(lineData)
-                elif lineType == self.endTag:
-                    break
                 else:
                     raise DBErrors.UnrecognisedLine()
             return self.postProcessObject(instance)
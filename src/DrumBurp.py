@@ -21,22 +21,52 @@ Created on 31 Jul 2010
 
 @author: Mike Thomas
 '''
+import timeit
+# Taken before anything else is imported, for --startup-profile.
+_START_TIME = timeit.default_timer()
 import sys
 import optparse
-from PyQt4.QtGui import QApplication
-import GUI.DBMainwindow
-import GUI.DBIcons
-import GUI.DBFonts
-import GUI.DBStartupDialog
+import multiprocessing
 from DBVersion import APPNAME, DB_VERSION
+from DBStartupProfile import StartupProfile
 
 
 def main():
     import ctypes
+    multiprocessing.freeze_support()
     parser = optparse.OptionParser()
     parser.add_option('--virgin', action='store_true')
     parser.add_option('--pyinstaller-test', action='store_true')
+    parser.add_option('--startup-profile', action='store_true',
+                      dest='startupProfile',
+                      help='report the time taken by each phase of startup')
+    group = optparse.OptionGroup(parser, "Batch conversion",
+                                 "Convert DrumBurp files, or the DrumBurp "
+                                 "files in directories, without starting "
+                                 "the GUI.")
+    group.add_option('--convert', action='store_true',
+                     help='convert the files given as arguments')
+    group.add_option('--to', dest='convertTo', default='txt',
+                     help='output format: txt, midi, ly or brp '
+                     '[default: %default]')
+    group.add_option('--output', metavar='DIR',
+                     help='write output files to DIR instead of beside '
+                     'each input file')
+    group.add_option('--jobs', type='int',
+                     help='number of worker processes [default: one per CPU]')
+    group.add_option('--file-format', dest='fileFormat', type='int',
+                     default=None,
+                     help='DrumBurp file format version for --to brp')
+    parser.add_option_group(group)
     opts, args = parser.parse_args()
+    profile = StartupProfile(_START_TIME)
+    profile.mark("Python startup and options")
+    if opts.convert:
+        import DBConvert
+        from Data.DBConstants import CURRENT_FILE_FORMAT
+        if opts.fileFormat is None:
+            opts.fileFormat = CURRENT_FILE_FORMAT
+        sys.exit(DBConvert.main(opts, args))
     if opts.pyinstaller_test:
         # This is just to test that the program can start properly after
         # being frozen with PyInstaller. If PyInstaller has got something
@@ -52,19 +82,37 @@ def main():
         ctypes.windll.shell32.SetCurrentProcessExplicitAppUserModelID(myappid)
     except AttributeError:
         pass
+    from PyQt4.QtCore import QTimer
+    from PyQt4.QtGui import QApplication
+    profile.mark("Import PyQt4")
+    import GUI.DBMainwindow
+    import GUI.DBIcons
+    import GUI.DBFonts
+    import GUI.DBStartupDialog
+    profile.mark("Import main window")
     app = QApplication(sys.argv)
     app.setOrganizationName("Whatang Software")
     app.setOrganizationDomain("whatang.org")
     app.setApplicationName(APPNAME)
+    profile.mark("Create application")
     GUI.DBIcons.initialiseIcons()
     GUI.DBFonts.initialiseFonts()
+    profile.mark("Icons and fonts")
     splash = GUI.DBStartupDialog.DBStartupDialog(DB_VERSION)
     app.setWindowIcon(GUI.DBIcons.getIcon("drumburp"))
     splash.exec_()
+    profile.mark("Splash screen", waiting=True)
     mainWindow = GUI.DBMainwindow.DrumBurp(fakeStartup=opts.virgin,
                                            filename=filename)
     mainWindow.setWindowTitle("DrumBurp v" + DB_VERSION)
+    profile.mark("Create main window")
     mainWindow.show()
+    profile.mark("Show main window")
+    if opts.startupProfile:
+        def reportProfile():
+            profile.mark("First pass of event loop")
+            profile.report()
+        QTimer.singleShot(0, reportProfile)
     app.exec_()
 
 
@@ -179,15 +179,18 @@ class MetaDataCommand(ScoreCommand):
         self._signal = signal
         self._value = value
 
-    def _redo(self):
+    def _setValue(self, value):
         with self._qScore.metaChange():
-            setattr(self._score.scoreData, self._varname, self._value)
-            self._signal.emit(self._varname, self._value)
+            setattr(self._score.scoreData, self._varname, value)
+            self._signal.emit(self._varname, value)
+        if self._varname in ("bpm", "swing"):
+            DBMidi.updateTiming(self._score)
+
+    def _redo(self):
+        self._setValue(self._value)
 
     def _undo(self):
-        with self._qScore.metaChange():
-            setattr(self._score.scoreData, self._varname, self._oldValue)
-            self._signal.emit(self._varname, self._oldValue)
+        self._setValue(self._oldValue)
 
 
 class SetLilypondSizeCommand(ScoreCommand):
@@ -835,6 +838,7 @@ class ToggleSimileCommand(ScoreCommand):
             measure.simileIndex = 0
         else:
             measure.simileIndex = self._index
+        DBMidi.updateTiming(self._score)
         self._qScore.dataChanged(self._np)
         self._qScore.reBuild()
 
@@ -919,6 +923,7 @@ class SetNewBpmCommand(ScoreCommand):
             return
         measure = self._score.getMeasureByPosition(self._np)
         measure.newBpm = self._newBpm
+        DBMidi.updateTiming(self._score)
         self._qScore.reBuild()
 
     def _undo(self):
@@ -926,4 +931,5 @@ class SetNewBpmCommand(ScoreCommand):
             return
         measure = self._score.getMeasureByPosition(self._np)
         measure.newBpm = self._oldBpm
+        DBMidi.updateTiming(self._score)
         self._qScore.reBuild()
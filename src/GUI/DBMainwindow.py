@@ -25,6 +25,7 @@ Created on 31 Jul 2010
 from StringIO import StringIO
 import os
 import shutil
+import tempfile
 import webbrowser
 
 from PyQt4.QtCore import pyqtSignature, QSettings, QVariant, QTimer, QThread, \
@@ -34,24 +35,18 @@ from PyQt4.QtGui import (QMainWindow, QFontDatabase,
                          QPrintPreviewDialog, QWhatsThis,
                          QPrinterInfo, QLabel, QFrame,
                          QPrinter, QDesktopServices, QAction,
-                         QFont)
+                         QFont, QCheckBox)
 
 from DBVersion import APPNAME, DB_VERSION, doesNewerVersionExist
 from Data import FontOptions
-from Data.DBConstants import CURRENT_FILE_FORMAT
+from Data.DBConstants import CURRENT_FILE_FORMAT, DBFF_3
 from Data.DBErrors import InconsistentRepeats
 from GUI.DBFSMEvents import StartPlaying, StopPlaying
-from GUI.DBInfoDialog import DBInfoDialog
-from GUI.LilypondExporter import LilypondExporter
+from GUI.LilypondCache import LilypondCache
 from GUI.QDisplayProperties import QDisplayProperties
 from GUI.QEditMeasureDialog import QEditMeasureDialog
-from GUI.QLilypondPreview import QLilypondPreview
-from GUI.QNewScoreDialog import QNewScoreDialog
 from GUI.QScore import QScore
-from GUI.QVersionDownloader import QVersionDownloader
 from GUI.ui_drumburp import Ui_DrumBurpWindow
-from Notation import AsciiExport
-from Notation.lilypond import LilypondScore, LilypondProblem, findLilyPath
 import GUI.DBColourPicker as DBColourPicker
 import GUI.DBIcons as DBIcons
 import GUI.DBMidi as DBMidi
@@ -87,7 +82,17 @@ class DrumBurp(QMainWindow, Ui_DrumBurpWindow):
         self.paperBox.clear()
         self._knownPageHeights = []
         self._exporter = None
-        self.lilyPath = None
+        # Lilypond, the preview scene and the text export are set up the
+        # first time they are needed rather than at startup.
+        self._lilyPath = None
+        self._lilyPathFound = False
+        self._lilyScene = None
+        self._textExportStale = True
+        cacheDir = unicode(QDesktopServices.storageLocation(
+            QDesktopServices.CacheLocation))
+        if not cacheDir:
+            cacheDir = os.path.join(tempfile.gettempdir(), APPNAME)
+        self.lilypondCache = LilypondCache(os.path.join(cacheDir, "lilypond"))
         self.colourScheme = DBColourPicker.ColourScheme()
         printer = QPrinter()
         printer.setOutputFileName("invalid.pdf")
@@ -101,9 +106,7 @@ class DrumBurp(QMainWindow, Ui_DrumBurpWindow):
         self._pageHeight = printer.paperRect().height()
         self.paperBox.blockSignals(False)
         settings = self._makeQSettings()
-        self.lilyPath = settings.value("LilypondPath").toString()
-        if not self.lilyPath or not os.path.exists(self.lilyPath):
-            self.lilyPath = findLilyPath()
+        self._lilyPath = settings.value("LilypondPath").toString()
         self.recentFiles = [unicode(fname) for fname in
                             settings.value("RecentFiles").toStringList()
                             if os.path.exists(unicode(fname))]
@@ -115,8 +118,14 @@ class DrumBurp(QMainWindow, Ui_DrumBurpWindow):
         self.addToRecentFiles()
         self.updateRecentFiles()
         self.songProperties = QDisplayProperties()
-        self._lilyScene = QLilypondPreview(self)
-        self.lilyPreview.setScene(self._lilyScene)
+        self.splitLilypondSections = QCheckBox("By section")
+        self.splitLilypondSections.setToolTip(
+            "Build the sections of the preview in parallel")
+        self.splitLilypondSections.setChecked(
+            settings.value("LilypondSplitSections").toBool())
+        self.horizontalLayout.insertWidget(
+            self.horizontalLayout.indexOf(self.refreshLilypond) + 1,
+            self.splitLilypondSections)
         # Fonts
         fonts = list(FontOptions.FontOptions.iterAllowedFonts())
         fonts.sort()
@@ -155,8 +164,35 @@ class DrumBurp(QMainWindow, Ui_DrumBurpWindow):
         QTimer.singleShot(0, lambda: self._startUp(erroredFiles))
         self.actionCheckOnStartup.setChecked(
             settings.value("CheckOnStartup").toBool())
-        self.statusbar.showMessage("Initializing MIDI...")
-        self.setEnabled(False)
+        # MIDI starts up in the background: only its controls wait for it.
+        self.menu_MIDI.setEnabled(False)
+        self.MIDIToolBar.setEnabled(False)
+
+    @property
+    def lilyPath(self):
+        if not self._lilyPathFound:
+            self._lilyPathFound = True
+            if not self._lilyPath or not os.path.exists(self._lilyPath):
+                from Notation.lilypond import findLilyPath
+                self._lilyPath = findLilyPath()
+        return self._lilyPath
+
+    @lilyPath.setter
+    def lilyPath(self, path):
+        self._lilyPathFound = True
+        self._lilyPath = path
+
+    def _lilypondScene(self):
+        if self._lilyScene is None:
+            from GUI.QLilypondPreview import QLilypondPreview
+            self._lilyScene = QLilypondPreview(self)
+            self.lilyPreview.setScene(self._lilyScene)
+            self.refreshLilypond.clicked.connect(self._lilyScene.preview)
+            self.prevLilyPage.clicked.connect(self._lilyScene.previousPage)
+            self.nextLilyPage.clicked.connect(self._lilyScene.nextPage)
+            self.firstLilyPage.clicked.connect(self._lilyScene.firstPage)
+            self.lastLilyPage.clicked.connect(self._lilyScene.lastPage)
+        return self._lilyScene
 
     def _connectSignals(self, props, scene):
         # Connect signals
@@ -193,7 +229,6 @@ class DrumBurp(QMainWindow, Ui_DrumBurpWindow):
         DBMidi.SONGEND_SIGNAL.connect(self.musicDone)
         DBMidi.HIGHLIGHT_SIGNAL.connect(self.highlightPlayingMeasure)
         self.exporterDone.connect(self._finishLilyExport)
-        self.refreshLilypond.clicked.connect(self._lilyScene.preview)
         self.scoreScene.scoreDisplayChanged.connect(self._refreshTextExport)
         self.underlineCheck.clicked.connect(self._refreshTextExport)
         self.sectionBracketsCheck.clicked.connect(self._refreshTextExport)
@@ -256,10 +291,6 @@ class DrumBurp(QMainWindow, Ui_DrumBurpWindow):
         self.lilyPagesBox.setValue(scene.score.lilypages)
         self.lilyFillButton.setChecked(scene.score.lilyFill)
         self._setLilyFormat(scene.score.lilyFormat)
-        self.prevLilyPage.clicked.connect(self._lilyScene.previousPage)
-        self.nextLilyPage.clicked.connect(self._lilyScene.nextPage)
-        self.firstLilyPage.clicked.connect(self._lilyScene.firstPage)
-        self.lastLilyPage.clicked.connect(self._lilyScene.lastPage)
 
     def _startUp(self, erroredFiles):
         self._midiInitThread.start()
@@ -430,7 +461,9 @@ class DrumBurp(QMainWindow, Ui_DrumBurpWindow):
             settings.setValue("CheckOnStartup",
                               QVariant(self.actionCheckOnStartup.isChecked()))
             settings.setValue("LilypondPath",
-                              QVariant(self.lilyPath))
+                              QVariant(self._lilyPath))
+            settings.setValue("LilypondSplitSections",
+                              QVariant(self.splitLilypondSections.isChecked()))
             self._writeColours(settings)
             self.songProperties.save(settings)
             self._versionThread.exit()
@@ -446,7 +479,8 @@ class DrumBurp(QMainWindow, Ui_DrumBurpWindow):
                 self._exporter.wait(1000)
                 if not self._exporter.isFinished():
                     self._exporter.terminate()
-            self._lilyScene.cleanup()
+            if self._lilyScene is not None:
+                self._lilyScene.cleanup()
         else:
             event.ignore()
 
@@ -501,7 +535,8 @@ class DrumBurp(QMainWindow, Ui_DrumBurpWindow):
             self.updateStatus("Successfully loaded %s" % self.filename)
             self.addToRecentFiles()
             self.updateRecentFiles()
-            self._lilyScene.setNoPreview()
+            if self._lilyScene is not None:
+                self._lilyScene.setNoPreview()
 
     def _getFileName(self):
         directory = self.filename
@@ -535,7 +570,7 @@ class DrumBurp(QMainWindow, Ui_DrumBurpWindow):
         if self.filename is None:
             return True
         fileFormat = self.scoreScene.score.fileFormat
-        if fileFormat is None or fileFormat == CURRENT_FILE_FORMAT:
+        if fileFormat in (None, CURRENT_FILE_FORMAT, DBFF_3):
             return True
         reply = QMessageBox.question(self,
                                      "Backup old file format?",
@@ -593,6 +628,7 @@ class DrumBurp(QMainWindow, Ui_DrumBurpWindow):
 
     @pyqtSignature("")
     def on_actionNew_triggered(self):
+        from GUI.QNewScoreDialog import QNewScoreDialog
         if self.okToContinue():
             counter = self.scoreScene.defaultCount
             registry = self.songProperties.counterRegistry
@@ -667,6 +703,7 @@ class DrumBurp(QMainWindow, Ui_DrumBurpWindow):
         try:
             exportedText = self._getTextExport()
         except StandardError:
+            self._setTextExportEnabled(False)
             QMessageBox.warning(self.parent(), "Text generation failed!",
                                 "Could not generate text tab for this score!")
             raise
@@ -687,6 +724,7 @@ class DrumBurp(QMainWindow, Ui_DrumBurpWindow):
         self._asciiSettings.sectionBrackets = self.sectionBracketsCheck.isChecked()
         self._asciiSettings.emptyLineBeforeSection = self.emptyLineBeforeSectionCheck.isChecked()
         self._asciiSettings.emptyLineAfterSection = self.emptyLineAfterSectionCheck.isChecked()
+        from Notation import AsciiExport
         try:
             asciiBuffer = StringIO()
             exporter = AsciiExport.Exporter(self.scoreScene.score,
@@ -697,15 +735,25 @@ class DrumBurp(QMainWindow, Ui_DrumBurpWindow):
             raise
         return asciiBuffer.getvalue()
 
+    def _setTextExportEnabled(self, enabled):
+        self.actionExportASCII.setEnabled(enabled)
+        self.textExportButton.setEnabled(enabled)
+
     def _refreshTextExport(self):
+        if self.tabWidget.currentWidget() != self.textExportTab:
+            # The preview waits until the tab is shown. The export action
+            # generates its own text and disables itself if that fails,
+            # so an earlier failure must not leave it disabled.
+            self._textExportStale = True
+            self._setTextExportEnabled(True)
+            return
+        self._textExportStale = False
         try:
             self.textExportPreview.setPlainText(self._getTextExport())
-            self.actionExportASCII.setEnabled(True)
-            self.textExportButton.setEnabled(True)
+            self._setTextExportEnabled(True)
         except StandardError:
             self.textExportPreview.setPlainText("Failed to export text tab.")
-            self.actionExportASCII.setEnabled(False)
-            self.textExportButton.setEnabled(False)
+            self._setTextExportEnabled(False)
             raise
 
     @pyqtSignature("")
@@ -748,6 +796,8 @@ class DrumBurp(QMainWindow, Ui_DrumBurpWindow):
 
     @pyqtSignature("")
     def on_actionExportLilypond_triggered(self):
+        from Notation.lilypond import LilypondScore, LilypondProblem
+        from GUI.LilypondExporter import LilypondExporter
         self.checkLilypondPath()
         lilyBuffer = StringIO()
         try:
@@ -791,7 +841,8 @@ class DrumBurp(QMainWindow, Ui_DrumBurpWindow):
                                                   self.scoreScene.score.lilyFormat,
                                                   lambda: self.exporterDone.emit(
                                                       fname),
-                                                  self)
+                                                  self,
+                                                  self.lilypondCache)
                 self.setLilypondControlsEnabled(False)
                 self._exporter.start()
             except StandardError:
@@ -832,6 +883,7 @@ class DrumBurp(QMainWindow, Ui_DrumBurpWindow):
 
     @pyqtSignature("")
     def on_actionAboutDrumBurp_triggered(self):
+        from GUI.DBInfoDialog import DBInfoDialog
         dlg = DBInfoDialog(DB_VERSION, self)
         dlg.exec_()
 
@@ -1135,10 +1187,12 @@ class DrumBurp(QMainWindow, Ui_DrumBurpWindow):
 
     @pyqtSignature("")
     def on_actionCheckForUpdates_triggered(self):
+        from GUI.QVersionDownloader import QVersionDownloader
         dialog = QVersionDownloader(newer=None, parent=self)
         dialog.exec_()
 
     def _finishedVersionCheck(self):
+        from GUI.QVersionDownloader import QVersionDownloader
         newer = self._versionThread.newVersionInfo
         if newer:
             dialog = QVersionDownloader(newer=newer, parent=self)
@@ -1154,7 +1208,6 @@ class DrumBurp(QMainWindow, Ui_DrumBurpWindow):
         self._refreshMidiDevices()
         self.menu_MIDI.setEnabled(DBMidi.HAS_MIDI)
         self.MIDIToolBar.setEnabled(DBMidi.HAS_MIDI)
-        self.setEnabled(True)
 
     @pyqtSignature("")
     def on_actionEditColours_triggered(self):
@@ -1201,10 +1254,13 @@ class DrumBurp(QMainWindow, Ui_DrumBurpWindow):
         elif widget == self.lilypondTab:
             self.availableNotesLabel.setVisible(False)
             self._infoBar.setVisible(False)
+            self._lilypondScene()
             self.checkLilypondPath()
         elif widget == self.textExportTab:
             self.availableNotesLabel.setVisible(False)
             self._infoBar.setVisible(False)
+            if self._textExportStale:
+                self._refreshTextExport()
 
     @pyqtSignature("")
     def on_lilypondPathButton_clicked(self):
@@ -0,0 +1,148 @@
+# Copyright 2017 Michael Thomas
+#
+# See www.whatang.org for more information.
+#
+# This file is part of DrumBurp.
+#
+# DrumBurp is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DrumBurp is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DrumBurp.  If not, see <http://www.gnu.org/licenses/>
+'''
+On-disk cache of Lilypond build results.
+'''
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+def outputSuffixes(stem, lilyFormat):
+    """The suffixes of the files beside stem which Lilypond could have
+    written in lilyFormat."""
+    # Lilypond writes stem.pdf, or stem.png for a single page and
+    # stem-page1.png etc. for several.
+    dirName, baseName = os.path.split(stem)
+    pattern = re.compile(re.escape(baseName) + r"(-page\d+)?\."
+                         + re.escape(lilyFormat) + "$")
+    try:
+        names = os.listdir(dirName or os.curdir)
+    except OSError:
+        return []
+    return [name[len(baseName):] for name in names if pattern.match(name)]
+
+
+class LilypondCache(object):
+    """Keep the files Lilypond made for each distinct source.
+
+    Entries are directories named by a hash of the Lilypond source, the
+    output format and the Lilypond version, holding the output files with
+    their stem removed. The least recently used entries are deleted when
+    the cache grows beyond maxBytes.
+    """
+
+    def __init__(self, directory, maxBytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.maxBytes = maxBytes
+
+    @staticmethod
+    def makeKey(lilyString, lilyFormat, version):
+        digest = hashlib.sha1()
+        digest.update(version.encode('utf-8'))
+        digest.update("\0")
+        digest.update(lilyFormat.encode('utf-8'))
+        digest.update("\0")
+        digest.update(lilyString.encode('utf-8'))
+        return digest.hexdigest()
+
+    def _entry(self, key):
+        return os.path.join(self.directory, key)
+
+    def fetch(self, key, stem, lilyFormat):
+        """Copy the cached output for key to stem.
+
+        Returns the paths of the files copied, which is empty if there was
+        no entry for key.
+        """
+        entry = self._entry(key)
+        try:
+            suffixes = os.listdir(entry)
+            if not suffixes:
+                return []
+            for suffix in suffixes:
+                if not suffix.endswith(os.extsep + lilyFormat):
+                    return []
+            for suffix in suffixes:
+                shutil.copyfile(os.path.join(entry, suffix), stem + suffix)
+            os.utime(entry, None)
+        except (IOError, OSError):
+            return []
+        return [stem + suffix for suffix in suffixes]
+
+    def store(self, key, stem, lilyFormat):
+        """Add the output Lilypond has just written to stem."""
+        entry = self._entry(key)
+        suffixes = outputSuffixes(stem, lilyFormat)
+        if not suffixes or os.path.exists(entry):
+            return
+        try:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            building = tempfile.mkdtemp(prefix="building_",
+                                        dir=self.directory)
+            for suffix in suffixes:
+                shutil.copyfile(stem + suffix,
+                                os.path.join(building, suffix))
+            try:
+                os.rename(building, entry)
+            except OSError:
+                # Another build got there first.
+                shutil.rmtree(building, True)
+        except (IOError, OSError):
+            return
+        self._evict(key)
+
+    def _iterEntries(self):
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return
+        for name in names:
+            path = os.path.join(self.directory, name)
+            if name.startswith("building_") or not os.path.isdir(path):
+                continue
+            try:
+                size = sum(os.path.getsize(os.path.join(path, fileName))
+                           for fileName in os.listdir(path))
+                yield os.path.getmtime(path), name, size
+            except OSError:
+                continue
+
+    def size(self):
+        return sum(entry[2] for entry in self._iterEntries())
+
+    def _evict(self, keep=None):
+        entries = sorted(self._iterEntries())
+        total = sum(entry[2] for entry in entries)
+        for unusedTime, name, size in entries:
+            if total <= self.maxBytes:
+                break
+            if name == keep:
+                continue
+            shutil.rmtree(self._entry(name), True)
+            total -= size
+
+    def clear(self):
+        for unusedTime, name, unusedSize in list(self._iterEntries()):
+            shutil.rmtree(self._entry(name), True)
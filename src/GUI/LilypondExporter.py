@@ -25,9 +25,57 @@ from PyQt4.Qt import QThread
 import subprocess
 import os
 import platform
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
+from GUI.LilypondCache import outputSuffixes
+
+_VERSIONS = {}
+
+
+def _subprocessArgs():
+    kwargs = {}
+    if platform.system() == "Windows":
+        suInfo = subprocess.STARTUPINFO()
+        suInfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+        suInfo.wShowWindow = subprocess.SW_HIDE
+        kwargs['startupinfo'] = suInfo
+    return kwargs
+
+
+def lilypondVersion(lilypondPath):
+    """The first line of lilypond --version, or None if it will not run.
+
+    Remembered for each executable until it is modified.
+    """
+    try:
+        key = (lilypondPath, os.path.getmtime(lilypondPath))
+    except (OSError, UnicodeError):
+        return None
+    if key not in _VERSIONS:
+        try:
+            process = subprocess.Popen([lilypondPath, '--version'],
+                                       stdout=subprocess.PIPE,
+                                       stderr=subprocess.STDOUT,
+                                       **_subprocessArgs())
+            output = process.communicate()[0]
+        except (OSError, ValueError):
+            output = ""
+        lines = output.strip().splitlines()
+        _VERSIONS[key] = lines[0].decode('utf-8', 'replace') if lines else None
+    return _VERSIONS[key]
 
 
 class LilypondExporter(QThread):
+    """Write Lilypond source to a file and run Lilypond on it.
+
+    lilypondString may also be a list of pieces of a score. Each piece is
+    then written to its own numbered .ly file beside outputPath, and the
+    pieces are built by separate Lilypond processes running in parallel.
+
+    Output found in the cache is copied without writing the .ly file, unless
+    writeSource is set, or running Lilypond. outputFiles lists the files
+    made for every piece once the export has succeeded.
+    """
     NOT_STARTED = 0
     STARTED = 1
     WROTE_LY = 2
@@ -35,7 +83,8 @@ class LilypondExporter(QThread):
     ERROR_IN_WRITING_LY = -1
     ERROR_IN_RUNNING_LY = -2
 
-    def __init__(self, lilypondString, outputPath, lilypondPath, lilyFormat, onFinish=None, parent=None):
+    def __init__(self, lilypondString, outputPath, lilypondPath, lilyFormat, onFinish=None, parent=None,
+                 cache=None, writeSource=True):
         super(LilypondExporter, self).__init__(parent=parent)
         self.lilyString = lilypondString
         self._outputPath = outputPath
@@ -44,7 +93,10 @@ class LilypondExporter(QThread):
         self._lilypondPath = unicode(lilypondPath)
         self._format = self._toFormatString(lilyFormat)
         self._status = self.NOT_STARTED
+        self._cache = cache
+        self._writeSource = writeSource
         self.returnCode = 0
+        self.outputFiles = []
 
     def get_status(self):
         return self._status
@@ -63,37 +115,92 @@ class LilypondExporter(QThread):
             lilyFormat = ["pdf", "ps", "png"][lilyFormat]
         return unicode(lilyFormat)
 
+    def _iterJobs(self):
+        if not isinstance(self.lilyString, list):
+            yield self.lilyString, self._outputPath
+            return
+        for index, piece in enumerate(self.lilyString):
+            yield piece, "%s-part%02d.ly" % (self._processedPath, index)
+
+    def _cacheKey(self, lilyString):
+        if self._cache is None:
+            return None
+        version = lilypondVersion(self._lilypondPath)
+        if version is None:
+            return None
+        return self._cache.makeKey(lilyString, self._format, version)
+
+    def _fetch(self, job):
+        unusedString, outputPath, cacheKey = job
+        if cacheKey is None:
+            return []
+        return self._cache.fetch(cacheKey, self._calcProcessedPath(outputPath),
+                                 self._format)
+
+    def _build(self, job):
+        unusedString, outputPath, cacheKey = job
+        processedPath = self._calcProcessedPath(outputPath)
+        # Remove pages left by an earlier build, which may have had more.
+        for suffix in outputSuffixes(processedPath, self._format):
+            try:
+                os.remove(processedPath + suffix)
+            except OSError:
+                pass
+        kwargs = _subprocessArgs()
+        env = os.environ
+        env['LILYPOND_GC_YIELD'] = '100'
+        kwargs['env'] = env
+        returnCode = subprocess.call([self._lilypondPath,
+                                      '-s',
+                                      '-o', processedPath,
+                                      '-f', self._format,
+                                      outputPath],
+                                     **kwargs)
+        if returnCode == 0 and cacheKey is not None:
+            self._cache.store(cacheKey, processedPath, self._format)
+        return returnCode, [processedPath + suffix for suffix in
+                            outputSuffixes(processedPath, self._format)]
+
     def run(self):
         try:
             self._status = self.STARTED
-            with open(self._outputPath, 'w') as handle:
-                try:
-                    handle.write(self.lilyString.encode('utf-8'))
-                except:
-                    self._status = self.ERROR_IN_WRITING_LY
-                    raise
+            jobs = [(lilyString, outputPath, self._cacheKey(lilyString))
+                    for lilyString, outputPath in self._iterJobs()]
+            # Look in the cache before touching the output directory, so a
+            # hit costs nothing but the copy.
+            fetched = [self._fetch(job) for job in jobs]
+            builds = [job for job, files in zip(jobs, fetched) if not files]
+            for lilyString, outputPath, unusedKey in (
+                    jobs if self._writeSource else builds):
+                with open(outputPath, 'w') as handle:
+                    try:
+                        handle.write(lilyString.encode('utf-8'))
+                    except:
+                        self._status = self.ERROR_IN_WRITING_LY
+                        raise
             self._status = self.WROTE_LY
             if self._lilypondPath is not None:
-                kwargs = {}
-                if platform.system() == "Windows":
-                    suInfo = subprocess.STARTUPINFO()
-                    suInfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-                    suInfo.wShowWindow = subprocess.SW_HIDE
-                    kwargs['startupinfo'] = suInfo
-                env = os.environ
-                env['LILYPOND_GC_YIELD'] = '100'
-                kwargs['env'] = env
-                returnCode = subprocess.call([self._lilypondPath,
-                                              '-s',
-                                              '-o', self._processedPath,
-                                              '-f', self._format,
-                                              self._outputPath],
-                                             **kwargs)
-                self.returnCode = returnCode
-                if returnCode == 0:
-                    self._status = self.SUCCESS
+                if len(builds) <= 1:
+                    results = [self._build(job) for job in builds]
                 else:
+                    pool = ThreadPool(min(len(builds), cpu_count()))
+                    try:
+                        results = pool.map(self._build, builds)
+                    finally:
+                        pool.close()
+                results = iter(results)
+                returnCodes = []
+                for files in fetched:
+                    if not files:
+                        returnCode, files = next(results)
+                        returnCodes.append(returnCode)
+                    self.outputFiles.extend(files)
+                failed = [code for code in returnCodes if code != 0]
+                self.returnCode = failed[0] if failed else 0
+                if failed:
                     self._status = self.ERROR_IN_RUNNING_LY
+                else:
+                    self._status = self.SUCCESS
 
         finally:
             if self._onFinish is not None:
@@ -28,11 +28,23 @@ from StringIO import StringIO
 import os.path
 import os
 import glob
+import re
 
-from Notation.lilypond import LilypondScore, LilypondProblem
+from Notation.lilypond import (LilypondScore, LilypondProblem,
+                               iterSectionPieces)
 from GUI.LilypondExporter import LilypondExporter
 
 
+_PAGE_NUMBERS = re.compile(r"(\d+)")
+
+
+def _pageOrder(pngFile):
+    # Order db-part2-page10.png after db-part2-page9.png, and
+    # db-part10.png after db-part9.png.
+    return [int(part) if part.isdigit() else part
+            for part in _PAGE_NUMBERS.split(os.path.basename(pngFile))]
+
+
 class QLilypondPreview(QGraphicsScene):
     buildCompleted = pyqtSignal()
 
@@ -76,17 +88,31 @@ class QLilypondPreview(QGraphicsScene):
     def score(self):
         return self.qscore.score
 
+    def _makeLilypond(self):
+        pieces = [None]
+        if self.mainWindow.splitLilypondSections.isChecked():
+            pieces = list(iterSectionPieces(self.score))
+            if len(pieces) <= 1:
+                pieces = [None]
+        lilyStrings = []
+        for piece in pieces:
+            lilyBuffer = StringIO()
+            LilypondScore(self.score, piece).write(lilyBuffer)
+            lilyStrings.append(lilyBuffer.getvalue())
+        if len(lilyStrings) == 1:
+            return lilyStrings[0]
+        return lilyStrings
+
     def preview(self):
         # Make lilypond score string
         self.mainWindow.checkLilypondPath()
-        lilyBuffer = StringIO()
         try:
-            lyScore = LilypondScore(self.score)
-            lyScore.write(lilyBuffer)
+            lilypond = self._makeLilypond()
         except LilypondProblem, exc:
             QMessageBox.warning(self.parent(), "Lilypond impossible",
                                 "Cannot export Lilypond for this score: %s"
                                 % exc.__doc__)
+            return
         except StandardError, exc:
             QMessageBox.warning(self.parent(), "Export failed!",
                                 "Error generating Lilypond for this score: %s"
@@ -111,13 +137,12 @@ class QLilypondPreview(QGraphicsScene):
         self._pixmap = None
         self.setSceneRect(self._waiting.boundingRect())
         # Send to exporter
-        self._exporter = LilypondExporter(lilyBuffer.getvalue(), fname,
+        self._exporter = LilypondExporter(lilypond, fname,
                                           self.mainWindow.lilyPath, 'png',
                                           self.buildCompleted.emit,
-                                          self.mainWindow)
-        pngFiles = glob.glob(os.path.join(self._tempdir, 'db*.png'))
-        for pngFile in pngFiles:
-            os.unlink(pngFile)
+                                          self.mainWindow,
+                                          self.mainWindow.lilypondCache,
+                                          writeSource=False)
         self._exporter.start()
 
     def _setLilypondControlsEnabled(self, onOff):
@@ -152,8 +177,9 @@ class QLilypondPreview(QGraphicsScene):
             self._setLilypondControlsEnabled(True)
 
     def _readPages(self):
-        pngFiles = glob.glob(os.path.join(self._tempdir, 'db*.png'))
-        pngFiles.sort()
+        # The temporary directory may still hold pages from an earlier
+        # build, so only read the ones the exporter made.
+        pngFiles = sorted(self._exporter.outputFiles, key=_pageOrder)
         self._pages = [QPixmap(pngFile) for pngFile in pngFiles]
         if self._pageIndex is None:
             self._pageIndex = 0
@@ -23,6 +23,8 @@ Created on 5 Jan 2011
 
 '''
 
+import math
+
 from PyQt4 import QtGui, QtCore
 
 from Data.NotePosition import NotePosition
@@ -48,6 +50,77 @@ def _painterSaver(method):
     return wrapper
 
 
+class _GlyphCache(object):
+    """Pre-rendered note heads, one pixmap per font, spacing, colour and
+    device scale.
+
+    Each glyph is stored with the rectangle to draw its pixmap into,
+    relative to the top left corner of the note cell, in item
+    coordinates. The pixmap is rendered at the device scale so that it
+    maps one to one onto device pixels and stays sharp when zoomed in.
+    """
+    _MAX_GLYPHS = 2048
+    _MARGIN = 2
+
+    def __init__(self):
+        self._glyphs = {}
+
+    def glyph(self, text, font, colour, xSpacing, ySpacing, dot, scale):
+        key = (text, font.key(), colour.rgba(), xSpacing, ySpacing, dot,
+               scale)
+        glyph = self._glyphs.get(key)
+        if glyph is None:
+            if len(self._glyphs) >= self._MAX_GLYPHS:
+                self._glyphs.clear()
+            glyph = self._makeGlyph(text, font, colour,
+                                    xSpacing, ySpacing, dot, scale)
+            self._glyphs[key] = glyph
+        return glyph
+
+    def _makeGlyph(self, text, font, colour, xSpacing, ySpacing, dot,
+                   scale):
+        left = top = 0
+        right, bottom = xSpacing, ySpacing
+        if text != DBConstants.EMPTY_NOTE:
+            br = QtGui.QFontMetrics(font).tightBoundingRect(text)
+            textX = (xSpacing - br.width()) / 2
+            textY = (ySpacing - br.height()) / 2 - br.y()
+            left = min(left, textX + br.x())
+            right = max(right, textX + br.x() + br.width())
+            top = min(top, textY + br.y())
+            bottom = max(bottom, textY + br.y() + br.height())
+        left -= self._MARGIN
+        top -= self._MARGIN
+        width = right - left + self._MARGIN
+        height = bottom - top + self._MARGIN
+        pixmap = QtGui.QPixmap(int(math.ceil(width * scale)),
+                               int(math.ceil(height * scale)))
+        pixmap.fill(QtCore.Qt.transparent)
+        painter = QtGui.QPainter(pixmap)
+        try:
+            painter.scale(scale, scale)
+            painter.translate(-left, -top)
+            painter.setPen(QtGui.QPen(colour))
+            painter.setFont(font)
+            if text == DBConstants.EMPTY_NOTE:
+                lineHeight = (ySpacing / 2.0) - 1
+                painter.drawLine(QtCore.QPointF(dot, lineHeight),
+                                 QtCore.QPointF(xSpacing - dot, lineHeight))
+            else:
+                painter.drawText(QtCore.QPointF(textX, textY), text)
+        finally:
+            painter.end()
+        return pixmap, QtCore.QRectF(left, top, pixmap.width() / scale,
+                                     pixmap.height() / scale)
+
+
+_GLYPHS = _GlyphCache()
+
+# Below this many device pixels per note line the notes are too small to
+# read, so measures are drawn as a density bitmap instead.
+_MIN_DETAIL_HEIGHT = 6
+
+
 class QMeasure(QtGui.QGraphicsItem):
     def __init__(self, index, qScore, measure, parent):
         super(QMeasure, self).__init__(parent)
@@ -80,8 +153,12 @@ class QMeasure(QtGui.QGraphicsItem):
         self._potentialHead = None
         self._potentialSet = None
         self.setAcceptsHoverEvents(True)
+        # So that paint gets the exposed rect, and can skip the notes that
+        # a small update does not touch.
+        self.setFlag(QtGui.QGraphicsItem.ItemUsesExtendedStyleOption)
         self._measure = measure
         self._displayCols = 0
+        self._overview = None
         self._setDimensions()
         self._isFirst = False
         self.update()
@@ -94,6 +171,7 @@ class QMeasure(QtGui.QGraphicsItem):
 
     def _setDimensions(self):
         self.prepareGeometryChange()
+        self._overview = None
         if self.isSimile():
             referredMeasure = self._qScore.score.getReferredMeasure(
                 self._measureIndex)
@@ -141,11 +219,16 @@ class QMeasure(QtGui.QGraphicsItem):
         return self._measure.simileDistance > 0
 
     @_painterSaver
-    def _paintNotes(self, painter, xValues):
+    def _paintNotes(self, painter, xValues, columns):
         scheme = self._colourScheme()
         scheme.text.setPainter(painter)
         font = painter.font()
-        fontMetric = QtGui.QFontMetrics(font)
+        fontMetric = None
+        # Round the zoom so that the cache holds a few sizes of each glyph
+        glyphScale = round(painter.worldTransform().m11(), 2)
+        # Printing draws the notes directly, so that they are not rasterised
+        useGlyphs = (glyphScale > 0
+                     and not isinstance(painter.device(), QtGui.QPrinter))
         numLines = self.numLines()
         baseline = self._notesBottom - self._qScore.ySpacing
         lineHeight = baseline + (self._qScore.ySpacing / 2.0) - 1
@@ -163,7 +246,7 @@ class QMeasure(QtGui.QGraphicsItem):
                 simText = left + simText + right
         for drumIndex in xrange(numLines):
             lineIndex = self.lineIndex(drumIndex)
-            for noteTime, x in enumerate(xValues):
+            for noteTime, x in columns:
                 if self.isSimile():
                     if drumIndex == numLines / 2:
                         text = simText[noteTime]
@@ -189,11 +272,22 @@ class QMeasure(QtGui.QGraphicsItem):
                         scheme.potential.setPainter(painter)
                 else:
                     text = self._measure.noteAt(noteTime, lineIndex)
-                if text == DBConstants.EMPTY_NOTE:
+                if useGlyphs:
+                    pixmap, target = _GLYPHS.glyph(text, font,
+                                                   painter.pen().color(),
+                                                   self._qScore.xSpacing,
+                                                   self._qScore.ySpacing,
+                                                   dot, glyphScale)
+                    painter.drawPixmap(target.translated(x, baseline),
+                                       pixmap,
+                                       QtCore.QRectF(pixmap.rect()))
+                elif text == DBConstants.EMPTY_NOTE:
                     painter.drawLine(x + dot, lineHeight,
                                      x + self._qScore.xSpacing - dot,
                                      lineHeight)
                 else:
+                    if fontMetric is None:
+                        fontMetric = QtGui.QFontMetrics(font)
                     br = fontMetric.tightBoundingRect(text)
                     left = x + (self._qScore.xSpacing - br.width()) / 2
                     offset = br.y() - (self._qScore.ySpacing - br.height()) / 2
@@ -227,7 +321,7 @@ class QMeasure(QtGui.QGraphicsItem):
                          self._notesBottom - self._notesTop - 1)
 
     @_painterSaver
-    def _paintBeatCount(self, painter, xValues):
+    def _paintBeatCount(self, painter, columns):
         font = painter.font()
         fontMetric = QtGui.QFontMetrics(font)
         baseline = self._notesBottom
@@ -236,8 +330,10 @@ class QMeasure(QtGui.QGraphicsItem):
                        xrange(self._displayCols)]
         else:
             counter = self._measure.count()
-        for noteTime, count in enumerate(counter):
-            x = xValues[noteTime]
+        for noteTime, x in columns:
+            if noteTime >= len(counter):
+                break
+            count = counter[noteTime]
             br = fontMetric.tightBoundingRect(count)
             left = x + (self._qScore.xSpacing - br.width()) / 2
             offset = br.y() - (self._qScore.ySpacing - br.height()) / 2
@@ -304,10 +400,13 @@ class QMeasure(QtGui.QGraphicsItem):
         scheme.selectedMeasure.setPainter(painter)
         painter.drawRect(self._rect)
 
-    def _paintSticking(self, painter, sticking, baseline, xValues):
+    def _paintSticking(self, painter, sticking, baseline, columns):
         font = painter.font()
         fontMetric = QtGui.QFontMetrics(font)
-        for text, x in zip(sticking, xValues):
+        for noteTime, x in columns:
+            if noteTime >= len(sticking):
+                break
+            text = sticking[noteTime]
             if text == " ":
                 pass
             else:
@@ -324,7 +423,7 @@ class QMeasure(QtGui.QGraphicsItem):
         painter.drawRect(stickingRect)
 
     @_painterSaver
-    def _paintStickingAbove(self, painter, xValues):
+    def _paintStickingAbove(self, painter, columns):
         if not self.parentItem().showStickingAbove():
             self._stickingAbove = None
             return
@@ -339,10 +438,10 @@ class QMeasure(QtGui.QGraphicsItem):
         if self._showStickingHighlight:
             self._paintStickingHighlight(painter, self._stickingAbove)
         self._paintSticking(painter, sticking,
-                            baseline - self._qScore.ySpacing, xValues)
+                            baseline - self._qScore.ySpacing, columns)
 
     @_painterSaver
-    def _paintStickingBelow(self, painter, xValues):
+    def _paintStickingBelow(self, painter, columns):
         if not self.parentItem().showStickingBelow():
             self._stickingBelow = None
             return
@@ -355,7 +454,7 @@ class QMeasure(QtGui.QGraphicsItem):
         if self._showStickingHighlight:
             self._paintStickingHighlight(painter, self._stickingBelow)
         self._paintSticking(painter, sticking,
-                            self._height - self._qScore.ySpacing, xValues)
+                            self._height - self._qScore.ySpacing, columns)
 
     @_painterSaver
     def _paintNewBpm(self, painter):
@@ -368,10 +467,55 @@ class QMeasure(QtGui.QGraphicsItem):
             textWidth, self._props.bpmHeight()))
         self._bpmRect.moveTopLeft(QtCore.QPointF(1, self._bpmBase))
 
+    def _makeOverview(self, colour):
+        """One pixel per note cell, set where there is a note."""
+        numLines = self.numLines()
+        image = QtGui.QImage(max(1, self._displayCols), max(1, numLines),
+                             QtGui.QImage.Format_ARGB32)
+        image.fill(QtGui.QColor(QtCore.Qt.transparent).rgba())
+        rgba = colour.rgba()
+        if self.isSimile():
+            for noteTime in xrange(self._displayCols):
+                image.setPixel(noteTime, numLines / 2, rgba)
+        else:
+            rows = dict((self.lineIndex(row), numLines - 1 - row)
+                        for row in xrange(numLines))
+            notes = self._measure.iterNotesRaw()
+            for noteTime, drumIndex, unusedHead in notes:
+                row = rows.get(drumIndex)
+                if row is not None and noteTime < self._displayCols:
+                    image.setPixel(noteTime, row, rgba)
+        return QtGui.QPixmap.fromImage(image)
+
+    @_painterSaver
+    def _paintOverview(self, painter):
+        scheme = self._colourScheme()
+        scheme.text.setPainter(painter)
+        colour = painter.pen().color()
+        if self._overview is None or self._overview[0] != colour.rgba():
+            self._overview = (colour.rgba(), self._makeOverview(colour))
+        pixmap = self._overview[1]
+        target = QtCore.QRectF(0, self._notesTop,
+                               self._displayCols * self._qScore.xSpacing,
+                               self._notesBottom - self._notesTop)
+        painter.setRenderHint(QtGui.QPainter.SmoothPixmapTransform, False)
+        painter.drawPixmap(target, pixmap, QtCore.QRectF(pixmap.rect()))
+
+    def _isReadable(self, painter, option):
+        if isinstance(painter.device(), QtGui.QPrinter):
+            return True
+        lod = option.levelOfDetailFromTransform(painter.worldTransform())
+        return lod * self._qScore.ySpacing >= _MIN_DETAIL_HEIGHT
+
     @_painterSaver
-    def paint(self, painter, dummyOption, dummyWidget=None):
+    def paint(self, painter, option, dummyWidget=None):
         if self._dragHighlight:
             self._paintDragHighlight(painter)
+        if not self._isReadable(painter, option):
+            self._paintOverview(painter)
+            if self._playing or self._nextToPlay:
+                self._paintPlayingHighlight(painter)
+            return
         self._colourScheme().text.setPainter(painter)
         font = self._props.noteFont
         if font is None:
@@ -379,15 +523,21 @@ class QMeasure(QtGui.QGraphicsItem):
         painter.setFont(font)
         xValues = [noteTime * self._qScore.xSpacing
                    for noteTime in xrange(self._displayCols)]
+        # Only the columns in, or next to, the exposed rect need drawing.
+        xSpacing = self._qScore.xSpacing
+        exposed = option.exposedRect
+        columns = [(noteTime, x) for noteTime, x in enumerate(xValues)
+                   if (exposed.left() - xSpacing <= x
+                       <= exposed.right() + xSpacing)]
         if not self.isSimile() and self._highlight:
             self._paintHighlight(painter, xValues)
-        self._paintNotes(painter, xValues)
+        self._paintNotes(painter, xValues, columns)
         if self._measure.newBpm != 0:
             self._paintNewBpm(painter)
         else:
             self._bpmRect = None
         if self._props.beatCountVisible:
-            self._paintBeatCount(painter, xValues)
+            self._paintBeatCount(painter, columns)
         if self._props.measureCountsVisible and self._isFirst:
             self._paintMeasureCount(painter)
         if self._measure.isRepeatEnd() and self._measure.repeatCount > 2:
@@ -402,14 +552,21 @@ class QMeasure(QtGui.QGraphicsItem):
             self._alternate = None
         # Sticking
         if not self.isSimile():
-            self._paintStickingAbove(painter, xValues)
-            self._paintStickingBelow(painter, xValues)
+            self._paintStickingAbove(painter, columns)
+            self._paintStickingBelow(painter, columns)
 
     def dataChanged(self, notePosition_):
         self._setDimensions()
         self.update()
         self.parentItem().placeMeasures()
 
+    def measureIndexChanged(self):
+        measureIndex = self._qScore.score.measurePositionToIndex(
+            self.measurePosition())
+        if measureIndex != self._measureIndex:
+            self._measureIndex = measureIndex
+            self.update()
+
     def xSpacingChanged(self):
         self._setDimensions()
         self.update()
@@ -463,24 +620,50 @@ class QMeasure(QtGui.QGraphicsItem):
     def _getNoteTime(self, point):
         return int(point.x() / self._qScore.xSpacing)
 
+    def _columnRect(self, noteTime):
+        # Everything the highlight at noteTime can change, with half a cell
+        # either side for note heads wider than their cell.
+        xSpacing = self._qScore.xSpacing
+        return QtCore.QRectF((noteTime - 0.5) * xSpacing, 0,
+                             2 * xSpacing, self._height)
+
+    def _lineRect(self, drumIndex):
+        for row in xrange(self.numLines()):
+            if self.lineIndex(row) == drumIndex:
+                ySpacing = self._qScore.ySpacing
+                top = self._notesBottom - (row + 1) * ySpacing
+                return QtCore.QRectF(0, top, self._width, ySpacing)
+        return None
+
+    def _setHighlight(self, highlight):
+        if highlight == self._highlight:
+            return
+        if self._highlight is not None:
+            self.update(self._columnRect(self._highlight[0]))
+        self._highlight = highlight
+        if highlight is not None:
+            self.update(self._columnRect(highlight[0]))
+
+    def _updateStickingRects(self):
+        for rect in (self._stickingAbove, self._stickingBelow):
+            if rect is not None:
+                self.update(rect)
+
     def _hovering(self, event):
         point = self.mapFromScene(event.scenePos())
         noteTime, lineIndex = self._getMouseCoords(point)
         # Set line & time highlights
         if self._isOverNotes(lineIndex):
             if (noteTime, lineIndex) != self._highlight:
-                self._highlight = noteTime, lineIndex
-                self.update()
+                self._setHighlight((noteTime, lineIndex))
                 self.parentItem().setLineHighlight(lineIndex)
                 realIndex = self.parentItem().lineIndex(lineIndex)
                 self._qScore.setCurrentHeads(realIndex)
         elif self._isOverStickingAbove(point) or self._isOverStickingBelow(point):
-            self._highlight = noteTime, None
-            self.update()
+            self._setHighlight((noteTime, None))
         elif self._highlight != None:
-            self._highlight = None
+            self._setHighlight(None)
             self.parentItem().clearHighlight()
-            self.update()
         # Set status message and cursor
         if self._isOverStickingAbove(point) or self._isOverStickingBelow(point):
             self._qScore.setStatusMessage("Click to rotate sticking.")
@@ -517,6 +700,7 @@ class QMeasure(QtGui.QGraphicsItem):
     def hoverEnterEvent(self, event):
         self._hovering(event)
         self._showStickingHighlight = True
+        self._updateStickingRects()
         event.accept()
 
     def hoverMoveEvent(self, event):
@@ -524,9 +708,9 @@ class QMeasure(QtGui.QGraphicsItem):
         event.accept()
 
     def hoverLeaveEvent(self, event):
-        self._highlight = None
+        self._setHighlight(None)
         self._showStickingHighlight = False
-        self.update()
+        self._updateStickingRects()
         self.parentItem().clearHighlight()
         self._qScore.setCurrentHeads(None)
         self.setCursor(QtCore.Qt.ArrowCursor)
@@ -642,6 +826,7 @@ class QMeasure(QtGui.QGraphicsItem):
         return self._measure.alternateText
 
     def setPotentials(self, notes=None, head=None):
+        oldDrum = self._potentialDrum
         if notes is None:
             newNotes = []
             self._potentialDrum = None
@@ -649,10 +834,15 @@ class QMeasure(QtGui.QGraphicsItem):
             newNotes = [np.noteTime for np in notes]
             self._potentialDrum = notes[0].drumIndex
         if newNotes != self._potentials:
+            oldRect = self._lineRect(oldDrum)
+            if oldRect is not None:
+                self.update(oldRect)
             self._potentials = newNotes
             self._potentialSet = set(self._potentials)
             self._potentialHead = head
-            self.update()
+            newRect = self._lineRect(self._potentialDrum)
+            if newRect is not None:
+                self.update(newRect)
 
     def setSticking(self, point, above):
         noteTime = self._getNoteTime(point)
@@ -49,6 +49,9 @@ class QMeasureLine(QtGui.QGraphicsItem):
     def boundingRect(self):
         return self._rect
 
+    def setStaffIndex(self, staffIndex):
+        self._staffIndex = staffIndex
+
     def _setPainter(self):
         self._painter = PAINTER_FACTORY(self._lastMeasure, self._nextMeasure)
 
@@ -23,13 +23,14 @@ Created on 4 Jan 2011
 
 '''
 
+import bisect
 import functools
 import itertools
 
 from PyQt4 import QtGui, QtCore
 from PyQt4.QtGui import QGraphicsItem
 
-from Data import DBErrors
+from Data import DBConstants, DBErrors
 from Data.NotePosition import NotePosition
 from Data.ScoreFactory import ScoreFactory
 from Data.ScoreSerializer import ScoreSerializer
@@ -45,14 +46,17 @@ from GUI.DBCommands import (MetaDataCommand, ScoreWidthCommand,
                             CheckUndo, SetLilypondFormatCommand)
 from GUI.DBFSM import DBStateMachine, Waiting
 from GUI.DBFSMEvents import Escape
-from GUI.QEditKitDialog import QEditKitDialog
 from GUI.QKitData import QKitData
 from GUI.QMeasure import QMeasure
 from GUI.QMetaData import QMetaData
 from GUI.QSection import QSection
-from GUI.QStaff import QStaff
+from GUI.QStaff import QStaff, measureColumns
 import GUI.DBMidi as DBMidi
 
+# Staffs within this distance of the visible part of the score, or a
+# screen height if that is more, are kept realized.
+_VIRTUAL_MARGIN = 600
+
 
 class DragSelection(object):
     def __init__(self, qscore):
@@ -132,8 +136,10 @@ class DragSelection(object):
         self._dragged = newDragged
 
     def _setDragHighlight(self, position, onOff):
-        qmeasure = self.qscore.getQMeasure(position)
-        qmeasure.setDragHighlight(onOff)
+        # Unrealized staffs pick up the selection when they are realized.
+        qmeasure = self.qscore.realizedQMeasure(position)
+        if qmeasure is not None:
+            qmeasure.setDragHighlight(onOff)
 
 
 class _HeadShortcut(object):
@@ -226,6 +232,13 @@ class QScore(QtGui.QGraphicsScene):
         super(QScore, self).__init__(parent)
         self._scale = 1
         self._qStaffs = []
+        self._staffSignatures = []
+        self._staffTops = []
+        self._staffBottoms = []
+        self._realizedStaffs = []
+        self._visibleRect = QtCore.QRectF()
+        self._virtual = True
+        self._builtState = None
         self._qSections = []
         self._properties = parent.songProperties
         self._score = None
@@ -464,20 +477,87 @@ class QScore(QtGui.QGraphicsScene):
 
     def _build(self):
         self._clearStaffs()
+        self._score.popChangedStaffs()
         for staff in self._score.iterStaffs():
             self._addStaff(staff)
         for title in self._score.iterSections():
             self._addSection(title)
+        self._builtState = self._viewState()
         self.placeStaffs()
         self.invalidate()
 
+    def _viewState(self):
+        return (self.scale, self._score.drumKit, len(self._score.drumKit),
+                self._properties.emptyLinesVisible,
+                self._properties.beatCountVisible,
+                self._properties.measureCountsVisible)
+
+    def _staffSignature(self, staffIndex):
+        staff = self._score.getStaffByIndex(staffIndex)
+        return tuple((id(measure), measure.digest(), width)
+                     for measure, width in
+                     zip(staff, measureColumns(self._score, staffIndex)))
+
+    def _makeQStaff(self, staffIndex):
+        return QStaff(self._score.getStaffByIndex(staffIndex), staffIndex,
+                      self, realize=False)
+
+    def _replaceStaff(self, staffIndex):
+        self.removeItem(self._qStaffs[staffIndex])
+        self._qStaffs[staffIndex] = self._makeQStaff(staffIndex)
+        self._staffSignatures[staffIndex] = self._staffSignature(staffIndex)
+
+    def _updateStaffs(self):
+        """Rebuild only the staffs changed since the last build.
+
+        The staffs replaced by the last formatScore are rebuilt, as is
+        any other staff whose measures have changed. The staffs below
+        are renumbered and moved, but their graphics items are kept.
+        Signatures are only recomputed for staffs the Score reports as
+        changed; the rest reuse their cached ones.
+        """
+        first, oldEnd, newEnd = self._score.changedStaffRange()
+        changed = self._score.popChangedStaffs()
+        numStaffs = self._score.numStaffs()
+        if (self._builtState != self._viewState()
+                or oldEnd > len(self._qStaffs)
+                or len(self._qStaffs) - oldEnd != numStaffs - newEnd):
+            self._build()
+            return
+        for qStaff in self._qStaffs[first:oldEnd]:
+            self.removeItem(qStaff)
+        self._qStaffs[first:oldEnd] = [self._makeQStaff(staffIndex)
+                                       for staffIndex in xrange(first, newEnd)]
+        self._staffSignatures[first:oldEnd] = [
+            self._staffSignature(staffIndex)
+            for staffIndex in xrange(first, newEnd)]
+        dirty = set(xrange(first, newEnd))
+        for staffIndex in xrange(numStaffs):
+            if staffIndex in dirty:
+                continue
+            staff = self._score.getStaffByIndex(staffIndex)
+            if (self._qStaffs[staffIndex].staff() is not staff or
+                    (staff in changed and
+                     self._staffSignatures[staffIndex] !=
+                     self._staffSignature(staffIndex))):
+                self._replaceStaff(staffIndex)
+                dirty.add(staffIndex)
+            elif staffIndex >= newEnd:
+                self._qStaffs[staffIndex].setIndex(staffIndex)
+        for qSection in self._qSections:
+            self.removeItem(qSection)
+        self._qSections = []
+        for title in self._score.iterSections():
+            self._addSection(title)
+        self.placeStaffs(dirty=dirty)
+
     scoreDisplayChanged = QtCore.pyqtSignal()
 
     @delayCall
     def reBuild(self, afterwards=None):
         if self._score.formatScore(None):
             self.scoreDisplayChanged.emit()
-        self._build()
+        self._updateStaffs()
         if afterwards:
             afterwards()
 
@@ -493,13 +573,66 @@ class QScore(QtGui.QGraphicsScene):
         for qStaff in self._qStaffs:
             self.removeItem(qStaff)
         self._qStaffs = []
+        self._staffSignatures = []
+        self._realizedStaffs = []
         for qSection in self._qSections:
             self.removeItem(qSection)
         self._qSections = []
 
     def _addStaff(self, staff):
-        qStaff = QStaff(staff, len(self._qStaffs), self)
+        qStaff = QStaff(staff, len(self._qStaffs), self, realize=False)
         self._qStaffs.append(qStaff)
+        self._staffSignatures.append(
+            self._staffSignature(len(self._qStaffs) - 1))
+
+    def setVisibleRect(self, rect):
+        """Tell the scene which part of it the view is showing."""
+        self._visibleRect = QtCore.QRectF(rect)
+        self._updateRealized()
+
+    def setVirtual(self, onOff):
+        """Turn off to realize every staff, e.g. for printing."""
+        self._virtual = onOff
+        self._updateRealized()
+
+    def _updateRealized(self):
+        """Realize the staffs near the visible rect, and unrealize the
+        rest."""
+        if self._virtual:
+            rect = self._visibleRect
+            margin = max(_VIRTUAL_MARGIN, rect.height())
+            first = bisect.bisect_left(self._staffBottoms, rect.top() - margin)
+            last = bisect.bisect_right(self._staffTops,
+                                       rect.bottom() + margin)
+            wanted = self._qStaffs[first:last]
+        else:
+            wanted = self._qStaffs
+        wantedIds = set(id(qStaff) for qStaff in wanted)
+        kept = []
+        for qStaff in self._realizedStaffs:
+            if qStaff.scene() is not self:
+                continue
+            if id(qStaff) in wantedIds or qStaff.isGrabbingMouse():
+                kept.append(qStaff)
+            else:
+                qStaff.unrealize()
+        self._realizedStaffs = kept
+        for qStaff in wanted:
+            qStaff.realize()
+
+    def staffRealized(self, qStaff):
+        """Called by a staff when it is realized: remember it so it can
+        be unrealized later, and reapply the playing and selection
+        highlights to its measures."""
+        self._realizedStaffs.append(qStaff)
+        for qMeasure in qStaff.iterQMeasures():
+            np = qMeasure.measurePosition()
+            if self.inDragSelection(np):
+                qMeasure.setDragHighlight(True)
+            if np == self._playingMeasure:
+                qMeasure.setPlaying(True)
+            if np == self._nextMeasure:
+                qMeasure.setNextToPlay(True)
 
     def _addSection(self, title):
         qSection = QSection(title, qScore=self)
@@ -524,7 +657,8 @@ class QScore(QtGui.QGraphicsScene):
         return self._score.defaultCount
 
     def _setdefaultCount(self, newCount):
-        if newCount != self._score.defaultCount:
+        newCount = newCount.interned()
+        if newCount is not self._score.defaultCount:
             command = SetDefaultCountCommand(self, newCount)
             self.addCommand(command)
     defaultCount = property(_getdefaultCount,
@@ -539,7 +673,7 @@ class QScore(QtGui.QGraphicsScene):
             self.addCommand(command)
     systemSpacing = property(_getsystemSpacing, _setsystemSpacing)
 
-    def placeStaffs(self, staffCall=QStaff.placeMeasures):
+    def placeStaffs(self, staffCall=QStaff.placeMeasures, dirty=None):
         xMargins = self.xMargins
         yMargins = self.yMargins
         lineSpacing = self.lineSpacing
@@ -552,7 +686,9 @@ class QScore(QtGui.QGraphicsScene):
         newSection = True
         sectionIndex = 0
         maxWidth = 0
-        for qStaff in self:
+        self._staffTops = []
+        self._staffBottoms = []
+        for staffIndex, qStaff in enumerate(self):
             if newSection:
                 newSection = False
                 if sectionIndex < len(self._qSections):
@@ -562,14 +698,19 @@ class QScore(QtGui.QGraphicsScene):
                     yOffset += qSection.boundingRect().height()
             newSection = qStaff.isSectionEnd()
             qStaff.setPos(xMargins, yOffset)
-            if staffCall is not None:
+            if staffCall is not None and (dirty is None or
+                                          staffIndex in dirty):
                 staffCall(qStaff)
-            yOffset += qStaff.height() + lineSpacing
+            self._staffTops.append(yOffset)
+            yOffset += qStaff.height()
+            self._staffBottoms.append(yOffset)
+            yOffset += lineSpacing
             maxWidth = max(maxWidth, qStaff.width())
             newSection = qStaff.isSectionEnd()
         self.setSceneRect(0, 0,
                           maxWidth + 2 * xMargins,
                           yOffset - lineSpacing + yMargins)
+        self._updateRealized()
         self.sceneFormatted.emit()
 
     def xSpacingChanged(self):
@@ -768,8 +909,12 @@ class QScore(QtGui.QGraphicsScene):
         return True
 
     def saveScore(self, filename):
+        if self._score.fileFormat == DBConstants.DBFF_3:
+            version = DBConstants.DBFF_3
+        else:
+            version = DBConstants.CURRENT_FILE_FORMAT
         try:
-            ScoreSerializer.saveScore(self._score, filename)
+            ScoreSerializer.saveScore(self._score, filename, version)
         except StandardError, exc:
             msg = "Error saving DrumBurp file: %s" % unicode(exc)
             QtGui.QMessageBox.warning(self.parent(),
@@ -818,6 +963,8 @@ class QScore(QtGui.QGraphicsScene):
         fm = QtGui.QFontMetrics(painter.font())
         self._kitData.setRect(fm)
         painter.restore()
+        # Every staff is rendered, so they all need their items.
+        self._virtual = False
         self.scale = printerDpi / scoreView.logicalDpiX()
         painter.save()
         painter.setFont(self._properties.sectionFont)
@@ -848,6 +995,7 @@ class QScore(QtGui.QGraphicsScene):
         painter.end()
         self._metaData.setRect()
         self._kitData.setRect()
+        self._virtual = True
         self.scale = 1
 
     def setLilypondSize(self, size):
@@ -899,6 +1047,14 @@ class QScore(QtGui.QGraphicsScene):
     def getQMeasure(self, position):
         return self._qStaffs[position.staffIndex].getQMeasure(position)
 
+    def realizedQMeasure(self, position):
+        """The QMeasure at position, or None if its staff is not
+        realized."""
+        qStaff = self._qStaffs[position.staffIndex]
+        if qStaff.isRealized():
+            return qStaff.getQMeasure(position)
+        return None
+
     def getQStaff(self, position):
         return self._qStaffs[position.staffIndex]
 
@@ -906,8 +1062,9 @@ class QScore(QtGui.QGraphicsScene):
         if position == self._playingMeasure:
             return
         if self._playingMeasure != None:
-            qMeasure = self.getQMeasure(self._playingMeasure)
-            qMeasure.setPlaying(False)
+            qMeasure = self.realizedQMeasure(self._playingMeasure)
+            if qMeasure is not None:
+                qMeasure.setPlaying(False)
         self._playingMeasure = position
         if self._playingMeasure == None:
             return
@@ -918,8 +1075,9 @@ class QScore(QtGui.QGraphicsScene):
         if position == self._nextMeasure:
             return
         if self._nextMeasure != None:
-            qMeasure = self.getQMeasure(self._nextMeasure)
-            qMeasure.setNextToPlay(False)
+            qMeasure = self.realizedQMeasure(self._nextMeasure)
+            if qMeasure is not None:
+                qMeasure.setNextToPlay(False)
         self._nextMeasure = position
         if self._nextMeasure == None:
             return
@@ -927,6 +1085,7 @@ class QScore(QtGui.QGraphicsScene):
         qMeasure.setNextToPlay(True)
 
     def editKit(self):
+        from GUI.QEditKitDialog import QEditKitDialog
         emptyDrums = set(self.score.drumKit)
         for staffIndex in xrange(self.score.numStaffs()):
             lines = set(self.score.iterVisibleLines(staffIndex, True))
@@ -1002,9 +1161,10 @@ class QScore(QtGui.QGraphicsScene):
                                                              np.measureIndex)))
         for measure in self._potentials:
             if measure not in notesByMeasures:
-                qmeasure = self.getQMeasure(NotePosition(measure[0],
-                                                         measure[1]))
-                qmeasure.setPotentials()
+                qmeasure = self.realizedQMeasure(NotePosition(measure[0],
+                                                              measure[1]))
+                if qmeasure is not None:
+                    qmeasure.setPotentials()
         for measure in newMeasures:
             qmeasure = self.getQMeasure(NotePosition(measure[0], measure[1]))
             notes = notesByMeasures[measure]
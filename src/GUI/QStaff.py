@@ -31,8 +31,31 @@ from GUI.QLineLabel import QLineLabel
 from Data.NotePosition import NotePosition
 
 
+def measureColumns(score, staffIndex):
+    """The number of columns each measure of a staff is drawn with."""
+    measureIndex = score.measurePositionToIndex(
+        NotePosition(staffIndex=staffIndex, measureIndex=0))
+    columns = []
+    for measure in score.getStaffByIndex(staffIndex):
+        if measure.simileDistance > 0:
+            referredMeasure = score.getReferredMeasure(measureIndex)
+            columns.append(referredMeasure.counter.numBeats())
+        else:
+            columns.append(len(measure))
+        measureIndex += 1
+    return columns
+
+
 class QStaff(QtGui.QGraphicsItemGroup):
-    def __init__(self, staff, index, scene, qScore=None):
+    """The graphics items for one staff of the score.
+
+    A staff starts out unrealized: an empty placeholder that only knows
+    its size. realize() creates the labels, measures and measure lines,
+    and unrealize() throws them away again, so the scene only needs items
+    for the staffs near the part of the score being looked at.
+    """
+
+    def __init__(self, staff, index, scene, qScore=None, realize=True):
         super(QStaff, self).__init__(scene=scene)
         self._qScore = qScore if qScore is not None else scene
         self._props = self._qScore.displayProperties
@@ -45,8 +68,11 @@ class QStaff(QtGui.QGraphicsItemGroup):
         self._width = 0
         self._height = 0
         self._hasAlternate = False
+        self._realized = False
         self._setStaff(staff)
         self.setHandlesChildEvents(False)
+        if realize:
+            self.realize()
 
     def numLines(self):
         if self._props.emptyLinesVisible:
@@ -70,12 +96,77 @@ class QStaff(QtGui.QGraphicsItemGroup):
     def _setStaff(self, staff):
         if staff != self._staff:
             self._staff = staff
-            self._build()
+            self._hasAlternate = self._needsAlternate()
+            if self._realized:
+                self._build()
+
+    def isRealized(self):
+        return self._realized
+
+    def realize(self):
+        if self._realized:
+            return
+        self._realized = True
+        self._build()
+        self.placeMeasures()
+        self._qScore.staffRealized(self)
+
+    def unrealize(self):
+        if not self._realized:
+            return
+        self._clear()
+        self._highlightedLine = None
+        self._realized = False
+
+    def isGrabbingMouse(self):
+        grabber = self.scene().mouseGrabberItem()
+        return grabber is not None and grabber.parentItem() is self
+
+    def _placeholderSize(self):
+        # Must agree with the sizes QMeasure and QMeasureLine give
+        # themselves, so realizing a staff does not move the others.
+        xSpacing = self._qScore.xSpacing
+        ySpacing = self._qScore.ySpacing
+        columns = measureColumns(self._qScore.score, self._index)
+        self._width = ((2 * xSpacing + 2) + xSpacing * (len(columns) + 1)
+                       + xSpacing * sum(columns))
+        height = self.alternateHeight()
+        if self.anyMeasureHasBpm():
+            height += self._props.bpmHeight()
+        if self._props.measureCountsVisible:
+            height += self._props.measureCountHeight()
+        if self.showStickingAbove():
+            height += ySpacing
+        height += self.numLines() * ySpacing
+        if self._props.beatCountVisible:
+            height += ySpacing
+        if self.showStickingBelow():
+            height += ySpacing
+        self._height = height
+
+    def staff(self):
+        return self._staff
+
+    def setIndex(self, index):
+        self._index = index
+        if not self._realized:
+            return
+        for qMeasureLine in self._measureLines:
+            qMeasureLine.setStaffIndex(index)
+        for qMeasure in self._measures:
+            qMeasure.measureIndexChanged()
 
     def isSectionEnd(self):
         return self._staff.isSectionEnd()
 
     def _clear(self):
+        scene = self.scene()
+        for item in itertools.chain(self._lineLabels, self._measures,
+                                    self._measureLines):
+            if scene is not None:
+                scene.removeItem(item)
+            else:
+                item.setParentItem(None)
         self._lineLabels = []
         self._measures = []
         self._measureLines = []
@@ -87,11 +178,7 @@ class QStaff(QtGui.QGraphicsItemGroup):
             iterable = self._qScore.score.iterVisibleLines(self._index)
         for drum in iterable:
             self._addLineLabel(drum)
-        for measure in self._staff:
-            if (not self._hasAlternate and
-                (measure.alternateText or
-                 (measure.isRepeatEnd() and measure.repeatCount > 2))):
-                self._hasAlternate = True
+        self._hasAlternate = self._needsAlternate()
         lastMeasure = None
         for measure in self._staff:
             self._addMeasureLine(lastMeasure, measure)
@@ -124,6 +211,9 @@ class QStaff(QtGui.QGraphicsItemGroup):
         self.addToGroup(qMeasureLine)
 
     def placeMeasures(self):
+        if not self._realized:
+            self._placeholderSize()
+            return
         lineOffsets = self._qScore.lineOffsets
         xOffset = 0
         base = self.alternateHeight()
@@ -157,6 +247,9 @@ class QStaff(QtGui.QGraphicsItemGroup):
                            itertools.chain(self._measures, self._measureLines))
 
     def xSpacingChanged(self):
+        if not self._realized:
+            self._placeholderSize()
+            return
         xOffset = self._lineLabels[0].cellWidth()
         for label in self._lineLabels:
             label.xSpacingChanged()
@@ -173,6 +266,9 @@ class QStaff(QtGui.QGraphicsItemGroup):
         self._width = xOffset + self._measureLines[-1].width()
 
     def ySpacingChanged(self):
+        if not self._realized:
+            self._placeholderSize()
+            return
         lineOffsets = self._qScore.lineOffsets
         base = self.alternateHeight()
         if self.anyMeasureHasBpm():
@@ -195,7 +291,7 @@ class QStaff(QtGui.QGraphicsItemGroup):
                            itertools.chain(self._measures, self._measureLines))
 
     def clearHighlight(self):
-        if self._highlightedLine != None:
+        if self._highlightedLine != None and self._realized:
             self._lineLabels[self._highlightedLine].setHighlight(False)
         self._highlightedLine = None
 
@@ -207,6 +303,9 @@ class QStaff(QtGui.QGraphicsItemGroup):
             self._lineLabels[self._highlightedLine].setHighlight(True)
 
     def dataChanged(self, notePosition):
+        if not self._realized:
+            # Built from the new data when it is next realized.
+            return
         if notePosition.measureIndex is not None and notePosition.measureIndex < self.numMeasures():
             measure = self._measures[notePosition.measureIndex]
             measure.dataChanged(notePosition)
@@ -222,14 +321,19 @@ class QStaff(QtGui.QGraphicsItemGroup):
         return np
 
     def setHighlight(self, np, onOff):
+        self.realize()
         lineLabel = self._lineLabels[np.drumIndex]
         lineLabel.setHighlight(onOff)
         qMeasure = self._measures[np.measureIndex]
         qMeasure.setHighlight(np, onOff)
 
     def getQMeasure(self, np):
+        self.realize()
         return self._measures[np.measureIndex]
 
+    def iterQMeasures(self):
+        return iter(self._measures)
+
     def alternateHeight(self):
         if self._hasAlternate:
             return self._props.alternateHeight()
@@ -245,11 +349,10 @@ class QStaff(QtGui.QGraphicsItemGroup):
     def showStickingBelow(self):
         return any(measure.showBelow for measure in self._staff)
 
+    def _needsAlternate(self):
+        return any(measure.alternateText or
+                   (measure.isRepeatEnd() and measure.repeatCount > 2)
+                   for measure in self._staff)
+
     def checkAlternate(self):
-        newAlternate = False
-        for measure in self._staff:
-            if (measure.alternateText or
-                    (measure.isRepeatEnd() and measure.repeatCount > 2)):
-                newAlternate = True
-                break
-        return self._hasAlternate != newAlternate
+        return self._hasAlternate != self._needsAlternate()
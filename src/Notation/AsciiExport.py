@@ -22,7 +22,6 @@ Created on Dec 15, 2012
 @author: Mike Thomas
 '''
 
-from StringIO import StringIO
 import time
 
 from Data.DBConstants import (REPEAT_EXTENDER, BARLINE, DRUM_ABBR_WIDTH,
@@ -72,12 +71,12 @@ class Exporter(object):
     def _getDrumLine(self, staff, drum, position, drumIndex):
         position.drumIndex = drumIndex
         lastBar = None
-        lineString = "%*s" % (DRUM_ABBR_WIDTH, drum.abbr)
+        lineString = ["%*s" % (DRUM_ABBR_WIDTH, drum.abbr)]
         lineOk = False
         for measureIndex, measure in enumerate(staff):
             position.measureIndex = measureIndex
             barString = self._barString(lastBar, measure)
-            lineString += barString
+            lineString.append(barString)
             lastBar = measure
             if measure.simileDistance > 0:
                 referredMeasure = self.score.getReferredMeasure(
@@ -92,29 +91,27 @@ class Exporter(object):
                     right = "-"
                 while len(simText) < displayCols:
                     simText = left + simText + right
-                lineString += simText[:displayCols]
+                lineString.append(simText[:displayCols])
             else:
-                for noteTime in xrange(len(measure)):
-                    position.noteTime = noteTime
-                    note = measure.getNote(position)
-                    lineString += note
-                    lineOk = lineOk or note != EMPTY_NOTE
-        barString = self._barString(lastBar, None)
-        lineString += barString
-        return lineString, lineOk
+                notes = [measure.noteAt(noteTime, drumIndex)
+                         for noteTime in xrange(len(measure))]
+                lineString.extend(notes)
+                lineOk = lineOk or any(note != EMPTY_NOTE for note in notes)
+        lineString.append(self._barString(lastBar, None))
+        return "".join(lineString), lineOk
 
     def _getEmptyLine(self, staff):
         lastBar = None
-        lineString = "%*s" % (DRUM_ABBR_WIDTH, "")
+        lineString = ["%*s" % (DRUM_ABBR_WIDTH, "")]
         for measure in staff:
-            lineString += self._barString(lastBar, measure)
-            lineString += EMPTY_NOTE * len(measure)
+            lineString.append(self._barString(lastBar, measure))
+            lineString.append(EMPTY_NOTE * len(measure))
             lastBar = measure
-        lineString += self._barString(lastBar, None)
-        return lineString
+        lineString.append(self._barString(lastBar, None))
+        return "".join(lineString)
 
     def _getCountLine(self, staff, position):
-        countString = "  "
+        countString = ["  "]
         lastBar = None
         for measure in staff:
             barString = self._barString(lastBar, measure)
@@ -127,11 +124,11 @@ class Exporter(object):
                                              for beat in xrange(displayCols))
             else:
                 measureCountString = "".join(measure.count())
-            countString += " " * len(barString)
-            countString += measureCountString
+            countString.append(" " * len(barString))
+            countString.append(measureCountString)
         barString = self._barString(lastBar, None)
-        countString += " " * len(barString)
-        return countString
+        countString.append(" " * len(barString))
+        return "".join(countString)
 
     def _measureBegin(self, repeatString, measure, lastMeasure, delta):
         if not self._isRepeating:
@@ -296,62 +293,66 @@ class Exporter(object):
         kitString.append("")
         return kitString
 
-    def _exportMusic(self, asciiString):
+    def _iterMusic(self):
         newSection = True
         sectionIndex = 0
+        anyLines = False
         self._isRepeating = False
         self._repeatExtender = REPEAT_EXTENDER
         for staffIndex, staff in enumerate(self.score.iterStaffs()):
             assert staff.isConsistent()
+            if anyLines:
+                yield ""
             if newSection:
                 self._isRepeating = False
                 newSection = False
                 if sectionIndex < self.score.numSections():
-                    if (len(asciiString) > 0 and
-                            self.settings.emptyLineBeforeSection):
-                        asciiString.append("")
+                    if anyLines and self.settings.emptyLineBeforeSection:
+                        yield ""
                     title = self.score.getSectionTitle(sectionIndex)
                     if self.settings.sectionBrackets:
                         title = "[" + title + "]"
-                    asciiString.append(title)
+                    yield title
                     if self.settings.underline:
-                        asciiString.append("".join(["~"] * len(title)))
+                        yield "".join(["~"] * len(title))
                     if self.settings.emptyLineAfterSection:
-                        asciiString.append("")
+                        yield ""
                     sectionIndex += 1
             newSection = staff.isSectionEnd()
-            staffString = self._exportStaff(staff, staffIndex)
-            asciiString.extend(staffString)
-            asciiString.append("")
-
-        asciiString = asciiString[:-1]
-        return asciiString
+            for line in self._exportStaff(staff, staffIndex):
+                yield line
+            anyLines = True
 
-    def export(self, outHandle):
-        metadataString = self._exportScoreData()
-        asciiString = []
-        asciiString = self._exportMusic(asciiString)
-        kitString = self._exportKit()
-        handle = StringIO()
-        print >> handle, ("Tabbed with DrumBurp, "
-                          "a drum tab editor from www.whatang.org")
-        print >> handle, ""
+    def _iterAllLines(self):
+        yield ("Tabbed with DrumBurp, "
+               "a drum tab editor from www.whatang.org")
+        yield ""
         if self.settings.metadata:
-            for mString in metadataString:
-                print >> handle, unicode(mString)
-            print >> handle, ""
+            for mString in self._exportScoreData():
+                yield mString
+            yield ""
         if self.settings.kitKey:
-            for iString in kitString:
-                print >> handle, unicode(iString)
-            print >> handle, ""
-        for sString in asciiString:
-            print >> handle, unicode(sString)
-        print >> handle, ""
-        print >> handle, ("Tabbed with DrumBurp, "
-                          "a drum tab editor from www.whatang.org")
-        lines = handle.getvalue().splitlines()
+            for iString in self._exportKit():
+                yield iString
+            yield ""
+        for sString in self._iterMusic():
+            yield sString
+        yield ""
+        yield ("Tabbed with DrumBurp, "
+               "a drum tab editor from www.whatang.org")
+
+    def iterLines(self):
+        """Generate the lines of the exported tab, staff by staff.
+
+        Runs of blank lines are collapsed into one as they are produced.
+        """
         lastBlank = False
-        for line in lines:
-            if line or not lastBlank:
-                print >> outHandle, line
-            lastBlank = (len(line) == 0)
+        for text in self._iterAllLines():
+            for line in unicode(text).splitlines() or [u""]:
+                if line or not lastBlank:
+                    yield line
+                lastBlank = (len(line) == 0)
+
+    def export(self, outHandle):
+        for line in self.iterLines():
+            print >> outHandle, line
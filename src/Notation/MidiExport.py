@@ -0,0 +1,202 @@
+# Copyright 2011-2015 Michael Thomas
+#
+# See www.whatang.org for more information.
+#
+# This file is part of DrumBurp.
+#
+# DrumBurp is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DrumBurp is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DrumBurp.  If not, see <http://www.gnu.org/licenses/>
+'''
+Standard MIDI File export.
+'''
+
+import struct
+
+from Data.DBConstants import MIDITICKSPERBEAT
+
+PERCUSSION_CHANNEL = 0x09
+NOTE_ON = 0x90
+NOTE_OFF = 0x80
+CHOKE = 0xB0
+CHOKE_MSG = 120
+CHOKE_VELOCITY = 0
+PERCUSSION_NOTE_ON = PERCUSSION_CHANNEL | NOTE_ON
+PERCUSSION_NOTE_OFF = PERCUSSION_CHANNEL | NOTE_OFF
+PERCUSSION_CHOKE = PERCUSSION_CHANNEL | CHOKE
+
+FLAM_TIME_CONSTANT = 32
+FLAM_VOLUME_CONSTANT = 2
+DRAG_TIME_CONSTANT = 96
+
+_SIGNATURE = "Created with DrumBurp"
+_HEADER = struct.Struct(">4sIHHH")
+_CHUNK = struct.Struct(">4sI")
+_END_OF_TRACK = "\xff\x2f\x00"
+_CONDUCTOR = -1
+
+
+def encodeSevenBitDelta(delta, midiData):
+    if delta <= 0:
+        midiData.append(0)
+        return
+    values = [delta & 0x7F]
+    delta >>= 7
+    while delta:
+        values.append((delta & 0x7F) | 0x80)
+        delta >>= 7
+    values.reverse()
+    midiData.extend(values)
+
+
+def _tempoEvent(bpm):
+    msPerBeat = int(60000000 / bpm)
+    return "\xff\x51\x03" + struct.pack(">I", msPerBeat)[1:]
+
+
+def _metaText(metaType, text):
+    midiData = bytearray([0xff, metaType])
+    encodeSevenBitDelta(len(text), midiData)
+    midiData.extend(text)
+    return midiData
+
+
+def measureNotes(measure, kit):
+    """List the notes of measure which kit can play.
+
+    Each note is a (note index, drum index, MIDI note, volume, effect)
+    tuple, which holds everything needed to play it.
+    """
+    notes = []
+    for noteIndex, drumIndex, head in measure.iterNotesRaw():
+        headData = kit[drumIndex].headData(head)
+        if headData is not None:
+            notes.append((noteIndex, drumIndex, headData.midiNote,
+                          headData.midiVolume, headData.effect))
+    return notes
+
+
+def iterNoteEvents(notes, times, beatLength):
+    """Generate the MIDI messages which play notes from measureNotes.
+
+    times is the measure's time table, in units where a beat is beatLength
+    long. Yields (time, drum index, (status, data1, data2)) tuples, with
+    times relative to the start of the measure.
+    """
+    for noteIndex, drumIndex, midiNote, midiVolume, effect in notes:
+        noteTime = times[noteIndex]
+        message = (PERCUSSION_NOTE_ON, midiNote, midiVolume)
+        if effect == "flam":
+            yield (noteTime - (beatLength / FLAM_TIME_CONSTANT), drumIndex,
+                   (PERCUSSION_NOTE_ON, midiNote,
+                    midiVolume / FLAM_VOLUME_CONSTANT))
+        elif effect in ("drag", "choke"):
+            divisionLength = times[noteIndex + 1] - times[noteIndex]
+            if effect == "drag":
+                effectMessage = message
+            else:
+                effectMessage = (PERCUSSION_CHOKE, CHOKE_MSG, CHOKE_VELOCITY)
+            yield (noteTime + divisionLength / 2, drumIndex, effectMessage)
+        yield (noteTime, drumIndex, message)
+
+
+def iterMeasureEvents(measure, times, kit, beatLength):
+    """Generate the MIDI messages which play the notes of measure.
+
+    See iterNoteEvents.
+    """
+    return iterNoteEvents(measureNotes(measure, kit), times, beatLength)
+
+
+def calculateMidiEvents(measureIterator, score):
+    """Work out the absolute tick time of every MIDI event in the score.
+
+    Returns a list of (time, sequence, track, event bytes) tuples, sorted
+    by time, and the tick at which the last measure ends. The sequence
+    number keeps events at the same time in the order they were made.
+    Tempo changes are on the conductor track; notes and chokes are on the
+    track of the kit drum which plays them.
+    """
+    events = []
+    append = events.append
+    baseTime = 1
+    lastBpm = None
+    swing = score.scoreData.swing
+    kit = score.drumKit
+    packed = {}
+    for measure, measureIndex in measureIterator:
+        times = measure.counter.midiTickTable(swing)
+        bpm = score.bpmAtMeasureByIndex(measureIndex)
+        if bpm == 0:
+            bpm = 120
+        if bpm != lastBpm:
+            append((baseTime + times[0], len(events), _CONDUCTOR,
+                    _tempoEvent(bpm)))
+            lastBpm = bpm
+        for eventTime, drumIndex, message in iterMeasureEvents(
+                measure, times, kit, MIDITICKSPERBEAT):
+            if message not in packed:
+                packed[message] = struct.pack("BBB", *message)
+            append((baseTime + eventTime, len(events), drumIndex,
+                    packed[message]))
+        baseTime += times[-1]
+    events.sort()
+    return events, baseTime
+
+
+def _makeTrack(events, endTime, name=None, signature=False):
+    midiData = bytearray()
+    if signature:
+        midiData.append(0)
+        midiData.extend(_metaText(0x01, _SIGNATURE))
+    if name is not None:
+        midiData.append(0)
+        midiData.extend(_metaText(0x03, name.encode("utf-8")))
+    lastTime = 0
+    for eventTime, unusedSeq, unusedTrack, event in events:
+        # A flam on the very first note falls before the start of the track
+        eventTime = max(eventTime, lastTime)
+        encodeSevenBitDelta(eventTime - lastTime, midiData)
+        lastTime = eventTime
+        midiData.extend(event)
+    # Insert a delay before the end of the track, then turn off drum notes.
+    encodeSevenBitDelta(endTime - lastTime + 4 * MIDITICKSPERBEAT, midiData)
+    midiData.extend([PERCUSSION_NOTE_OFF, 38, 0])
+    midiData.append(0)
+    midiData.extend(_END_OF_TRACK)
+    return _CHUNK.pack("MTrk", len(midiData)) + str(midiData)
+
+
+def exportMidi(measureIterator, score, handle, trackPerDrum=False):
+    """Write the given measures of score to handle as a Standard MIDI File.
+
+    By default this is a single-track format 0 file. If trackPerDrum is
+    True it is a format 1 file with a conductor track holding the tempo
+    changes, followed by one named track for each kit drum with notes.
+    """
+    events, endTime = calculateMidiEvents(measureIterator, score)
+    if not trackPerDrum:
+        tracks = [_makeTrack(events, endTime, signature=True)]
+        midiFormat = 0
+    else:
+        byTrack = {}
+        for event in events:
+            byTrack.setdefault(event[2], []).append(event)
+        tracks = [_makeTrack(byTrack.pop(_CONDUCTOR, []), endTime,
+                             signature=True)]
+        for drumIndex in sorted(byTrack):
+            tracks.append(_makeTrack(byTrack[drumIndex], endTime,
+                                     score.drumKit[drumIndex].name))
+        midiFormat = 1
+    header = _HEADER.pack("MThd", 6, midiFormat, len(tracks),
+                          MIDITICKSPERBEAT)
+    handle.write(header + "".join(tracks))
@@ -0,0 +1,250 @@
+# Copyright 2017 Michael Thomas
+#
+# See www.whatang.org for more information.
+#
+# This file is part of DrumBurp.
+#
+# DrumBurp is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DrumBurp is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DrumBurp.  If not, see <http://www.gnu.org/licenses/>
+'''
+Streaming MIDI playback.
+'''
+
+import collections
+import itertools
+import threading
+import traceback
+import Queue
+
+from Notation.MidiExport import measureNotes, iterNoteEvents
+
+DEFAULT_LOOKAHEAD = 250
+DEFAULT_INTERVAL = 0.02
+START_DELAY = 50
+
+
+def _readTiming(score, measureIndexes):
+    numMeasures = score.numMeasures()
+    tempos = dict((measureIndex, score.bpmAtMeasureByIndex(measureIndex))
+                  for measureIndex in measureIndexes
+                  if measureIndex < numMeasures)
+    return tempos, score.scoreData.swing
+
+
+class MidiScheduler(object):
+    """Send the notes of a score to a MIDI output as it plays.
+
+    output is anything with a pygame.midi.Output style write method, which
+    takes a list of [[status, data1, data2], timestamp] events. clock
+    returns the current time in milliseconds on the same clock as the
+    output's timestamps.
+
+    prepare and start take a copy of the notes, counts and tempos of the
+    song, so the score is never read from the playing thread and may be
+    edited while it plays. Changes of tempo and mute reach the song as
+    messages, from updateTiming and setMute, and take effect from the
+    next measure to be written. Notes are written lookahead milliseconds
+    before they are due. measureCallback is called with (measureIndex,
+    nextMeasureIndex) when the clock reaches the start of each measure,
+    and with (-1, -1) when the song ends, after which finishedCallback is
+    called.
+
+    When looping, each measure of the loop is rendered once and its events
+    replayed on every pass, so a loop costs the same however many times it
+    goes round.
+    """
+
+    def __init__(self, output, clock, lookahead=DEFAULT_LOOKAHEAD,
+                 interval=DEFAULT_INTERVAL):
+        self._output = output
+        self._clock = clock
+        self.lookahead = lookahead
+        self.interval = interval
+        self.measureCallback = None
+        self.finishedCallback = None
+        self._thread = None
+        self._stopEvent = threading.Event()
+        self._messages = Queue.Queue()
+        self._mute = False
+        self._tempos = {}
+        self._swing = None
+        self._measureIndexes = frozenset()
+        self._measures = None
+        self._nextMeasure = None
+        self._scheduledTo = 0
+        self._starts = collections.deque()
+        self._rendered = {}
+        self._playing = False
+
+    def isPlaying(self):
+        return self._playing
+
+    def prepare(self, measureIterator, score, startTime=None, loopCount=1):
+        """Get ready to play (measure, measureIndex) pairs from score.
+
+        If loopCount is not 1 the measures are played that many times, or
+        until stopped if it is None. This must be called from the thread
+        which edits score.
+        """
+        kit = score.drumKit
+        notes = {}
+        song = []
+        for measure, measureIndex in measureIterator:
+            # Repeats play the same Measure again, so copy it only once.
+            if id(measure) not in notes:
+                notes[id(measure)] = measureNotes(measure, kit)
+            song.append((measure.counter, measureIndex, notes[id(measure)]))
+        self._measureIndexes = frozenset(entry[1] for entry in song)
+        self._tempos, self._swing = _readTiming(score, self._measureIndexes)
+        self._rendered = {}
+        if loopCount == 1:
+            self._measures = (entry + (None,) for entry in song)
+        else:
+            positions = range(len(song))
+            if loopCount is None:
+                order = itertools.cycle(positions)
+            else:
+                order = itertools.chain.from_iterable(
+                    itertools.repeat(positions, loopCount))
+            self._measures = (song[position] + (position,)
+                              for position in order)
+        self._nextMeasure = next(self._measures, None)
+        if startTime is None:
+            startTime = self._clock() + START_DELAY
+        self._scheduledTo = startTime
+        self._starts.clear()
+        self._playing = True
+
+    def setMute(self, onOff):
+        """Stop or resume writing notes, from any thread."""
+        self._messages.put(("mute", onOff))
+
+    def updateTiming(self, score):
+        """Send the current tempos and swing of score to the song.
+
+        Call this from the thread which edits score after changing them.
+        """
+        self._messages.put(("timing",
+                            _readTiming(score, self._measureIndexes)))
+
+    def _readMessages(self):
+        while True:
+            try:
+                kind, value = self._messages.get_nowait()
+            except Queue.Empty:
+                return
+            if kind == "mute":
+                self._mute = value
+            else:
+                tempos, self._swing = value
+                self._tempos.update(tempos)
+
+    def pump(self, now=None):
+        """Write the events due in the next lookahead ms, and report the
+        measure being played.
+
+        Returns False once the song has finished.
+        """
+        if not self._playing:
+            return False
+        self._readMessages()
+        if now is None:
+            now = self._clock()
+        horizon = now + self.lookahead
+        while self._nextMeasure is not None and self._scheduledTo <= horizon:
+            self._scheduleMeasure()
+        current = None
+        while self._starts and self._starts[0][0] <= now:
+            current = self._starts.popleft()
+        if current is not None and self.measureCallback is not None:
+            self.measureCallback(current[1], current[2])
+        if (self._nextMeasure is None and not self._starts
+                and now >= self._scheduledTo):
+            self._finish()
+            return False
+        return True
+
+    def _finish(self):
+        self._playing = False
+        if self.measureCallback is not None:
+            self.measureCallback(-1, -1)
+        if self.finishedCallback is not None:
+            self.finishedCallback()
+
+    def _scheduleMeasure(self):
+        counter, measureIndex, notes, loopPosition = self._nextMeasure
+        self._nextMeasure = next(self._measures, None)
+        if self._nextMeasure is None:
+            nextIndex = -1
+        else:
+            nextIndex = self._nextMeasure[1]
+        bpm = self._tempos.get(measureIndex, 0)
+        if bpm == 0:
+            bpm = 120
+        msPerBeat = 60000.0 / bpm
+        times = counter.timeTable(msPerBeat, self._swing)
+        start = self._scheduledTo
+        self._starts.append((start, measureIndex, nextIndex))
+        self._scheduledTo = start + times[-1]
+        if self._mute:
+            return
+        timing = (msPerBeat, self._swing)
+        rendered = self._rendered.get(loopPosition)
+        if rendered is None or rendered[0] != timing:
+            events = [(eventTime, list(message)) for eventTime, unusedDrum,
+                      message in iterNoteEvents(notes, times, msPerBeat)]
+            events.sort(key=lambda event: event[0])
+            rendered = (timing, events)
+            if loopPosition is not None:
+                self._rendered[loopPosition] = rendered
+        if rendered[1]:
+            self._output.write([[message, int(round(start + eventTime))]
+                                for eventTime, message in rendered[1]])
+
+    def start(self, measureIterator, score, loopCount=1):
+        """Play the measures on a background thread."""
+        self.stop()
+        self.prepare(measureIterator, score, loopCount=loopCount)
+        self._stopEvent.clear()
+        self._thread = threading.Thread(target=self._run,
+                                        name="MidiScheduler")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self):
+        try:
+            while self.pump() and not self._stopEvent.wait(self.interval):
+                pass
+        except Exception:  # pylint:disable=broad-except
+            # Nobody is waiting on this thread to see the error.
+            traceback.print_exc()
+        finally:
+            # Unless stop() ended playback, tell the listeners it is over,
+            # even if scheduling failed part way through the song.
+            if self._playing and not self._stopEvent.is_set():
+                self._finish()
+
+    def stop(self):
+        """Stop scheduling events.
+
+        Events already written to the output may still play unless the
+        output is aborted.
+        """
+        self._stopEvent.set()
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+        self._thread = None
+        self._playing = False
+        self._starts.clear()
+        self._nextMeasure = None
@@ -25,6 +25,7 @@ Created on 4 Apr 2012
 from __future__ import print_function
 from contextlib import contextmanager
 import collections
+import itertools
 from Data.DefaultKits import STEM_DOWN, STEM_UP
 from DBVersion import DB_VERSION
 
@@ -32,6 +33,7 @@ import sys
 import os
 import subprocess
 import platform
+import weakref
 from math import log
 
 
@@ -117,16 +119,14 @@ def is_divisible_by(num, list):
 #beat = current beat (object)
 #ticks = how many ticks until the next note/event in the beat (including the one we're on)
 #tickNum = tick we're on
-def makeLilyDuration(beat, ticks, tickNum):
-    dur = None
-    ticksInFullBeat = beat.ticksPerBeat
-    
+def _calculateLilyDuration(counter, ticks):
     #check if the note length could be made up of any combination straight note(s). if it can't, it need to be compound.
-    noteCompound = beat.counter.supportsCompound and (not is_divisible_by(ticks, beat.counter.noteDirectory[False].keys()))
+    noteCompound = counter.supportsCompound and (not is_divisible_by(ticks, counter.noteDirectory[False].keys()))
     
+    lengths = sorted(counter.noteDirectory[noteCompound].keys(), reverse=True)
     #find closest note (start at largest note in ticks, down to smallest)
     note = None
-    for i in sorted(beat.counter.noteDirectory[noteCompound].keys(), reverse=True):
+    for i in lengths:
         if(i <= ticks):
             note = i
             break
@@ -142,7 +142,7 @@ def makeLilyDuration(beat, ticks, tickNum):
 
     #find note again but for the rest length
     restNote = None
-    for i in sorted(beat.counter.noteDirectory[noteCompound].keys(), reverse=True):
+    for i in lengths:
         if(i <= ticks):
             restNote = i
             ticks -= restNote
@@ -155,17 +155,32 @@ def makeLilyDuration(beat, ticks, tickNum):
             #ticks -= restNote / 2
     
     #Setting everything
-    finalNote = str(beat.counter.noteDirectory[noteCompound][note])
+    finalNote = str(counter.noteDirectory[noteCompound][note])
     if(dotted):
         finalNote += "."
     finalRest = None
     if not restNote == None:
-        finalRest = str(beat.counter.noteDirectory[noteCompound][restNote])
+        finalRest = str(counter.noteDirectory[noteCompound][restNote])
         if(restDotted):
             finalRest += "."
 
-    dur = LilyDuration(finalNote,finalRest,noteCompound)
+    return finalNote, finalRest, noteCompound
+
+
+_DURATION_TABLES = weakref.WeakKeyDictionary()
+
 
+def makeLilyDuration(beat, ticks, tickNum):
+    # The note and rest lengths only depend on the Counter and the number of
+    # ticks, so they are worked out once per Counter.
+    table = _DURATION_TABLES.get(beat.counter)
+    if table is None:
+        table = _DURATION_TABLES[beat.counter] = {}
+    durationInfo = table.get(ticks)
+    if durationInfo is None:
+        durationInfo = table[ticks] = _calculateLilyDuration(beat.counter,
+                                                             ticks)
+    dur = LilyDuration(*durationInfo)
     if tickNum == 0:
         dur.isBeatStart = True
     return dur
@@ -240,7 +255,7 @@ class LilyMeasure(object):
     def __init__(self, measure, kit):
         self.measure = measure
         self.kit = kit
-        self._beats = list(self.measure.counter.iterBeatTicks())
+        self._beats = self.measure.counter.beatTickTable()
         self._voices = {STEM_UP: [], STEM_DOWN: []}
         self._sticking = []
         self._voiceOneEmpty = False
@@ -249,9 +264,9 @@ class LilyMeasure(object):
 
     def _separateNotesByDirection(self):
         notes = {STEM_UP: [], STEM_DOWN: []}
-        for notePos, head in self.measure:
-            direction = self.kit.getDirection(notePos.drumIndex, head)
-            notes[direction].append((notePos, head))
+        for note in self.measure.iterNotesRaw():
+            direction = self.kit.getDirection(note[1], note[2])
+            notes[direction].append(note)
         if len(notes[STEM_UP]) == 0:
             self._voiceOneEmpty = True
         if len(notes[STEM_DOWN]) == 0:
@@ -260,8 +275,7 @@ class LilyMeasure(object):
 
     def _calculateEventTimes(self, eventTimes):
         eventTimes = set(eventTimes)
-        for tick in self.measure.counter.iterBeatTickPositions():
-            eventTimes.add(tick)
+        eventTimes.update(self.measure.counter.beatStartTable())
         eventTimes.add(len(self._beats))
         noteTimes = list(eventTimes)
         noteTimes.sort()
@@ -270,8 +284,7 @@ class LilyMeasure(object):
     def _calculateNoteTimes(self, notes):
         noteTimes = {}
         for direction in notes:
-            eventTimes = [notePos.noteTime for (notePos, head_) in
-                          notes[direction]]
+            eventTimes = [note[0] for note in notes[direction]]
             noteTimes[direction] = self._calculateEventTimes(eventTimes)
         return noteTimes
 
@@ -320,12 +333,12 @@ class LilyMeasure(object):
         for direction, timeList in notes.iteritems():
             lilyDict = {}
             effectsDict = collections.defaultdict(list)
-            for notePos, head in timeList:
-                if notePos.noteTime not in lilyDict:
-                    lilyDict[notePos.noteTime] = []
-                noteIndicator, effect = self.kit.getLilyNote(notePos, head)
-                lilyDict[notePos.noteTime].append(noteIndicator)
-                effectsDict[notePos.noteTime].append((noteIndicator, effect))
+            for noteTime, drumIndex, head in timeList:
+                if noteTime not in lilyDict:
+                    lilyDict[noteTime] = []
+                noteIndicator, effect = self.kit.getLilyNote(drumIndex, head)
+                lilyDict[noteTime].append(noteIndicator)
+                effectsDict[noteTime].append((noteIndicator, effect))
             lilyNotes[direction] = lilyDict
             effects[direction] = effectsDict
         return lilyNotes, effects
@@ -529,12 +542,12 @@ class LilyKit(object):
             self._lilyHeads.append(lilyHeads)
             self._lilyNames.append(lilyNames)
 
-    def _getLilyHead(self, notePos, head):
-        return self._lilyHeads[notePos.drumIndex][head]
+    def _getLilyHead(self, drumIndex, head):
+        return self._lilyHeads[drumIndex][head]
 
-    def getLilyNote(self, notePos, head):
-        lilyHead = self._getLilyHead(notePos, head)
-        headData = self._kit[notePos.drumIndex].headData(head)
+    def getLilyNote(self, drumIndex, head):
+        lilyHead = self._getLilyHead(drumIndex, head)
+        headData = self._kit[drumIndex].headData(head)
         effect = headData.notationEffect
         return lilyHead, effect
 
@@ -608,9 +621,28 @@ class BadPaperSize(LilypondProblem):
     "DrumBurp cannot create a Lilypond score on this paper size."
 
 
+def iterSectionPieces(score):
+    """Split score at its section ends, so the pieces can be built separately.
+
+    Yields (sectionIndex, startMeasure, endMeasure) for each section, and
+    for any measures after the last section.
+    """
+    sectionIndex = 0
+    start = 0
+    end = 0
+    for end, measure in enumerate(score.iterMeasures(), 1):
+        if measure.isSectionEnd():
+            yield sectionIndex, start, end
+            sectionIndex += 1
+            start = end
+    if start < end:
+        yield sectionIndex, start, end
+
+
 class LilypondScore(object):
-    def __init__(self, score):
+    def __init__(self, score, piece=None):
         self.score = score
+        self._piece = piece
         self._lilyKit = LilyKit(score.drumKit)
         self._paperSize = str(score.paperSize)
         self.scoreData = score.scoreData
@@ -621,6 +653,7 @@ class LilypondScore(object):
         self._timeSig = None
         self._lastTimeSig = None
         self._hadRepeatCount = False
+        self._measureCache = {}
 
     def write(self, handle):
         self.indenter.setHandle(handle)
@@ -641,16 +674,32 @@ class LilypondScore(object):
         if paperSize is None:
             raise BadPaperSize(self._paperSize)
         self.indenter(r'#(set-paper-size %s)' % lilyString(paperSize))
-        if self._numPages != 0:
+        # The page count set for the score covers the whole song. A piece
+        # is only one section of it, so there is no page count to honour
+        # and Lilypond is left to choose.
+        if self._numPages != 0 and self._piece is None:
             self.indenter(r'page-count = #%d' % self._numPages)
         if self._lilyFill:
             self.indenter(r'ragged-last-bottom = ##f')
 
+    def _isFirstPiece(self):
+        return self._piece is None or self._piece[1] == 0
+
+    def _isLastPiece(self):
+        return (self._piece is None
+                or self._piece[2] == self.score.numMeasures())
+
     def _writeHeader(self):
-        self.indenter('title = %s' % lilyString(self.scoreData.title))
-        self.indenter(r'tagline = #(string-append "Score created using '
-                      'DrumBurp %s, engraved with Lilypond " '
-                      '(lilypond-version))' % DB_VERSION)
+        if self._isFirstPiece():
+            self.indenter('title = %s' % lilyString(self.scoreData.title))
+        if self._isLastPiece():
+            self.indenter(r'tagline = #(string-append "Score created using '
+                          'DrumBurp %s, engraved with Lilypond " '
+                          '(lilypond-version))' % DB_VERSION)
+        else:
+            self.indenter('tagline = ##f')
+        if not self._isFirstPiece():
+            return
         if self.scoreData.artistVisible:
             self.indenter('composer = %s' % lilyString(self.scoreData.artist))
         if self.scoreData.creatorVisible:
@@ -673,14 +722,28 @@ class LilypondScore(object):
     def _writeDrumStaffInfo(self):
         self.indenter(r'\set DrumStaff.drumStyleTable ' +
                       r'= #(alist->hash-table dbdrums)')
-        self.indenter(r'\set Staff.instrumentName = #"Drums"')
-        if self.scoreData.bpmVisible and self.scoreData.bpm:
-            self.indenter(r'\tempo 4 = %d' % self.scoreData.bpm)
+        if self._isFirstPiece():
+            self.indenter(r'\set Staff.instrumentName = #"Drums"')
+            if self.scoreData.bpmVisible and self.scoreData.bpm:
+                self.indenter(r'\tempo 4 = %d' % self.scoreData.bpm)
+        else:
+            self._writePieceTempo()
         self.indenter(r"\override Score.RehearsalMark " +
                       r"#'self-alignment-X = #LEFT")
         self.indenter(r'\override Score.TimeSignature.break-visibility '
                       '= #end-of-line-invisible')
 
+    def _writePieceTempo(self):
+        # A later piece starts in whatever tempo is in effect there, which
+        # may have been set by a measure in an earlier section.
+        first = self._piece[1]
+        if self.score.getMeasureByIndex(first).newBpm > 0:
+            # _writeMusic writes this measure's own tempo change.
+            return
+        bpm = self.score.bpmAtMeasureByIndex(first)
+        if bpm and (self.scoreData.bpmVisible or bpm != self.scoreData.bpm):
+            self.indenter(r'\tempo 4 = %d' % bpm)
+
     @staticmethod
     def _getNextRepeats(repeatCommands, hasAlternate, measure):
         if measure.isRepeatStart():
@@ -749,8 +812,8 @@ class LilypondScore(object):
         counter = measure.counter
         return "%d/%d" % counter.timeSig()
 
-    def _firstMeasureRepeat(self):
-        measure = self.score.getMeasureByIndex(0)
+    def _firstMeasureRepeat(self, firstIndex):
+        measure = self.score.getMeasureByIndex(firstIndex)
         if not measure.isRepeatStart():
             return
         firstRepeatCode = r"""\once \override Score.BreakAlignment.break-align-orders =
@@ -785,14 +848,20 @@ class LilypondScore(object):
         self.indenter(swingCode)
 
     def _writeMusic(self):
-        secIndex, secTitle = self._getNextSectionTitle(-1)
+        if self._piece is None:
+            secIndex, first, last = 0, 0, None
+        else:
+            secIndex, first, last = self._piece
+        secIndex, secTitle = self._getNextSectionTitle(secIndex - 1)
         repeatCommands = []
         hasAlternate = -1
         self._lastTimeSig = None
-        self._firstMeasureRepeat()
+        self._firstMeasureRepeat(first)
         percentRepeated = False
         self._swing()
-        for measureIndex, measure in enumerate(self.score.iterMeasures()):
+        measures = itertools.islice(enumerate(self.score.iterMeasures()),
+                                    first, last)
+        for measureIndex, measure in measures:
             hasAlternate = self._getNextRepeats(repeatCommands,
                                                 hasAlternate, measure)
             if repeatCommands:
@@ -841,7 +910,13 @@ class LilypondScore(object):
                           % " ".join(repeatCommands))
 
     def _writeMeasure(self, measure):
-        parsed = LilyMeasure(measure, self._lilyKit)
+        # Measures with the same content come out the same, so repeated
+        # grooves are only translated once per kit.
+        key = measure.digest()
+        parsed = self._measureCache.get(key)
+        if parsed is None:
+            parsed = LilyMeasure(measure, self._lilyKit)
+            self._measureCache[key] = parsed
         if not parsed.isVoiceOneEmpty():
             with LILY_CONTEXT(self.indenter, r'\new DrumVoice'):
                 if not parsed.isVoiceTwoEmpty():
@@ -64,15 +64,63 @@ class SmoothScroller(object):
 
 
 class ScoreView(QtGui.QGraphicsView):
+    MIN_ZOOM = 0.1
+    MAX_ZOOM = 4.0
+    ZOOM_STEP = 1.25
+
     def __init__(self, parent=None):
         super(ScoreView, self).__init__(parent)
         self._props = None
         self._scroller = SmoothScroller(self)
+        self._zoom = 1.0
+        self.setTransformationAnchor(self.AnchorUnderMouse)
 
     def setScene(self, scene):
         super(ScoreView, self).setScene(scene)
         self._props = scene.displayProperties
         self.centerOn(0, 0)
+        self._visibleRectChanged()
+
+    def _visibleRectChanged(self):
+        # The scene only keeps graphics items for the staffs in view.
+        scene = self.scene()
+        if scene is not None:
+            visible = self.mapToScene(self.viewport().rect()).boundingRect()
+            scene.setVisibleRect(visible)
+
+    def scrollContentsBy(self, dx, dy):
+        super(ScoreView, self).scrollContentsBy(dx, dy)
+        self._visibleRectChanged()
+
+    def resizeEvent(self, event):
+        super(ScoreView, self).resizeEvent(event)
+        self._visibleRectChanged()
+
+    def zoom(self):
+        return self._zoom
+
+    @QtCore.pyqtSlot(float)
+    def setZoom(self, zoom):
+        zoom = min(self.MAX_ZOOM, max(self.MIN_ZOOM, zoom))
+        if zoom == self._zoom:
+            return
+        self._zoom = zoom
+        self.setTransform(QtGui.QTransform.fromScale(zoom, zoom))
+        self._visibleRectChanged()
+        self.zoomChanged.emit(zoom)
+    zoomChanged = QtCore.pyqtSignal(float)
+
+    def wheelEvent(self, event):
+        if event.modifiers() & QtCore.Qt.ControlModifier:
+            steps = event.delta() / 120.0
+            self.setZoom(self._zoom * self.ZOOM_STEP ** steps)
+            event.accept()
+        else:
+            super(ScoreView, self).wheelEvent(event)
+
+    def _contentRect(self, item):
+        # Where item is in scroll bar coordinates.
+        return self.transform().mapRect(item.sceneBoundingRect())
 
     @QtCore.pyqtSlot(int)
     def systemSpacingChanged(self, value):
@@ -143,7 +191,10 @@ class ScoreView(QtGui.QGraphicsView):
         if event.key() == QtCore.Qt.Key_Home:
             self.setTopLeft(0, 0)
         elif event.key() == QtCore.Qt.Key_End:
-            self.setTopLeft(0, self.sceneRect().height())
+            self.setTopLeft(0, self.sceneRect().height() * self._zoom)
+        elif (event.key() == QtCore.Qt.Key_0
+              and event.modifiers() & QtCore.Qt.ControlModifier):
+            self.setZoom(1.0)
         else:
             event.ignore()
             return super(ScoreView, self).keyPressEvent(event)
@@ -158,15 +209,15 @@ class ScoreView(QtGui.QGraphicsView):
 
     @QtCore.pyqtSlot(QtGui.QGraphicsItem)
     def showItemAtTop(self, item, timeInMs=250, margins=20):
-        itemRect = item.sceneBoundingRect()
+        itemRect = self._contentRect(item)
         left = max(0, itemRect.right() + margins - self.viewport().width())
         top = max(0, itemRect.top() - margins)
         self.setTopLeft(left, top, timeInMs)
 
     @QtCore.pyqtSlot(QtGui.QGraphicsItem, QtGui.QGraphicsItem)
     def showTwoItems(self, primary, secondary, timeInMs=250, margins=20):
-        primRect = primary.sceneBoundingRect()
-        secRect = secondary.sceneBoundingRect()
+        primRect = self._contentRect(primary)
+        secRect = self._contentRect(secondary)
         top = min(primRect.top(), secRect.top())
         bottom = max(primRect.bottom(), secRect.bottom())
         left = min(primRect.left(), secRect.left())
@@ -0,0 +1,57 @@
+# Copyright 2017 Michael Thomas
+#
+# See www.whatang.org for more information.
+#
+# This file is part of DrumBurp.
+#
+# DrumBurp is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DrumBurp is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DrumBurp.  If not, see <http://www.gnu.org/licenses/>
+'''
+Benchmark for ASCII export on long scores.
+
+Exports scores of increasing length and prints the time per measure,
+which should stay roughly flat: the export is meant to be linear in the
+number of measures. Run directly:
+
+    python benchmarkAsciiExport.py [numMeasures ...]
+'''
+
+import sys
+import timeit
+from cStringIO import StringIO
+from Data.ASCIISettings import ASCIISettings
+from Notation.AsciiExport import Exporter
+from testAsciiExport import makeScore
+
+SIZES = (1000, 5000)
+REPEATS = 3
+
+
+def exportScore(score):
+    Exporter(score, ASCIISettings()).export(StringIO())
+
+
+def main(sizes=SIZES):
+    for numMeasures in sizes:
+        score = makeScore(numMeasures)
+        best = min(timeit.repeat(lambda: exportScore(score),
+                                 repeat=REPEATS, number=1))
+        print ("%d measures: %.3fs, %.1fus/measure"
+               % (numMeasures, best, 1e6 * best / numMeasures))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        main([int(arg) for arg in sys.argv[1:]])
+    else:
+        main()
@@ -0,0 +1,111 @@
+# Copyright 2017 Michael Thomas
+#
+# See www.whatang.org for more information.
+#
+# This file is part of DrumBurp.
+#
+# DrumBurp is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DrumBurp is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DrumBurp.  If not, see <http://www.gnu.org/licenses/>
+'''
+Benchmark for reading DrumBurp files.
+
+Generates a large score, writes it in each text file format, then reports
+how many lines per second ScoreSerializer.read gets through, taking the
+best of a few runs with the garbage collector off. The same score is then
+read from the binary DBFF 3 format, and its speed given relative to the
+latest text format. Run directly:
+
+    python benchmarkFileRead.py [numMeasures]
+'''
+
+import sys
+import gc
+import time
+import codecs
+import cStringIO
+from Data.ScoreSerializer import ScoreSerializer
+from Data.ScoreFactory import ScoreFactory
+from Data.NotePosition import NotePosition
+from Data import DBConstants
+
+NUM_MEASURES = 10000
+REPEATS = 3
+
+
+def makeScore(numMeasures):
+    score = ScoreFactory.makeEmptyScore(numMeasures)
+    for index, measure in enumerate(score.iterMeasures()):
+        for noteTime in xrange(len(measure)):
+            measure.addNote(NotePosition(noteTime=noteTime, drumIndex=1),
+                            "x")
+            if noteTime % 4 == 0:
+                measure.addNote(NotePosition(noteTime=noteTime,
+                                             drumIndex=(index + noteTime) % 8),
+                                "o")
+        if index % 16 == 15:
+            measure.setLineBreak(True)
+    return score
+
+
+def writeScore(score, version):
+    handle = cStringIO.StringIO()
+    if version == DBConstants.DBFF_3:
+        writer = handle
+    else:
+        writer = codecs.getwriter('utf-8')(handle)
+    ScoreSerializer.write(score, writer, version)
+    return handle.getvalue()
+
+
+def readText(data):
+    ScoreSerializer.read(codecs.getreader('utf-8')(cStringIO.StringIO(data)))
+
+
+def timeRead(data, read=readText):
+    best = None
+    for unusedRepeat in xrange(REPEATS):
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.time()
+            read(data)
+            elapsed = time.time() - start
+        finally:
+            gc.enable()
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def main(numMeasures=NUM_MEASURES):
+    score = makeScore(numMeasures)
+    for version in (DBConstants.DBFF_0, DBConstants.DBFF_1,
+                    DBConstants.DBFF_2):
+        data = writeScore(score, version)
+        numLines = data.count("\n")
+        elapsed = timeRead(data)
+        print ("DBFF %d: %d measures, %d lines in %.2fs, %d lines/s"
+               % (version, numMeasures, numLines, elapsed,
+                  numLines / elapsed))
+    data = writeScore(score, DBConstants.DBFF_3)
+    binaryElapsed = timeRead(data, ScoreSerializer.readBinary)
+    print ("DBFF 3: %d measures, %d bytes in %.2fs, %.1fx DBFF %d"
+           % (numMeasures, len(data), binaryElapsed,
+              elapsed / binaryElapsed, version))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        main(int(sys.argv[1]))
+    else:
+        main()
@@ -0,0 +1,76 @@
+# Copyright 2017 Michael Thomas
+#
+# See www.whatang.org for more information.
+#
+# This file is part of DrumBurp.
+#
+# DrumBurp is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DrumBurp is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DrumBurp.  If not, see <http://www.gnu.org/licenses/>
+'''
+Benchmark for generating Lilypond source.
+
+Builds a long score from a four bar groove, as most real scores repeat
+a handful of patterns, and times LilypondScore.write on it, taking the
+best of a few runs. Run directly:
+
+    python benchmarkLilypond.py [numMeasures]
+'''
+
+import sys
+import timeit
+import cStringIO
+from Data.ScoreFactory import ScoreFactory
+from Data.NotePosition import NotePosition
+from Notation.lilypond import LilypondScore
+
+NUM_MEASURES = 2000
+REPEATS = 3
+
+
+def makeScore(numMeasures):
+    score = ScoreFactory.makeEmptyScore(numMeasures)
+    kit = score.drumKit
+
+    def addNote(measure, noteTime, drumIndex):
+        measure.addNote(NotePosition(noteTime=noteTime, drumIndex=drumIndex),
+                        kit[drumIndex].head)
+    for index, measure in enumerate(score.iterMeasures()):
+        for noteTime in xrange(0, len(measure), 2):
+            addNote(measure, noteTime, 1)
+        addNote(measure, 0, 7)
+        addNote(measure, (index % 4) + 2, 4)
+        if index % 4 == 3:
+            addNote(measure, len(measure) - 1, 3)
+            measure.setAbove(len(measure) - 1, "R")
+        if index % 16 == 15:
+            measure.setLineBreak(True)
+    return score
+
+
+def writeScore(score):
+    LilypondScore(score).write(cStringIO.StringIO())
+
+
+def main(numMeasures=NUM_MEASURES):
+    score = makeScore(numMeasures)
+    best = min(timeit.repeat(lambda: writeScore(score),
+                             repeat=REPEATS, number=1))
+    print ("%d measures: %.3fs, %.0f measures/s"
+           % (numMeasures, best, numMeasures / best))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        main(int(sys.argv[1]))
+    else:
+        main()
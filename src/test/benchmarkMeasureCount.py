@@ -0,0 +1,75 @@
+# Copyright 2017 Michael Thomas
+#
+# See www.whatang.org for more information.
+#
+# This file is part of DrumBurp.
+#
+# DrumBurp is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DrumBurp is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DrumBurp.  If not, see <http://www.gnu.org/licenses/>
+'''
+Micro-benchmark for MeasureCount tick tables.
+
+Compares generating the MIDI tick times of every measure afresh, as
+playback and export used to, with reading them from the shared cached
+tables. Run directly:
+
+    python benchmarkMeasureCount.py [numMeasures]
+'''
+
+import sys
+import timeit
+from Data import MeasureCount, DBConstants
+from Data.Counter import CounterRegistry
+
+NUM_MEASURES = 10000
+REPEATS = 3
+
+
+def makeCounts(numMeasures):
+    # Each measure has its own MeasureCount, as after loading a file, but
+    # they only use a few distinct counts.
+    registry = CounterRegistry()
+    counters = [registry.getCounterByIndex(index) for index in range(4)]
+    counts = []
+    for index in xrange(numMeasures):
+        counter = counters[index % len(counters)]
+        counts.append(MeasureCount.makeSimpleCount(counter, 4))
+    return counts
+
+
+def generateTicks(counts, swing):
+    for count in counts:
+        list(count._iterTimeCounter(DBConstants.MIDITICKSPERBEAT, swing))
+
+
+def tableTicks(counts, swing):
+    for count in counts:
+        count.midiTickTable(swing)
+
+
+def main(numMeasures=NUM_MEASURES):
+    counts = makeCounts(numMeasures)
+    for swing in (0, 8):
+        generated = min(timeit.repeat(lambda: generateTicks(counts, swing),
+                                      repeat=REPEATS, number=1))
+        tabled = min(timeit.repeat(lambda: tableTicks(counts, swing),
+                                   repeat=REPEATS, number=1))
+        print ("swing %d, %d measures: generated %.3fs, tables %.3fs"
+               % (swing, numMeasures, generated, tabled))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        main(int(sys.argv[1]))
+    else:
+        main()
@@ -0,0 +1,96 @@
+# Copyright 2017 Michael Thomas
+#
+# See www.whatang.org for more information.
+#
+# This file is part of DrumBurp.
+#
+# DrumBurp is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DrumBurp is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DrumBurp.  If not, see <http://www.gnu.org/licenses/>
+'''
+Benchmark for the memory and allocation cost of the per-note value types.
+
+Reports the size of a NotePosition, Beat and HeadData, including any
+instance dict, then times iterating over every note of a long score both
+as (NotePosition, head) pairs and with Measure.iterNotesRaw, and the MIDI
+export which uses the latter. Run directly:
+
+    python benchmarkMemory.py [numMeasures]
+'''
+
+import sys
+import timeit
+import cStringIO
+from Data.Beat import Beat
+from Data.Counter import Counter
+from Data.Drum import HeadData
+from Data.NotePosition import NotePosition
+from Notation.MidiExport import exportMidi
+from benchmarkLilypond import makeScore
+
+NUM_MEASURES = 2000
+REPEATS = 3
+
+
+def instanceSize(obj):
+    size = sys.getsizeof(obj)
+    if hasattr(obj, "__dict__"):
+        size += sys.getsizeof(obj.__dict__)
+    return size
+
+
+def iterPositions(score):
+    count = 0
+    for measure in score.iterMeasures():
+        for unusedNp, unusedHead in measure:
+            count += 1
+    return count
+
+
+def iterRaw(score):
+    count = 0
+    for measure in score.iterMeasures():
+        for unusedNote in measure.iterNotesRaw():
+            count += 1
+    return count
+
+
+def writeMidi(score):
+    exportMidi(score.iterMeasuresWithRepeats(), score,
+               cStringIO.StringIO())
+
+
+def _time(func, score):
+    return min(timeit.repeat(lambda: func(score),
+                             repeat=REPEATS, number=1))
+
+
+def main(numMeasures=NUM_MEASURES):
+    for name, obj in (("NotePosition", NotePosition(0, 0, 0, 0)),
+                      ("Beat", Beat(Counter("^e+a"))),
+                      ("HeadData", HeadData())):
+        print ("%-12s %4d bytes" % (name, instanceSize(obj)))
+    score = makeScore(numMeasures)
+    numNotes = iterRaw(score)
+    print ("%d measures, %d notes" % (numMeasures, numNotes))
+    for name, func in (("Iterate positions", iterPositions),
+                       ("Iterate raw", iterRaw),
+                       ("MIDI export", writeMidi)):
+        best = _time(func, score)
+        print ("%-17s %.3fs, %.0f notes/s" % (name, best, numNotes / best))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        main(int(sys.argv[1]))
+    else:
+        main()
@@ -9,9 +9,28 @@ from Data.ASCIISettings import ASCIISettings
 from Data import DrumKit, Drum, MeasureCount
 from Data.Score import Score
 from Data.NotePosition import NotePosition
+from Data.Staff import Staff
 from Notation.AsciiExport import Exporter, getExportDate
 
 
+def makeScore(numMeasures):
+    """A long two drum score, also used by benchmarkAsciiExport."""
+    score = Score()
+    score.drumKit = DrumKit.DrumKit()
+    score.drumKit.addDrum(Drum.Drum("HiHat", "Hh", "x"))
+    score.drumKit.addDrum(Drum.Drum("Bass", "Bd", "o"))
+    counter = MeasureCount.counterMaker(4, 16)
+    for index in xrange(numMeasures):
+        measure = score.insertMeasureByIndex(16, counter=counter)
+        if index % 4 == 3:
+            measure.simileDistance = 1
+        else:
+            measure.addNote(NotePosition(noteTime=0, drumIndex=0), "x")
+            measure.addNote(NotePosition(noteTime=8, drumIndex=1), "o")
+    score.formatScore()
+    return score
+
+
 class TestExport(unittest.TestCase):
     exportDate = getExportDate()
 
@@ -378,6 +397,41 @@ class TestExport(unittest.TestCase):
                           'Tabbed with DrumBurp, a drum tab editor from www.whatang.org'])
 
 
+class TestLongScore(unittest.TestCase):
+    def testIterLines(self):
+        score = makeScore(50)
+        settings = ASCIISettings()
+        handle = StringIO()
+        Exporter(score, settings).export(handle)
+        lines = list(Exporter(score, settings).iterLines())
+        self.assertEqual(lines, handle.getvalue().splitlines())
+        self.assertFalse(any(first == second == ""
+                             for first, second in zip(lines, lines[1:])))
+
+    @staticmethod
+    def _countStaffWalks(numMeasures):
+        score = makeScore(numMeasures)
+        calls = []
+        original = Staff.numMeasures
+
+        def counting(staff):
+            calls.append(staff)
+            return original(staff)
+        Staff.numMeasures = counting
+        try:
+            Exporter(score, ASCIISettings()).export(StringIO())
+        finally:
+            Staff.numMeasures = original
+        return len(calls)
+
+    def testLinearScaling(self):
+        # Each measure lookup used to count the measures on every earlier
+        # staff, so doubling the score quadrupled the staff walks.
+        small = self._countStaffWalks(200)
+        large = self._countStaffWalks(400)
+        self.assert_(large <= 2 * small + 2, (small, large))
+
+
 if __name__ == "__main__":
     # import sys;sys.argv = ['', 'Test.testName']
     unittest.main()
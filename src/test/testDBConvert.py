@@ -0,0 +1,154 @@
+# Copyright 2017 Michael Thomas
+#
+# See www.whatang.org for more information.
+#
+# This file is part of DrumBurp.
+#
+# DrumBurp is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DrumBurp is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DrumBurp.  If not, see <http://www.gnu.org/licenses/>
+import unittest
+import os
+import shutil
+import tempfile
+import DBConvert
+from Data import DBConstants
+from Data.ScoreSerializer import ScoreSerializer
+
+# pylint: disable-msg=R0904
+
+DIRNAME = os.path.dirname(__file__)
+DATA_DIR = os.path.join(DIRNAME, "testdata")
+SONG = "Basket Case.brp"
+
+
+class TestConvert(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.inputDir = os.path.join(self.tempdir, "in")
+        os.makedirs(os.path.join(self.inputDir, "v0"))
+        os.makedirs(os.path.join(self.inputDir, "v1"))
+        for version in ("v0", "v1"):
+            shutil.copy(os.path.join(DATA_DIR, version, SONG),
+                        os.path.join(self.inputDir, version, SONG))
+        self.outputDir = os.path.join(self.tempdir, "out")
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def testIterScoreFiles(self):
+        with open(os.path.join(self.inputDir, "notes.txt"), "w"):
+            pass
+        single = os.path.join(self.inputDir, "v0", SONG)
+        self.assertEqual(list(DBConvert.iterScoreFiles([self.inputDir,
+                                                        single])),
+                         [(os.path.join(self.inputDir, "v0", SONG),
+                           os.path.join("v0", SONG)),
+                          (os.path.join(self.inputDir, "v1", SONG),
+                           os.path.join("v1", SONG)),
+                          (single, SONG)])
+
+    def testOutputName(self):
+        self.assertEqual(DBConvert.outputName("a/b/c.brp", "c.brp", "txt"),
+                         "a/b/c.txt")
+        self.assertEqual(DBConvert.outputName("a/b/c.brp", "b/c.brp", "midi",
+                                              "out"),
+                         os.path.join("out", "b", "c.mid"))
+
+    def _convert(self, outputFormat, jobs=1, **kwargs):
+        progress = []
+        results = DBConvert.convertFiles(
+            [self.inputDir], outputFormat, self.outputDir, jobs=jobs,
+            progress=lambda *args: progress.append(args[:2]), **kwargs)
+        self.assertEqual(sorted(progress), [(1, 2), (2, 2)])
+        return sorted(results)
+
+    def _checkResults(self, results, extension):
+        stem = os.path.splitext(SONG)[0]
+        self.assertEqual(
+            results,
+            [(os.path.join(self.inputDir, version, SONG),
+              os.path.join(self.outputDir, version,
+                           os.extsep.join([stem, extension])),
+              None) for version in ("v0", "v1")])
+        for unusedInput, outName, unusedError in results:
+            self.assertTrue(os.path.getsize(outName) > 0)
+
+    def testAscii(self):
+        results = self._convert("txt")
+        self._checkResults(results, "txt")
+        with open(results[0][1]) as handle:
+            self.assertIn("Basket Case", handle.read())
+
+    def testMidi(self):
+        results = self._convert("midi")
+        self._checkResults(results, "mid")
+        with open(results[0][1], "rb") as handle:
+            self.assertEqual(handle.read(4), "MThd")
+
+    def testLilypond(self):
+        results = self._convert("ly")
+        self._checkResults(results, "ly")
+
+    def testScoreFile(self):
+        results = self._convert("brp", fileFormat=DBConstants.DBFF_3)
+        self._checkResults(results, "brp")
+        original = ScoreSerializer.loadScore(results[1][0])
+        converted = ScoreSerializer.loadScore(results[1][1])
+        self.assertEqual(converted.fileFormat, DBConstants.DBFF_3)
+        self.assertEqual(converted.numMeasures(), original.numMeasures())
+
+    def testUnicodeTitle(self):
+        filename = os.path.join(self.inputDir, "v1", SONG)
+        score = ScoreSerializer.loadScore(filename)
+        score.scoreData.title = u"Caf\xe9"
+        ScoreSerializer.saveScore(score, filename)
+        for outputFormat in ("txt", "ly"):
+            outName = DBConvert.outputName(filename, SONG, outputFormat,
+                                           self.outputDir)
+            result = DBConvert.convertFile((filename, outName, outputFormat,
+                                            DBConstants.DBFF_2))
+            self.assertEqual(result[2], None)
+            with open(outName) as handle:
+                self.assertIn(u"Caf\xe9".encode('utf-8'), handle.read())
+
+    def testFailedSaveLeavesNoTempFile(self):
+        def failingSave(unusedScore, filename, unusedFormat):
+            with open(filename, "w") as handle:
+                handle.write("partial")
+            raise IOError("disk full")
+        filename = os.path.join(self.inputDir, "v1", SONG)
+        saveScore = ScoreSerializer.__dict__["saveScore"]
+        ScoreSerializer.saveScore = staticmethod(failingSave)
+        try:
+            result = DBConvert.convertFile((filename, filename, "brp",
+                                            DBConstants.DBFF_2))
+        finally:
+            ScoreSerializer.saveScore = saveScore
+        self.assertTrue(result[2].startswith("IOError"))
+        self.assertEqual(os.listdir(os.path.dirname(filename)), [SONG])
+
+    def testProcessPool(self):
+        results = self._convert("txt", jobs=2)
+        self._checkResults(results, "txt")
+
+    def testErrorReport(self):
+        with open(os.path.join(self.inputDir, "v1", SONG), "w") as handle:
+            handle.write("DB_FILE_FORMAT 99\n")
+        results = self._convert("txt")
+        self.assertEqual(results[0][2], None)
+        self.assertTrue(results[1][2].startswith("DBVersionError"))
+        self.assertFalse(os.path.exists(results[1][1]))
+
+
+if __name__ == "__main__":
+    unittest.main()
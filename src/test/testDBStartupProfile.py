@@ -0,0 +1,79 @@
+# Copyright 2017 Michael Thomas
+#
+# See www.whatang.org for more information.
+#
+# This file is part of DrumBurp.
+#
+# DrumBurp is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DrumBurp is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DrumBurp.  If not, see <http://www.gnu.org/licenses/>
+import unittest
+from cStringIO import StringIO
+from DBStartupProfile import StartupProfile
+
+# pylint: disable-msg=R0904
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 10.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestStartupProfile(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.modules = {"sys": None}
+        self.profile = StartupProfile(startTime=9.5, clock=self.clock,
+                                      modules=self.modules)
+
+    def _run(self):
+        self.profile.mark("Options")
+        self.clock.now = 11.0
+        self.modules.update({"PyQt4": None, "PyQt4.QtGui": None})
+        self.profile.mark("Import")
+        self.clock.now = 15.0
+        self.profile.mark("Splash", waiting=True)
+        self.clock.now = 15.25
+        self.modules["GUI.DBMidi"] = None
+        self.profile.mark("Window")
+
+    def testPhases(self):
+        self._run()
+        self.assertEqual(list(self.profile.iterPhases()),
+                         [("Options", 0.5, 0, False),
+                          ("Import", 1.0, 2, False),
+                          ("Splash", 4.0, 0, True),
+                          ("Window", 0.25, 1, False)])
+
+    def testTotalSkipsWaiting(self):
+        self._run()
+        self.assertEqual(self.profile.total(), 1.75)
+
+    def testReport(self):
+        self._run()
+        output = StringIO()
+        self.profile.report(output)
+        lines = output.getvalue().splitlines()
+        self.assertEqual(lines[0], "Startup profile:")
+        self.assertEqual(len(lines), 6)
+        self.assertTrue(lines[2].startswith("  Import "))
+        self.assertTrue(lines[2].endswith("1.000s     2 modules"))
+        self.assertTrue(lines[3].endswith("(waiting, not in total)"))
+        self.assertEqual(lines[5].split(), ["Total", "1.750s", "3",
+                                            "modules"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -43,6 +43,35 @@ class TestDbFileIterator(unittest.TestCase):
                           ("SECONDLINE", "hasdata"),
                           ("THIRDLINE", "comes after a blank")])
 
+    def testBatch(self):
+        mockfile = """first 1
+        note 1
+        NOTE 2
+
+        note 3
+        second 2
+        note 4
+        """
+        mockfile = StringIO(mockfile)
+        iterator = fileUtils.dbFileIterator(mockfile, batchTypes=["NOTE"])
+        lines = list(iterator)
+        self.assertEqual(lines,
+                         [("FIRST", "1"),
+                          ("NOTE", ["1", "2", "3"]),
+                          ("SECOND", "2"),
+                          ("NOTE", ["4"])])
+
+    def testBatchPosition(self):
+        mockfile = StringIO("first 1\nnote 1\nnote 2\nsecond 2\nnote 3\n")
+        iterator = fileUtils.dbFileIterator(mockfile, batchTypes=["NOTE"])
+        positions = [(lineType, iterator.lineNumber, iterator.currentLine)
+                     for lineType, unusedData in iterator]
+        self.assertEqual(positions,
+                         [("FIRST", 0, "first 1"),
+                          ("NOTE", 1, "note 1"),
+                          ("SECOND", 3, "second 2"),
+                          ("NOTE", 4, "note 3")])
+
 
 class TestIndenter(unittest.TestCase):
 
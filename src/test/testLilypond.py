@@ -9,7 +9,9 @@ from Notation import lilypond
 from Data.DrumKitFactory import DrumKitFactory
 from Data.Counter import CounterRegistry
 from Data.Measure import Measure
-from Data.MeasureCount import MeasureCount
+from Data.MeasureCount import MeasureCount, counterMaker
+from Data.Score import Score
+from Data.NotePosition import NotePosition
 
 _REG = CounterRegistry()
 
@@ -48,5 +50,124 @@ class TestCompoundSticking(unittest.TestCase):
                          r'\new Lyrics \with { alignAboveContext = #"main" } \lyricmode { " "4 " "4 " "4 \times 2/3 { L8 R8 L8 } }')
 
 
+class TestSectionPieces(unittest.TestCase):
+    def setUp(self):
+        self.score = Score()
+        self.score.drumKit = DrumKitFactory.getNamedDefaultKit()
+        counter = counterMaker(4, 16)
+        for dummy in range(6):
+            self.score.insertMeasureByIndex(16, counter=counter)
+        self.score.formatScore(80)
+        self.score.scoreData.title = "Song"
+        for index, title in ((1, "Verse"), (3, "Chorus")):
+            position = self.score.measureIndexToPosition(index)
+            self.score.setSectionEnd(position, True, title)
+            self.score.formatScore(80)
+
+    def _write(self, piece=None):
+        output = StringIO.StringIO()
+        lilypond.LilypondScore(self.score, piece).write(output)
+        return output.getvalue()
+
+    def testPieces(self):
+        self.assertEqual(list(lilypond.iterSectionPieces(self.score)),
+                         [(0, 0, 2), (1, 2, 4), (2, 4, 6)])
+
+    def testPiecesEndingWithSection(self):
+        position = self.score.measureIndexToPosition(5)
+        self.score.setSectionEnd(position, True, "Outro")
+        self.score.formatScore(80)
+        self.assertEqual(list(lilypond.iterSectionPieces(self.score)),
+                         [(0, 0, 2), (1, 2, 4), (2, 4, 6)])
+
+    def testNoPieces(self):
+        self.assertEqual(list(lilypond.iterSectionPieces(Score())), [])
+
+    def testWritePieces(self):
+        whole = self._write()
+        self.assertEqual(whole.count(r'\mark "'), 2)
+        first, middle, last = [self._write(piece) for piece in
+                               lilypond.iterSectionPieces(self.score)]
+        self.assertIn('title = "Song"', first)
+        self.assertIn('tagline = ##f', first)
+        self.assertIn(r'\mark "Verse"', first)
+        self.assertNotIn(r'\mark "Chorus"', first)
+        self.assertNotIn('title = "Song"', middle)
+        self.assertIn('tagline = ##f', middle)
+        self.assertIn(r'\mark "Chorus"', middle)
+        self.assertNotIn(r'\mark "Verse"', middle)
+        self.assertNotIn('title = "Song"', last)
+        self.assertNotIn('tagline = ##f', last)
+        self.assertNotIn(r'\mark "', last)
+        self.assertEqual(first.count(r"\break") + middle.count(r"\break")
+                         + last.count(r"\break"), whole.count(r"\break"))
+
+    def testPieceTempo(self):
+        self.score.scoreData.bpm = 100
+        self.score.getMeasureByIndex(1).newBpm = 140
+        first, middle, last = [self._write(piece) for piece in
+                               lilypond.iterSectionPieces(self.score)]
+        self.assertEqual(middle.count(r"\tempo"), 1)
+        self.assertIn(r"\tempo 4 = 140", middle)
+        self.score.getMeasureByIndex(4).newBpm = 90
+        last = self._write((2, 4, 6))
+        self.assertEqual(last.count(r"\tempo"), 1)
+        self.assertIn(r"\tempo 4 = 90", last)
+
+
+class TestChordOrder(unittest.TestCase):
+    def testDrumIndexOrder(self):
+        # Chords list their notes in drum index order, whatever order the
+        # notes were added in.
+        kit = DrumKitFactory.getNamedDefaultKit()
+        measure = Measure()
+        mc = MeasureCount()
+        mc.addSimpleBeats(_REG.getCounterByName("8ths"), 4)
+        measure.setBeatCount(mc)
+        for drumIndex in (8, 6, 7):
+            measure.addNote(NotePosition(noteTime=0, drumIndex=drumIndex),
+                            kit[drumIndex].head)
+        lilyMeasure = lilypond.LilyMeasure(measure, lilypond.LilyKit(kit))
+        indenter = lilypond.LilyIndenter()
+        output = StringIO.StringIO()
+        indenter.setHandle(output)
+        lilyMeasure.voiceOne(indenter)
+        self.assertEqual(output.getvalue().strip(), "<ri hh cr>4 r2.")
+
+
+class TestDurationTables(unittest.TestCase):
+    def testDurations(self):
+        mc = MeasureCount()
+        mc.addSimpleBeats(_REG.getCounterByName("16ths"), 1)
+        beat = mc.beats[0]
+        dur = lilypond.makeLilyDuration(beat, 3, 0)
+        self.assertEqual((dur.duration, dur.restTime, dur.isBeatStart),
+                         ("8.", None, True))
+        again = lilypond.makeLilyDuration(beat, 3, 1)
+        self.assertIsNot(again, dur)
+        self.assertEqual((again.duration, again.restTime, again.isBeatStart),
+                         ("8.", None, False))
+        dur = lilypond.makeLilyDuration(beat, 1, 3)
+        self.assertEqual((dur.duration, dur.restTime), ("16", None))
+
+
+class TestMeasureCache(unittest.TestCase):
+    def testRepeatedMeasures(self):
+        score = Score()
+        score.drumKit = DrumKitFactory.getNamedDefaultKit()
+        counter = counterMaker(4, 16)
+        head = score.drumKit[0].head
+        for index in range(8):
+            score.insertMeasureByIndex(16, counter=counter)
+            measure = score.getMeasureByIndex(index)
+            measure.addNote(NotePosition(noteTime=index % 2, drumIndex=0),
+                            head)
+        score.formatScore(80)
+        lyScore = lilypond.LilypondScore(score)
+        output = StringIO.StringIO()
+        lyScore.write(output)
+        self.assertEqual(len(lyScore._measureCache), 2)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,126 @@
+# Copyright 2017 Michael Thomas
+#
+# See www.whatang.org for more information.
+#
+# This file is part of DrumBurp.
+#
+# DrumBurp is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DrumBurp is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DrumBurp.  If not, see <http://www.gnu.org/licenses/>
+import unittest
+import os
+import shutil
+import tempfile
+from GUI.LilypondCache import LilypondCache
+
+# pylint: disable-msg=R0904
+
+
+class TestLilypondCache(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.cache = LilypondCache(os.path.join(self.tempdir, "cache"),
+                                   maxBytes=100)
+        self.outdir = os.path.join(self.tempdir, "out")
+        os.mkdir(self.outdir)
+        self.stem = os.path.join(self.outdir, "db")
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def _write(self, name, data):
+        with open(os.path.join(self.outdir, name), "wb") as handle:
+            handle.write(data)
+
+    def _read(self, name):
+        with open(os.path.join(self.outdir, name), "rb") as handle:
+            return handle.read()
+
+    def _clearOutput(self):
+        for name in os.listdir(self.outdir):
+            os.unlink(os.path.join(self.outdir, name))
+
+    def testKey(self):
+        key = LilypondCache.makeKey(u"\\score {}", u"png", u"2.18.2")
+        self.assertEqual(key,
+                         LilypondCache.makeKey(u"\\score {}", u"png",
+                                               u"2.18.2"))
+        self.assertNotEqual(key,
+                            LilypondCache.makeKey(u"\\score { }", u"png",
+                                                  u"2.18.2"))
+        self.assertNotEqual(key,
+                            LilypondCache.makeKey(u"\\score {}", u"pdf",
+                                                  u"2.18.2"))
+        self.assertNotEqual(key,
+                            LilypondCache.makeKey(u"\\score {}", u"png",
+                                                  u"2.19.0"))
+
+    def testMiss(self):
+        self.assertFalse(self.cache.fetch("abc", self.stem, "png"))
+
+    def testStoreAndFetch(self):
+        self._write("db-page1.png", "page one")
+        self._write("db-page2.png", "page two")
+        self._write("db.ly", "source")
+        self._write("other.png", "not ours")
+        self.cache.store("abc", self.stem, "png")
+        self._clearOutput()
+        fetched = self.cache.fetch("abc", self.stem, "png")
+        self.assertEqual(sorted(fetched),
+                         [os.path.join(self.outdir, "db-page1.png"),
+                          os.path.join(self.outdir, "db-page2.png")])
+        self.assertEqual(sorted(os.listdir(self.outdir)),
+                         ["db-page1.png", "db-page2.png"])
+        self.assertEqual(self._read("db-page1.png"), "page one")
+        self.assertEqual(self._read("db-page2.png"), "page two")
+
+    def testFetchToNewStem(self):
+        self._write("db.pdf", "pdf data")
+        self.cache.store("abc", self.stem, "pdf")
+        self.assertTrue(self.cache.fetch("abc",
+                                         os.path.join(self.outdir, "song"),
+                                         "pdf"))
+        self.assertEqual(self._read("song.pdf"), "pdf data")
+        self.assertFalse(self.cache.fetch("abc", self.stem, "png"))
+
+    def testNothingToStore(self):
+        self.cache.store("abc", self.stem, "png")
+        self.assertFalse(self.cache.fetch("abc", self.stem, "png"))
+
+    def testEvictLeastRecentlyUsed(self):
+        for index, key in enumerate(["a", "b", "c"]):
+            self._write("db.png", "x" * 40)
+            self.cache.store(key, self.stem, "png")
+            os.utime(os.path.join(self.cache.directory, key),
+                     (1000 + index, 1000 + index))
+        # Only two 40 byte entries fit; storing c evicted a.
+        self.assertFalse(self.cache.fetch("a", self.stem, "png"))
+        self.assertEqual(self.cache.size(), 80)
+        # Using b makes c the least recently used.
+        self.assertTrue(self.cache.fetch("b", self.stem, "png"))
+        self._write("db.png", "y" * 40)
+        self.cache.store("d", self.stem, "png")
+        self.assertFalse(self.cache.fetch("c", self.stem, "png"))
+        self.assertTrue(self.cache.fetch("b", self.stem, "png"))
+        self.assertTrue(self.cache.fetch("d", self.stem, "png"))
+        self.assertEqual(self._read("db.png"), "y" * 40)
+
+    def testClear(self):
+        self._write("db.png", "data")
+        self.cache.store("abc", self.stem, "png")
+        self.cache.clear()
+        self.assertEqual(self.cache.size(), 0)
+        self.assertFalse(self.cache.fetch("abc", self.stem, "png"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -22,7 +22,7 @@ Created on 12 Dec 2010
 @author: Mike Thomas
 '''
 import unittest
-from Data.Measure import Measure
+from Data.Measure import Measure, _NoteGrid, _NoteDictionary
 from Data.Counter import CounterRegistry
 from Data.MeasureCount import MeasureCount
 from Data.DBErrors import BadTimeError
@@ -99,6 +99,30 @@ class TestMeasure(unittest.TestCase):
             self.assertEqual(np.noteTime, 4 * i)
             self.assertEqual(np.drumIndex, i)
 
+    def testSetBeatCountInterns(self):
+        counter = self.reg.getCounterByName("16ths")
+        mc = MeasureCount()
+        mc.addSimpleBeats(counter, 4)
+        self.assert_(self.measure.counter is mc.interned())
+        self.measure.addNote(NotePosition(noteTime=5, drumIndex=0), "x")
+        other = MeasureCount()
+        other.addSimpleBeats(counter, 4)
+        self.measure.setBeatCount(other)
+        self.assert_(self.measure.counter is mc.interned())
+        self.assertEqual(self.measure.noteAt(5, 0), "x")
+
+    def testIterNotesRaw(self):
+        for i in range(0, 4):
+            self.measure.addNote(NotePosition(noteTime=4 * i,
+                                              drumIndex=i), str(i))
+        self.measure.addNote(NotePosition(noteTime=4, drumIndex=0), "x")
+        self.assertEqual(list(self.measure.iterNotesRaw()),
+                         [(0, 0, "0"), (4, 0, "x"), (4, 1, "1"),
+                          (8, 2, "2"), (12, 3, "3")])
+        self.assertEqual(list(self.measure.iterNotesRaw()),
+                         [(np.noteTime, np.drumIndex, head)
+                          for np, head in self.measure])
+
     def testDeleteNote(self):
         np = NotePosition(noteTime=0, drumIndex=0)
         self.measure.addNote(np, "o")
@@ -106,6 +130,13 @@ class TestMeasure(unittest.TestCase):
         self.assertEqual(self.measure.numNotes(), 0)
         self.assertEqual(self.measure.getNote(np), EMPTY_NOTE)
 
+    def testAddNote_NegativeDrum(self):
+        self.measure.addNote(NotePosition(noteTime=0, drumIndex=2), "x")
+        self.assertRaises(BadTimeError, self.measure.addNote,
+                          NotePosition(noteTime=0, drumIndex=-1), "o")
+        self.measure.deleteNote(NotePosition(noteTime=0, drumIndex=-1))
+        self.assertEqual(self.measure.noteAt(0, 2), "x")
+
     def testDeleteNote_BadTime(self):
         self.assertRaises(BadTimeError, self.measure.deleteNote,
                           NotePosition(noteTime=-1, drumIndex=0))
@@ -370,5 +401,179 @@ class TestCallBack(unittest.TestCase):
         self.assertEqual(len(self.calls), 0)
 
 
+class TestDigest(unittest.TestCase):
+    reg = CounterRegistry()
+
+    def setUp(self):
+        self.measure = Measure(16)
+        counter = self.reg.getCounterByName("16ths")
+        mc = MeasureCount()
+        mc.addSimpleBeats(counter, 4)
+        self.measure.setBeatCount(mc)
+
+    def testDigestIsCached(self):
+        digest = self.measure.digest()
+        self.assertTrue(self.measure.digest() is digest)
+
+    def testNotesChangeDigest(self):
+        digest = self.measure.digest()
+        np = NotePosition(noteTime=0, drumIndex=0)
+        self.measure.addNote(np, "x")
+        self.assertNotEqual(self.measure.digest(), digest)
+        self.measure.deleteNote(np)
+        self.assertEqual(self.measure.digest(), digest)
+
+    def testDecorationsChangeDigest(self):
+        digest = self.measure.digest()
+        self.measure.setLineBreak(True)
+        self.assertNotEqual(self.measure.digest(), digest)
+        self.measure.setLineBreak(False)
+        self.measure.simileDistance = 2
+        self.assertNotEqual(self.measure.digest(), digest)
+        self.measure.simileDistance = 0
+        self.measure.aboveText = "R"
+        self.assertNotEqual(self.measure.digest(), digest)
+        self.measure.aboveText = ""
+        self.assertEqual(self.measure.digest(), digest)
+
+    def testChangeKitChangesDigest(self):
+        empty = self.measure.digest()
+        self.measure.addNote(NotePosition(noteTime=0, drumIndex=0), "x")
+        digest = self.measure.digest()
+        self.measure.changeKit([], [])
+        self.assertEqual(self.measure.numNotes(), 0)
+        self.assertNotEqual(self.measure.digest(), digest)
+        self.assertEqual(self.measure.digest(), empty)
+
+    def testSetNoteArraysChangesDigest(self):
+        digest = self.measure.digest()
+        self.measure.setNoteArrays([1], [0], [0], Measure.headCodes(["x"]))
+        self.assertNotEqual(self.measure.digest(), digest)
+        self.assertEqual(self.measure.getNote(NotePosition(noteTime=1,
+                                                           drumIndex=0)),
+                         "x")
+
+    def testSetNoteArraysBadTime(self):
+        self.assertRaises(BadTimeError, self.measure.setNoteArrays,
+                          [99], [0], [0], Measure.headCodes(["x"]))
+        self.assertEqual(self.measure.numNotes(), 0)
+
+    def testCopyHasSameDigest(self):
+        self.measure.addNote(NotePosition(noteTime=3, drumIndex=2), "o")
+        self.assertEqual(self.measure.copyMeasure().digest(),
+                         self.measure.digest())
+
+
+class TestNoteGrid(unittest.TestCase):
+    storage = _NoteGrid
+
+    def setUp(self):
+        self.notes = self.storage(8)
+
+    def testEmpty(self):
+        self.assertEqual(len(self.notes), 0)
+        self.assertEqual(self.notes.numNotes(), 0)
+        self.assertEqual(list(self.notes.iterTimes()), [])
+        self.assertEqual(self.notes.getNote(3, 5), EMPTY_NOTE)
+        self.assertEqual(self.notes.notesOnLine(5), 0)
+        self.assertFalse(3 in self.notes)
+
+    def testSetAndDelete(self):
+        self.assert_(self.notes.setNote(3, 5, "x"))
+        self.assertFalse(self.notes.setNote(3, 5, "x"))
+        self.assert_(self.notes.setNote(3, 5, "o"))
+        self.assert_(self.notes.setNote(3, 1, "x"))
+        self.assert_(self.notes.setNote(6, 1, "g"))
+        self.assertEqual(len(self.notes), 2)
+        self.assertEqual(self.notes.numNotes(), 3)
+        self.assertEqual(self.notes.notesOnLine(1), 2)
+        self.assertEqual(self.notes.getNote(3, 5), "o")
+        self.assertEqual(list(self.notes.iterTimes()), [3, 6])
+        self.assertEqual([(np.noteTime, np.drumIndex, head)
+                          for np, head in self.notes.iterNotesAndHeads()],
+                         [(3, 1, "x"), (3, 5, "o"), (6, 1, "g")])
+        self.assert_(self.notes.delNote(3, 5))
+        self.assertFalse(self.notes.delNote(3, 5))
+        self.assertEqual(self.notes.notesOnLine(5), 0)
+        self.notes.deleteAllNotesAtTime(3)
+        self.assertFalse(3 in self.notes)
+        self.assertEqual(list(self.notes.iterTimes()), [6])
+        self.assertEqual(self.notes.numNotes(), 1)
+
+    def testIterNotesRaw(self):
+        self.notes.setNote(6, 1, "g")
+        self.notes.setNote(3, 5, "o")
+        self.notes.setNote(3, 1, "x")
+        self.assertEqual(list(self.notes.iterNotesRaw()),
+                         [(3, 1, "x"), (3, 5, "o"), (6, 1, "g")])
+
+    def testSetWidth(self):
+        self.notes.setNote(2, 0, "x")
+        self.notes.setNote(7, 0, "x")
+        self.notes.setWidth(4)
+        self.assertEqual(list(self.notes.iterTimes()), [2])
+        self.assertEqual(self.notes.notesOnLine(0), 1)
+        self.notes.setWidth(10)
+        self.notes.setNote(9, 3, "o")
+        self.assertEqual(list(self.notes.iterTimes()), [2, 9])
+
+    def testCopy(self):
+        self.notes.setNote(2, 0, "x")
+        other = self.notes.copy()
+        other.setNote(4, 1, "o")
+        other.delNote(2, 0)
+        self.assertEqual(self.notes.getNote(2, 0), "x")
+        self.assertEqual(self.notes.getNote(4, 1), EMPTY_NOTE)
+        self.assertEqual(other.numNotes(), 1)
+
+    def testClear(self):
+        self.notes.setNote(2, 0, "x")
+        self.notes.clear()
+        self.assertEqual(len(self.notes), 0)
+        self.assertEqual(self.notes.notesOnLine(0), 0)
+        self.assert_(self.notes.setNote(2, 0, "x"))
+
+    def testFill(self):
+        self.notes.setNote(1, 0, "x")
+        codes = Measure.headCodes(["x", "o"])
+        self.notes.fill([3, 3, 6, 3], [1, 5, 1, 1], [0, 1, 0, 1], codes)
+        self.assertEqual(len(self.notes), 2)
+        self.assertEqual(self.notes.numNotes(), 3)
+        self.assertEqual(self.notes.notesOnLine(1), 2)
+        self.assertEqual(self.notes.getNote(1, 0), EMPTY_NOTE)
+        self.assertEqual(list(self.notes.iterNotesRaw()),
+                         [(3, 1, "o"), (3, 5, "o"), (6, 1, "x")])
+
+
+class TestNoteDictionary(TestNoteGrid):
+    storage = _NoteDictionary
+
+
+class TestCopyMeasure(unittest.TestCase):
+    def setUp(self):
+        registry = CounterRegistry()
+        counter = MeasureCount()
+        counter.addSimpleBeats(registry.getCounterByName("16ths"), 4)
+        self.measure = Measure()
+        self.measure.setBeatCount(counter)
+        self.measure.addNote(NotePosition(noteTime=0, drumIndex=0), "x")
+
+    def testCopyIsIndependent(self):
+        copied = self.measure.copyMeasure()
+        copied.addNote(NotePosition(noteTime=4, drumIndex=1), "o")
+        copied.setRepeatEnd(True)
+        self.assertEqual(self.measure.numNotes(), 1)
+        self.assertFalse(self.measure.isRepeatEnd())
+        self.assertEqual(copied.numNotes(), 2)
+
+    def testPasteIsIndependent(self):
+        other = Measure(4)
+        other.pasteMeasure(self.measure)
+        self.assertEqual(len(other), 16)
+        self.assertEqual(other.noteAt(0, 0), "x")
+        other.deleteNote(NotePosition(noteTime=0, drumIndex=0))
+        self.assertEqual(self.measure.noteAt(0, 0), "x")
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -22,10 +22,11 @@ Created on 12 Dec 2012
 @author: Mike Thomas
 '''
 import unittest
+import copy
 
 # pylint: disable-msg=R0904
 
-from Data import MeasureCount, Counter, Beat
+from Data import MeasureCount, Counter, Beat, DBConstants
 
 
 class TestSimple(unittest.TestCase):
@@ -293,5 +294,82 @@ class TestTimeSigs(unittest.TestCase):
         self.assertEqual(count.timeSig(), (17, 16))
 
 
+class TestTimeTables(unittest.TestCase):
+    counter = Counter.Counter("e+a")
+
+    def testShared(self):
+        count1 = MeasureCount.makeSimpleCount(self.counter, 4)
+        count2 = MeasureCount.makeSimpleCount(Counter.Counter("e+a"), 4)
+        self.assertEqual(count1.signature(), count2.signature())
+        table = count1.midiTickTable(0)
+        self.assert_(isinstance(table, tuple))
+        self.assert_(count2.midiTickTable(0) is table)
+        self.assertEqual(list(count1.iterMidiTicks(0)), list(table))
+
+    def testSwingAndResolution(self):
+        count = MeasureCount.makeSimpleCount(self.counter, 4)
+        straight = count.midiTickTable(0)
+        swung = count.midiTickTable(16)
+        self.assertNotEqual(straight, swung)
+        self.assertEqual(swung, tuple(count._iterTimeCounter(
+            DBConstants.MIDITICKSPERBEAT, 16)))
+        self.assertEqual(count.timeTable(100, 0)[-1], 400)
+
+    def testTempoNotCached(self):
+        count = MeasureCount.makeSimpleCount(self.counter, 4)
+        count.midiTickTable(0)
+        numTables = len(MeasureCount._TICK_TABLES)
+        for bpm in xrange(60, 200):
+            table = count.timeTable(60000.0 / bpm, 0)
+            self.assertAlmostEqual(table[-1], 4 * 60000.0 / bpm)
+        self.assertEqual(len(MeasureCount._TICK_TABLES), numTables)
+
+    def testChangeBeats(self):
+        count = MeasureCount.makeSimpleCount(self.counter, 4)
+        signature = count.signature()
+        self.assertEqual(len(count.midiTickTable()), 17)
+        self.assertEqual(len(count.beatTickTable()), 16)
+        self.assertEqual(count.beatStartTable(), (0, 4, 8, 12))
+        count.addSimpleBeats(self.counter, 1)
+        self.assertNotEqual(count.signature(), signature)
+        self.assertEqual(len(count.midiTickTable()), 21)
+        self.assertEqual(len(count.beatTickTable()), 20)
+        self.assertEqual(count.beatStartTable(), (0, 4, 8, 12, 16))
+        count.beats = count.beats[:2]
+        self.assertEqual(len(count.midiTickTable()), 9)
+        self.assertEqual(count.beatStartTable(), (0, 4))
+
+
+class TestInterning(unittest.TestCase):
+    counter = Counter.Counter("e+a")
+
+    def testSameSignatureShared(self):
+        first = MeasureCount.makeSimpleCount(self.counter, 3).interned()
+        second = MeasureCount.makeSimpleCount(self.counter, 3)
+        self.assertFalse(second.isInterned())
+        self.assert_(second.interned() is first)
+        self.assert_(first.interned() is first)
+        self.assertFalse(second.isInterned())
+        other = MeasureCount.makeSimpleCount(self.counter, 5).interned()
+        self.assert_(other is not first)
+
+    def testInternedIsImmutable(self):
+        count = MeasureCount.makeSimpleCount(self.counter, 7).interned()
+        self.assert_(count.isInterned())
+        self.assertRaises(TypeError, count.addSimpleBeats, self.counter, 1)
+        self.assertRaises(TypeError, setattr, count, "beats", [])
+        self.assertEqual(len(count), 28)
+
+    def testCopy(self):
+        count = MeasureCount.makeSimpleCount(self.counter, 6)
+        copied = copy.deepcopy(count)
+        self.assert_(copied is not count)
+        copied.addSimpleBeats(self.counter, 1)
+        self.assertEqual(count.numBeats(), 6)
+        count = count.interned()
+        self.assert_(copy.copy(count) is count)
+        self.assert_(copy.deepcopy(count) is count)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,183 @@
+# Copyright 2017 Michael Thomas
+#
+# See www.whatang.org for more information.
+#
+# This file is part of DrumBurp.
+#
+# DrumBurp is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DrumBurp is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DrumBurp.  If not, see <http://www.gnu.org/licenses/>
+import unittest
+import struct
+from cStringIO import StringIO
+from Data.Score import Score
+from Data import DrumKit, Drum, MeasureCount
+from Data.DBConstants import MIDITICKSPERBEAT
+from Data.NotePosition import NotePosition
+from Notation import MidiExport
+
+# pylint: disable-msg=R0904
+
+
+def makeScore(numMeasures=2):
+    """A two drum score, also used by testMidiPlayback."""
+    score = Score()
+    score.drumKit = DrumKit.DrumKit()
+    hihat = Drum.Drum("HiHat", "Hh", "x")
+    hihat.addNoteHead("x", Drum.HeadData(42, 96))
+    hihat.addNoteHead("#", Drum.HeadData(42, 96, "choke"))
+    score.drumKit.addDrum(hihat)
+    snare = Drum.Drum("Snare", "Sn", "o")
+    snare.addNoteHead("o", Drum.HeadData(38, 96))
+    snare.addNoteHead("f", Drum.HeadData(38, 96, "flam"))
+    score.drumKit.addDrum(snare)
+    counter = MeasureCount.counterMaker(2, 8)
+    for dummy in range(numMeasures):
+        score.insertMeasureByIndex(8, counter=counter)
+    measure = score.getMeasureByIndex(0)
+    measure.addNote(NotePosition(noteTime=0, drumIndex=0), "x")
+    measure.addNote(NotePosition(noteTime=2, drumIndex=1), "o")
+    measure = score.getMeasureByIndex(1)
+    measure.addNote(NotePosition(noteTime=0, drumIndex=1), "f")
+    measure.addNote(NotePosition(noteTime=4, drumIndex=0), "#")
+    measure.newBpm = 90
+    return score
+
+
+def _readVarLen(data, offset):
+    value = 0
+    while True:
+        byte = ord(data[offset])
+        offset += 1
+        value = (value << 7) | (byte & 0x7F)
+        if not byte & 0x80:
+            return value, offset
+
+
+def _readChunks(data):
+    chunks = []
+    offset = 0
+    while offset < len(data):
+        tag, length = struct.unpack(">4sI", data[offset:offset + 8])
+        offset += 8
+        chunks.append((tag, data[offset:offset + length]))
+        offset += length
+    return chunks
+
+
+def _readEvents(track):
+    events = []
+    offset = 0
+    now = 0
+    while offset < len(track):
+        delta, offset = _readVarLen(track, offset)
+        now += delta
+        if track[offset] == "\xff":
+            length, dataStart = _readVarLen(track, offset + 2)
+            events.append((now, track[offset:dataStart + length]))
+            offset = dataStart + length
+        else:
+            events.append((now, track[offset:offset + 3]))
+            offset += 3
+    return events
+
+
+class TestSevenBitDelta(unittest.TestCase):
+    def _encode(self, value):
+        data = []
+        MidiExport.encodeSevenBitDelta(value, data)
+        return data
+
+    def testValues(self):
+        self.assertEqual(self._encode(0), [0])
+        self.assertEqual(self._encode(-5), [0])
+        self.assertEqual(self._encode(0x40), [0x40])
+        self.assertEqual(self._encode(0x7F), [0x7F])
+        self.assertEqual(self._encode(0x80), [0x81, 0x00])
+        self.assertEqual(self._encode(0x2000), [0xC0, 0x00])
+        self.assertEqual(self._encode(0x0FFFFFFF), [0xFF, 0xFF, 0xFF, 0x7F])
+
+
+class TestExportMidi(unittest.TestCase):
+    def setUp(self):
+        self.score = makeScore()
+
+    def _export(self, trackPerDrum=False):
+        handle = StringIO()
+        MidiExport.exportMidi(self.score.iterMeasuresWithRepeats(),
+                              self.score, handle, trackPerDrum)
+        return _readChunks(handle.getvalue())
+
+    def testFormat0(self):
+        chunks = self._export()
+        self.assertEqual(len(chunks), 2)
+        self.assertEqual(chunks[0],
+                         ("MThd", struct.pack(">HHH", 0, 1,
+                                              MIDITICKSPERBEAT)))
+        self.assertEqual(chunks[1][0], "MTrk")
+        events = _readEvents(chunks[1][1])
+        self.assertEqual(events[0], (0, "\xff\x01\x15Created with DrumBurp"))
+        self.assertEqual(events[-1][1], "\xff\x2f\x00")
+        times = [eventTime for eventTime, unusedEvent in events]
+        self.assertEqual(times, sorted(times))
+        messages = [event for unusedTime, event in events]
+        self.assertEqual(messages.count("\x99\x2a\x60"), 2)
+        self.assertEqual(messages.count("\x99\x26\x60"), 2)
+        self.assertEqual(messages.count("\x99\x26\x30"), 1)
+        self.assertEqual(messages.count("\xb9\x78\x00"), 1)
+        tempos = [event for event in events if event[1][:2] == "\xff\x51"]
+        self.assertEqual(len(tempos), 2)
+        self.assertEqual(tempos[1][1], "\xff\x51\x03" +
+                         struct.pack(">I", 60000000 / 90)[1:])
+
+    def testFlamBeforeNote(self):
+        events = _readEvents(self._export()[1][1])
+        flamTimes = [eventTime for eventTime, event in events
+                     if event == "\x99\x26\x30"]
+        noteTimes = [eventTime for eventTime, event in events
+                     if event == "\x99\x26\x60"]
+        self.assertEqual(noteTimes[1] - flamTimes[0],
+                         MIDITICKSPERBEAT / MidiExport.FLAM_TIME_CONSTANT)
+
+    def testFlamOnFirstNote(self):
+        measure = self.score.getMeasureByIndex(0)
+        measure.addNote(NotePosition(noteTime=0, drumIndex=1), "f")
+        events = _readEvents(self._export()[1][1])
+        flamTimes = [eventTime for eventTime, event in events
+                     if event == "\x99\x26\x30"]
+        hihatTimes = [eventTime for eventTime, event in events
+                      if event == "\x99\x2a\x60"]
+        self.assertEqual(flamTimes[0], 0)
+        self.assertEqual(hihatTimes[0], 1)
+
+    def testFormat1(self):
+        chunks = self._export(True)
+        self.assertEqual(len(chunks), 4)
+        self.assertEqual(chunks[0],
+                         ("MThd", struct.pack(">HHH", 1, 3,
+                                              MIDITICKSPERBEAT)))
+        conductor = _readEvents(chunks[1][1])
+        self.assertEqual(len([event for event in conductor
+                              if event[1][:2] == "\xff\x51"]), 2)
+        hihat = _readEvents(chunks[2][1])
+        self.assertEqual(hihat[0], (0, "\xff\x03\x05HiHat"))
+        self.assertEqual([event for unusedTime, event in hihat
+                          if event[0] != "\xff"][:3],
+                         ["\x99\x2a\x60", "\x99\x2a\x60", "\xb9\x78\x00"])
+        snare = _readEvents(chunks[3][1])
+        self.assertEqual(snare[0], (0, "\xff\x03\x05Snare"))
+        ends = [track[-1] for track in (conductor, hihat, snare)]
+        self.assertEqual(len(set(ends)), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,229 @@
+# Copyright 2017 Michael Thomas
+#
+# See www.whatang.org for more information.
+#
+# This file is part of DrumBurp.
+#
+# DrumBurp is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# DrumBurp is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with DrumBurp.  If not, see <http://www.gnu.org/licenses/>
+import unittest
+import sys
+import threading
+from cStringIO import StringIO
+from Data import DBErrors
+from Notation import MidiPlayback
+from Notation.MidiExport import (PERCUSSION_NOTE_ON, PERCUSSION_CHOKE,
+                                 CHOKE_MSG, CHOKE_VELOCITY)
+from Data.NotePosition import NotePosition
+from testMidiExport import makeScore
+
+# pylint: disable-msg=R0904
+
+
+class FakeOutput(object):
+    def __init__(self):
+        self.events = []
+
+    def write(self, events):
+        self.events.extend(events)
+
+    def clear(self):
+        self.events = []
+
+
+class TestMidiScheduler(unittest.TestCase):
+    def setUp(self):
+        self.score = makeScore()
+        self.output = FakeOutput()
+        self.highlights = []
+        self.finished = []
+        self.scheduler = MidiPlayback.MidiScheduler(self.output, lambda: 0,
+                                                    lookahead=250)
+        self.scheduler.measureCallback = (lambda index, nextIndex:
+                                          self.highlights.append((index,
+                                                                  nextIndex)))
+        self.scheduler.finishedCallback = lambda: self.finished.append(True)
+        self.scheduler.prepare(self.score.iterMeasuresWithRepeats(),
+                               self.score, startTime=1000)
+
+    def testFirstMeasure(self):
+        self.assertTrue(self.scheduler.pump(1000))
+        # The second measure starts at 3000, beyond the lookahead.
+        self.assertEqual(self.output.events,
+                         [[[PERCUSSION_NOTE_ON, 42, 96], 1000],
+                          [[PERCUSSION_NOTE_ON, 38, 96], 1500]])
+        self.assertEqual(self.highlights, [(0, 1)])
+
+    def testHighlightFollowsClock(self):
+        self.scheduler.pump(900)
+        self.assertEqual(self.highlights, [])
+        self.scheduler.pump(2800)
+        self.assertEqual(self.highlights, [(0, 1)])
+        self.scheduler.pump(2999)
+        self.assertEqual(self.highlights, [(0, 1)])
+        self.scheduler.pump(3000)
+        self.assertEqual(self.highlights, [(0, 1), (1, -1)])
+
+    def testSecondMeasure(self):
+        self.scheduler.pump(1000)
+        self.output.clear()
+        self.scheduler.pump(2750)
+        # 90 bpm, so 666.67ms per beat.
+        self.assertEqual(self.output.events,
+                         [[[PERCUSSION_NOTE_ON, 38, 48], 2979],
+                          [[PERCUSSION_NOTE_ON, 38, 96], 3000],
+                          [[PERCUSSION_NOTE_ON, 42, 96], 4333],
+                          [[PERCUSSION_CHOKE, CHOKE_MSG, CHOKE_VELOCITY],
+                           4500]])
+
+    def testEnd(self):
+        self.scheduler.pump(1000)
+        self.scheduler.pump(3000)
+        self.assertTrue(self.scheduler.pump(5600))
+        self.assertEqual(self.finished, [])
+        self.assertFalse(self.scheduler.pump(5667))
+        self.assertEqual(self.highlights, [(0, 1), (1, -1), (-1, -1)])
+        self.assertEqual(self.finished, [True])
+        self.assertFalse(self.scheduler.isPlaying())
+        self.assertFalse(self.scheduler.pump(6000))
+        self.assertEqual(self.finished, [True])
+
+    def testTempoChangeMidSong(self):
+        self.scheduler.pump(1000)
+        self.score.getMeasureByIndex(1).newBpm = 60
+        self.scheduler.updateTiming(self.score)
+        self.output.clear()
+        self.scheduler.pump(2750)
+        self.assertEqual(self.output.events[-1][1], 5250)
+        self.assertTrue(self.scheduler.pump(6999))
+        self.assertFalse(self.scheduler.pump(7000))
+
+    def testMuteMidSong(self):
+        self.scheduler.pump(1000)
+        self.scheduler.setMute(True)
+        self.output.clear()
+        self.scheduler.pump(2750)
+        self.assertEqual(self.output.events, [])
+        self.scheduler.pump(3000)
+        self.assertEqual(self.highlights, [(0, 1), (1, -1)])
+
+    def testTempoNeedsMessage(self):
+        self.scheduler.pump(1000)
+        self.score.getMeasureByIndex(1).newBpm = 60
+        self.output.clear()
+        self.scheduler.pump(2750)
+        # Still 90 bpm: the scheduler does not read the score itself.
+        self.assertEqual(self.output.events[-1][1], 4500)
+
+    def testEditWhilePlaying(self):
+        self.scheduler.pump(1000)
+        self.score.addNote(NotePosition(0, 1, 2, 0), "x")
+        self.score.deleteMeasureByIndex(1)
+        self.output.clear()
+        self.scheduler.updateTiming(self.score)
+        self.scheduler.pump(2750)
+        self.assertEqual([event[0] for event in self.output.events],
+                         [[PERCUSSION_NOTE_ON, 38, 48],
+                          [PERCUSSION_NOTE_ON, 38, 96],
+                          [PERCUSSION_NOTE_ON, 42, 96],
+                          [PERCUSSION_CHOKE, CHOKE_MSG, CHOKE_VELOCITY]])
+        self.assertTrue(self.scheduler.pump(5600))
+        self.assertFalse(self.scheduler.pump(5667))
+
+    def testLoopCount(self):
+        measures = list(self.score.iterMeasuresWithRepeats())
+        self.scheduler.prepare(measures[:1], self.score, startTime=0,
+                               loopCount=3)
+        now = 0
+        while self.scheduler.pump(now):
+            now += 100
+        self.assertEqual(now, 6000)
+        self.assertEqual(self.highlights, [(0, 0), (0, 0), (0, -1),
+                                           (-1, -1)])
+        self.assertEqual([event[1] for event in self.output.events],
+                         [0, 500, 2000, 2500, 4000, 4500])
+
+    def testLoopForever(self):
+        measures = list(self.score.iterMeasuresWithRepeats())
+        self.scheduler.prepare(measures, self.score, startTime=0,
+                               loopCount=None)
+        # Each pass of the two measures takes 4666.67ms.
+        for now in xrange(0, 100 * 4667, 250):
+            self.assertTrue(self.scheduler.pump(now))
+        self.assertEqual(self.output.events[6 * 100][1],
+                         int(round(100 * (2000 + 8000.0 / 3))))
+        self.assertEqual(self.highlights[-1], (1, 0))
+        self.assertEqual(len(self.scheduler._rendered), 2)
+
+    def testLoopTempoChange(self):
+        measures = list(self.score.iterMeasuresWithRepeats())
+        self.scheduler.prepare(measures[:1], self.score, startTime=0,
+                               loopCount=None)
+        self.scheduler.pump(0)
+        self.score.getMeasureByIndex(0).newBpm = 60
+        self.scheduler.updateTiming(self.score)
+        self.output.clear()
+        self.scheduler.pump(1750)
+        self.assertEqual([event[1] for event in self.output.events],
+                         [2000, 3000])
+
+    def testThread(self):
+        times = iter(xrange(0, 100000, 500))
+        done = threading.Event()
+        scheduler = MidiPlayback.MidiScheduler(self.output,
+                                               lambda: next(times),
+                                               interval=0)
+        scheduler.finishedCallback = done.set
+        scheduler.start(self.score.iterMeasuresWithRepeats(), self.score)
+        done.wait(5)
+        self.assertTrue(done.is_set())
+        scheduler.stop()
+        self.assertEqual(len(self.output.events), 6)
+
+    def testThreadError(self):
+        def write(events):
+            raise DBErrors.BadTimeError()
+        self.output.write = write
+        done = threading.Event()
+        scheduler = MidiPlayback.MidiScheduler(self.output, lambda: 0,
+                                               interval=0)
+        scheduler.measureCallback = (lambda index, nextIndex:
+                                     self.highlights.append((index,
+                                                             nextIndex)))
+        scheduler.finishedCallback = done.set
+        stderr = sys.stderr
+        sys.stderr = StringIO()
+        try:
+            scheduler.start(self.score.iterMeasuresWithRepeats(),
+                            self.score)
+            done.wait(5)
+            logged = sys.stderr.getvalue()
+        finally:
+            sys.stderr = stderr
+        self.assertTrue(done.is_set())
+        self.assertIn("BadTimeError", logged)
+        self.assertFalse(scheduler.isPlaying())
+        self.assertEqual(self.highlights[-1], (-1, -1))
+        scheduler.stop()
+
+    def testStop(self):
+        scheduler = MidiPlayback.MidiScheduler(self.output, lambda: 0,
+                                               interval=0.001)
+        scheduler.start(self.score.iterMeasuresWithRepeats(), self.score)
+        self.assertTrue(scheduler.isPlaying())
+        scheduler.stop()
+        self.assertFalse(scheduler.isPlaying())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -126,6 +126,21 @@ class TestNotePosition(unittest.TestCase):
         self.assertEqual(repr(NotePosition(0, 0, 0, 0)),
                          "NotePosition(0, 0, 0, 0)")
 
+    def testMakeCopy(self):
+        np = NotePosition(1, 2, 3, 4)
+        copied = np.makeCopy()
+        self.assertEqual(copied, np)
+        copied.noteTime = 5
+        self.assertEqual(np.noteTime, 3)
+        np.drumIndex = None
+        self.assertEqual(repr(np.makeCopy()),
+                         "NotePosition(1, 2, 3, None)")
+
+    def testNoInstanceDict(self):
+        np = NotePosition(1, 2, 3, 4)
+        self.assertFalse(hasattr(np, "__dict__"))
+        self.assertRaises(AttributeError, setattr, np, "noteTim", 5)
+
     def testMakeMeasurePosition(self):
         np = NotePosition(1, 2, 3, 4).makeMeasurePosition()
         self.assertEqual(np.drumIndex, None)
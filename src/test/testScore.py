@@ -23,7 +23,8 @@ Created on 12 Dec 2010
 '''
 import unittest
 from Data.Score import Score
-from Data import DrumKit, Drum, DrumKitFactory
+from Data.Measure import Measure
+from Data import DrumKit, Drum, DrumKitFactory, MeasureCount
 from Data.DBErrors import BadTimeError, OverSizeMeasure, InconsistentRepeats
 from Data.DBConstants import EMPTY_NOTE
 from Data.NotePosition import NotePosition
@@ -519,6 +520,248 @@ class TestFormatScore(unittest.TestCase):
                           for i in xrange(7, 0, -1)])
 
 
+class TestMeasureIndex(unittest.TestCase):
+    def setUp(self):
+        self.score = Score()
+        for dummy in range(0, 30):
+            self.score.insertMeasureByIndex(16)
+        self.score.formatScore(80)
+
+    def _checkIndex(self):
+        index = 0
+        for staffIndex, staff in enumerate(self.score.iterStaffs()):
+            for measureIndex in range(staff.numMeasures()):
+                position = NotePosition(staffIndex=staffIndex,
+                                        measureIndex=measureIndex)
+                self.assertEqual(self.score.measurePositionToIndex(position),
+                                 index)
+                other = self.score.measureIndexToPosition(index)
+                self.assertEqual((other.staffIndex, other.measureIndex),
+                                 (staffIndex, measureIndex))
+                self.assert_(self.score.getMeasureByIndex(index)
+                             is staff[measureIndex])
+                index += 1
+        self.assertEqual(self.score.numMeasures(), index)
+        self.assertRaises(BadTimeError,
+                          self.score.measureIndexToPosition, index)
+        self.assertRaises(BadTimeError, self.score.getMeasureByIndex, index)
+
+    def testFormatted(self):
+        self._checkIndex()
+
+    def testInsert(self):
+        self.score.insertMeasureByIndex(16, 9)
+        self._checkIndex()
+        self.score.insertMeasureByPosition(16, NotePosition(staffIndex=2,
+                                                            measureIndex=0))
+        self._checkIndex()
+
+    def testDelete(self):
+        self.score.deleteMeasureByIndex(13)
+        self._checkIndex()
+        self.score.deleteMeasuresAtPosition(NotePosition(staffIndex=1,
+                                                         measureIndex=1), 5)
+        self._checkIndex()
+
+    def testEmptyStaff(self):
+        for dummy in range(4):
+            self.score.deleteMeasureByIndex(4)
+        self.assertEqual(self.score.getStaffByIndex(1).numMeasures(), 0)
+        self._checkIndex()
+        self.score.formatScore(80)
+        self._checkIndex()
+
+
+class TestTempoMap(unittest.TestCase):
+    def setUp(self):
+        self.score = Score()
+        for dummy in range(0, 20):
+            self.score.insertMeasureByIndex(16)
+        self.score.scoreData.bpm = 100
+        self.score.getMeasureByIndex(5).newBpm = 140
+        self.score.getMeasureByIndex(12).newBpm = 90
+        self.score.formatScore(80)
+
+    def _slowBpm(self, index):
+        bpm = self.score.scoreData.bpm
+        for measureIndex in range(index + 1):
+            measure = self.score.getReferredMeasure(measureIndex)
+            if measure.newBpm != 0:
+                bpm = measure.newBpm
+        return bpm
+
+    def _checkTempos(self):
+        for index in range(self.score.numMeasures()):
+            self.assertEqual(self.score.bpmAtMeasureByIndex(index),
+                             self._slowBpm(index))
+
+    def testTempos(self):
+        self.assertEqual(self.score.bpmAtMeasureByIndex(0), 100)
+        self.assertEqual(self.score.bpmAtMeasureByIndex(4), 100)
+        self.assertEqual(self.score.bpmAtMeasureByIndex(5), 140)
+        self.assertEqual(self.score.bpmAtMeasureByIndex(11), 140)
+        self.assertEqual(self.score.bpmAtMeasureByIndex(19), 90)
+        self._checkTempos()
+
+    def testByPosition(self):
+        position = self.score.measureIndexToPosition(7)
+        self.assertEqual(self.score.bpmAtMeasureByPosition(position), 140)
+
+    def testChangeScoreBpm(self):
+        self.score.bpmAtMeasureByIndex(0)
+        self.score.scoreData.bpm = 80
+        self.assertEqual(self.score.bpmAtMeasureByIndex(0), 80)
+        self.assertEqual(self.score.bpmAtMeasureByIndex(6), 140)
+
+    def testChangeMeasureBpm(self):
+        self.score.bpmAtMeasureByIndex(0)
+        self.score.getMeasureByIndex(5).newBpm = 0
+        self.assertEqual(self.score.bpmAtMeasureByIndex(6), 100)
+        self.score.getMeasureByIndex(2).newBpm = 120
+        self._checkTempos()
+
+    def testSimile(self):
+        self.score.bpmAtMeasureByIndex(0)
+        self.score.getMeasureByIndex(14).simileDistance = 9
+        self.assertEqual(self.score.bpmAtMeasureByIndex(14), 140)
+        self.assertEqual(self.score.bpmAtMeasureByIndex(15), 140)
+        self.score.getMeasureByIndex(16).simileDistance = 30
+        self._checkTempos()
+
+    def testInsertAndDelete(self):
+        self.score.bpmAtMeasureByIndex(0)
+        self.score.deleteMeasureByIndex(5)
+        self.assertEqual(self.score.bpmAtMeasureByIndex(5), 100)
+        self._checkTempos()
+        self.score.insertMeasureByIndex(16, 0)
+        self._checkTempos()
+
+    def testOtherScoresKeepMap(self):
+        tempoMap = self.score._getTempoMap()
+        other = Score()
+        other.insertMeasureByIndex(16)
+        other.getMeasureByIndex(0).newBpm = 60
+        clipboard = self.score.getMeasureByIndex(3).copyMeasure()
+        clipboard.newBpm = 200
+        Measure(16).simileDistance = 1
+        self.assert_(self.score._getTempoMap() is tempoMap)
+        self.assertEqual(self.score.bpmAtMeasureByIndex(3), 100)
+        self.score.getMeasureByIndex(3).newBpm = 110
+        self.assert_(self.score._getTempoMap() is not tempoMap)
+        self._checkTempos()
+
+
+class TestIncrementalFormat(unittest.TestCase):
+    def setUp(self):
+        self.score = Score()
+        counter = MeasureCount.counterMaker(4, 16)
+        for index in range(0, 200):
+            measure = self.score.insertMeasureByIndex(16, counter=counter)
+            measure.setLineBreak(index % 10 == 9)
+        self.score.formatScore(80)
+
+    def _layout(self):
+        return [list(staff) for staff in self.score.iterStaffs()]
+
+    def _checkLayout(self):
+        incremental = self._layout()
+        self.score._layout = None
+        self.score.formatScore(80)
+        self.assertEqual(incremental, self._layout())
+        for staffIndex, staff in enumerate(self.score.iterStaffs()):
+            for measureIndex, measure in enumerate(staff):
+                self.assert_(self.score.getMeasureByIndex(
+                    self.score.measurePositionToIndex(
+                        NotePosition(staffIndex, measureIndex))) is measure)
+
+    def testUnchanged(self):
+        self.score.formatScore(80)
+        first, oldEnd, newEnd = self.score.changedStaffRange()
+        self.assertEqual(oldEnd, first)
+        self.assertEqual(newEnd, first)
+
+    def testInsertMeasure(self):
+        self.score.insertMeasureByIndex(16, 101)
+        self.score.formatScore(80)
+        first, oldEnd, newEnd = self.score.changedStaffRange()
+        self.assert_(newEnd - first < 5)
+        self.assertEqual(oldEnd, newEnd)
+        self._checkLayout()
+
+    def testDeleteMeasure(self):
+        self.score.deleteMeasureByIndex(17)
+        self.score.formatScore(80)
+        first, dummyOldEnd, newEnd = self.score.changedStaffRange()
+        self.assert_(newEnd - first < 5)
+        self._checkLayout()
+
+    def testLineBreak(self):
+        self.score.getMeasureByIndex(44).setLineBreak(True)
+        self.score.formatScore(80)
+        first, oldEnd, newEnd = self.score.changedStaffRange()
+        self.assertEqual(newEnd, oldEnd + 1)
+        self.assert_(newEnd - first < 5)
+        self._checkLayout()
+        self.score.getMeasureByIndex(44).setLineBreak(False)
+        self.score.formatScore(80)
+        first, oldEnd, newEnd = self.score.changedStaffRange()
+        self.assertEqual(newEnd, oldEnd - 1)
+        self._checkLayout()
+
+    def testWiderMeasure(self):
+        self.score.getMeasureByIndex(80).setBeatCount(
+            MeasureCount.counterMaker(4, 24))
+        self.score.formatScore(80)
+        self._checkLayout()
+
+    def testAppendAndDeleteLast(self):
+        self.score.getMeasureByIndex(199).setLineBreak(True)
+        self.score.formatScore(80)
+        self.score.insertMeasureByIndex(16)
+        self.score.formatScore(80)
+        self._checkLayout()
+        self.assertEqual(self.score.getStaffByIndex(-1).numMeasures(), 1)
+        self.score.deleteMeasureByIndex(200)
+        self.score.formatScore(80)
+        self._checkLayout()
+
+    def testSimile(self):
+        self.score.getMeasureByIndex(51).simileDistance = 1
+        self.score.getMeasureByIndex(52).simileDistance = 1
+        self.score.formatScore(80)
+        self._checkLayout()
+        self.score.getMeasureByIndex(50).setBeatCount(
+            MeasureCount.counterMaker(4, 48))
+        self.score.formatScore(80)
+        self._checkLayout()
+
+    def _staffHolding(self, measureIndex):
+        return self.score.getStaffByIndex(
+            self.score.measureIndexToPosition(measureIndex).staffIndex)
+
+    def testChangedStaffs(self):
+        self.score.popChangedStaffs()
+        self.score.getMeasureByIndex(45).setRepeatStart(True)
+        self.score.getMeasureByIndex(46).aboveText = "R"
+        self.score.getMeasureByIndex(120).alternateText = "1."
+        self.score.formatScore(80)
+        first, oldEnd, newEnd = self.score.changedStaffRange()
+        self.assertEqual(oldEnd, first)
+        self.assertEqual(newEnd, first)
+        self.assertEqual(self.score.popChangedStaffs(),
+                         set([self._staffHolding(45),
+                              self._staffHolding(120)]))
+        self.assertEqual(self.score.popChangedStaffs(), set())
+
+    def testNewWidth(self):
+        self.score.formatScore(100)
+        self.assertEqual(self.score.changedStaffRange()[0], 0)
+        incremental = self._layout()
+        self.score._layout = None
+        self.score.formatScore(100)
+        self.assertEqual(incremental, self._layout())
+
+
 class TestCopyPaste(unittest.TestCase):
     def setUp(self):
         self.score = Score()
@@ -1127,7 +1370,90 @@ class TestHash(unittest.TestCase):
     def testEmpty(self):
         hashVal = self.score.hashScore()
         self.assertEqual(hashVal.encode("hex"),
-                         "95b319c82f934d9abfce950b58a7c3bd")
+                         "a625beaa962400ed136988794a815c51")
+
+    def testNoteChangesHash(self):
+        hashVal = self.score.hashScore()
+        np = NotePosition(0, 3, 5, 1)
+        self.score.addNote(np, "x")
+        self.assertNotEqual(self.score.hashScore(), hashVal)
+        self.score.deleteNote(np)
+        self.assertEqual(self.score.hashScore(), hashVal)
+
+    def testDecorationChangesHash(self):
+        hashVal = self.score.hashScore()
+        measure = self.score.getMeasureByIndex(7)
+        measure.newBpm = 140
+        self.assertNotEqual(self.score.hashScore(), hashVal)
+        measure.newBpm = 0
+        self.assertEqual(self.score.hashScore(), hashVal)
+        measure.setRepeatStart(True)
+        self.assertNotEqual(self.score.hashScore(), hashVal)
+        measure.setRepeatStart(False)
+        self.assertEqual(self.score.hashScore(), hashVal)
+        measure.alternateText = "1."
+        self.assertNotEqual(self.score.hashScore(), hashVal)
+
+    def testInsertChangesHash(self):
+        hashVal = self.score.hashScore()
+        self.score.insertMeasureByIndex(16, 4)
+        self.assertNotEqual(self.score.hashScore(), hashVal)
+        self.score.deleteMeasureByIndex(4)
+        self.assertEqual(self.score.hashScore(), hashVal)
+
+    def testMetadataChangesHash(self):
+        hashVal = self.score.hashScore()
+        self.score.scoreData.title = "New title"
+        self.assertNotEqual(self.score.hashScore(), hashVal)
+
+    def testIncrementalMatchesFresh(self):
+        self.score.hashScore()
+        for index in (0, 5, 15):
+            np = self.score.measureIndexToPosition(index)
+            np.noteTime = 2
+            np.drumIndex = 3
+            self.score.addNote(np, "o")
+        incremental = self.score.hashScore()
+        self.score._digestTree = None
+        self.assertEqual(self.score.hashScore(), incremental)
+
+    def _checkIncremental(self):
+        tree = self.score._digestTree
+        incremental = self.score.hashScore()
+        self.assert_(self.score._digestTree is tree)
+        self.score._digestTree = None
+        self.assertEqual(self.score.hashScore(), incremental)
+
+    def testInsertAndDeleteIncremental(self):
+        self.score.hashScore()
+        for index in (0, 7, 17):
+            measure = self.score.insertMeasureByIndex(8, index)
+            measure.addNote(NotePosition(noteTime=1, drumIndex=2), "x")
+        self._checkIncremental()
+        self.score.deleteMeasureByIndex(7)
+        self.score.deleteMeasureByIndex(0)
+        self.score.getMeasureByIndex(3).setRepeatEnd(True)
+        self._checkIncremental()
+        self.score.deleteMeasuresAtPosition(NotePosition(0, 2), 3)
+        self._checkIncremental()
+
+    def testDeleteStaffIncremental(self):
+        self.score.formatScore(80)
+        self.score.setSectionEnd(NotePosition(0, 1), True)
+        self.score.formatScore(80)
+        self.score.hashScore()
+        self.score.deleteSection(NotePosition(0))
+        self.assertEqual(self.score.numMeasures(), 14)
+        self._checkIncremental()
+
+    def testAppendMeasuresIncremental(self):
+        self.score.hashScore()
+        measures = [Measure(8) for dummy in range(0, 3)]
+        measures[1].addNote(NotePosition(noteTime=1, drumIndex=2), "x")
+        self.score.appendMeasures(measures)
+        self.assertEqual(self.score.numMeasures(), 19)
+        self.assert_(self.score.getMeasureByIndex(17) is measures[1])
+        self._checkIncremental()
 
 
 if __name__ == "__main__":
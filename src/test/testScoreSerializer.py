@@ -33,6 +33,7 @@ from Data.ScoreFactory import ScoreFactory
 from Data import DBConstants
 from Data import DBErrors
 from Data import fileUtils
+from Data.NotePosition import NotePosition
 
 
 def StringIO(*args, **kwargs):  # IGNORE:invalid-name
@@ -304,8 +305,30 @@ class TestScoreSerializerV0(unittest.TestCase):
     class NoNoteheads(RuntimeError):
         pass
 
+    @staticmethod
+    def _noteKey(line):
+        noteTime, drumIndex = line.split()[1].split(",")[:2]
+        return int(noteTime), int(drumIndex)
+
+    @classmethod
+    def _sortNotes(cls, lines):
+        # Notes at the same time may be stored in any drum order.
+        lines = list(lines)
+        index = 0
+        while index < len(lines):
+            if not lines[index].lstrip().startswith("NOTE "):
+                index += 1
+                continue
+            end = index
+            while end < len(lines) and lines[end].lstrip().startswith("NOTE "):
+                end += 1
+            lines[index:end] = sorted(lines[index:end], key=cls._noteKey)
+            index = end
+        return lines
+
     def _compareData(self, data, written):
-        for line1, line2 in zip(data, written):
+        for line1, line2 in zip(self._sortNotes(data),
+                                self._sortNotes(written)):
             try:
                 self.assertEqual(line1, line2)
             except AssertionError:
@@ -414,6 +437,75 @@ class TestScoreSerializerV1(unittest.TestCase):
             self.assertEqual(score.hashScore(), score2.hashScore())
 
 
+class TestScoreSerializerV3(unittest.TestCase):
+    @staticmethod
+    def _textVersion(score):
+        written = StringIO()
+        ScoreSerializer.write(score, written, DBConstants.DBFF_2)
+        return written.getvalue()
+
+    def testReadV1WriteV3(self):
+        print "Read Version 1, Write Version 3"
+        fileglob = os.path.join("testdata", "v1", "*.brp")
+        for testfile in glob.glob(fileglob):
+            print testfile
+            score = ScoreSerializer.loadScore(testfile)
+            written = cStringIO.StringIO()
+            ScoreSerializer.write(score, written, DBConstants.DBFF_3)
+            score2 = ScoreSerializer.readBinary(written.getvalue())
+            self.assertEqual(score2.fileFormat, DBConstants.DBFF_3)
+            self.assertEqual(score.hashScore(), score2.hashScore())
+            self.assertEqual(self._textVersion(score),
+                             self._textVersion(score2))
+
+    def testSharedCounts(self):
+        filename = os.path.join("testdata", "v1", "Basket Case.brp")
+        score = ScoreSerializer.loadScore(filename)
+        written = cStringIO.StringIO()
+        ScoreSerializer.write(score, written, DBConstants.DBFF_3)
+        score2 = ScoreSerializer.readBinary(written.getvalue())
+        for loaded in (score, score2):
+            counts = dict((measure.counter.signature(), measure.counter)
+                          for measure in loaded.iterMeasures())
+            self.assert_(all(measure.counter is
+                             counts[measure.counter.signature()]
+                             for measure in loaded.iterMeasures()))
+            self.assert_(loaded.defaultCount.isInterned())
+
+    def testSaveAndLoad(self):
+        tmp = tempfile.NamedTemporaryFile(suffix=".brp",
+                                          prefix="binary_test_v3",
+                                          delete=False)
+        try:
+            tmp.close()
+            score = ScoreFactory.makeEmptyScore(8)
+            score.scoreData.title = u"\u20b9"
+            measure = score.getMeasureByIndex(2)
+            measure.addNote(NotePosition(noteTime=3, drumIndex=1), "o")
+            measure.setRepeatEnd(True)
+            measure.repeatCount = 4
+            ScoreSerializer.saveScore(score, tmp.name, DBConstants.DBFF_3)
+            score2 = ScoreSerializer.loadScore(tmp.name)
+            self.assertEqual(score2.fileFormat, DBConstants.DBFF_3)
+            self.assertEqual(score.hashScore(), score2.hashScore())
+            self.assertEqual(score2.scoreData.title, u"\u20b9")
+        finally:
+            os.unlink(tmp.name)
+
+    def testTruncated(self):
+        score = ScoreFactory.makeEmptyScore(8)
+        written = cStringIO.StringIO()
+        ScoreSerializer.write(score, written, DBConstants.DBFF_3)
+        data = written.getvalue()[:-10]
+        self.assertRaises(DBErrors.TruncatedBinaryScore,
+                          ScoreSerializer.readBinary, data)
+
+    def testTextVersion3(self):
+        handle = StringIO("DB_FILE_FORMAT 3\n")
+        self.assertRaises(DBErrors.DBVersionError,
+                          ScoreSerializer.read, handle)
+
+
 class TestUnicode(unittest.TestCase):
     def testWriteUnicode(self):
         tmp = tempfile.NamedTemporaryFile(suffix=".brp",
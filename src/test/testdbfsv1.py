@@ -375,6 +375,47 @@ class TestReadMeasure(unittest.TestCase):
         self.assertFalse(measure.showBelow)
         self.assertEqual(measure.belowText, "        ")
 
+    def testReadBatchedNotes(self):
+        data = """START_MEASURE
+                  START_MEASURE_COUNT
+                    BEAT_START
+                      NUM_TICKS 2
+                      COUNT |^+|
+                    BEAT_END
+                  END_MEASURE_COUNT
+                  STARTBARLINE 1
+                  NOTE 0,1,o
+                  NOTE 0,2,x
+                  NOTE 1,2,O
+                  ENDBARLINE 1
+                END_MEASURE"""
+        handle = StringIO(data)
+        structure = dbfsv1.MeasureStructureV1()
+        self.assertEqual(structure.batchTypes, frozenset(["NOTE"]))
+        iterator = fileUtils.dbFileIterator(handle, structure.batchTypes)
+        measure = structure.read(iterator)
+        self.assertEqual(len(measure), 2)
+        self.assertEqual(measure.numNotes(), 3)
+        self.assertEqual(measure.noteAt(0, 1), "o")
+        self.assertEqual(measure.noteAt(0, 2), "x")
+        self.assertEqual(measure.noteAt(1, 2), "O")
+
+    def testReadBadNote(self):
+        data = """START_MEASURE
+                  START_MEASURE_COUNT
+                    BEAT_START
+                      NUM_TICKS 2
+                      COUNT |^+|
+                    BEAT_END
+                  END_MEASURE_COUNT
+                  NOTE 0,1,o
+                  NOTE 0,x,o
+                END_MEASURE"""
+        handle = StringIO(data)
+        structure = dbfsv1.MeasureStructureV1()
+        iterator = fileUtils.dbFileIterator(handle, structure.batchTypes)
+        self.assertRaises(DBErrors.BadNote, structure.read, iterator)
+
     def testReadRepeatBar(self):
         data = """START_MEASURE
                     START_MEASURE_COUNT